@@ -9,6 +9,7 @@ from auth_backend.routes.groups import create_group_logic, delete_group_id, patc
 from auth_backend.routes.scopes import create_scope_logic
 from auth_backend.routes.user import patch_user_groups
 from auth_backend.schemas.models import GroupPatch, GroupPost, ScopePost
+from auth_backend.utils.session_cache import get_session_cache
 
 
 class ScopeAdmin(ModelView, model=Scope):
@@ -46,12 +47,14 @@ class ScopeAdmin(ModelView, model=Scope):
             scope_data = {k: v for k, v in data.items() if v is not None}
             obj = Scope.update(int(pk), **scope_data, session=session)
             session.commit()
+            get_session_cache().clear()
             return obj
 
     async def delete_model(self, request, pk):
         with self.session_maker(expire_on_commit=False) as session:
             Scope.delete(session=session, id=int(pk))
             session.commit()
+            get_session_cache().clear()
 
 
 class GroupAdmin(ModelView, model=Group):
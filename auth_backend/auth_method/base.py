@@ -3,12 +3,14 @@ from __future__ import annotations
 import logging
 import re
 from abc import ABCMeta
-from asyncio import gather
 from typing import Any, Iterable
 
 from fastapi import APIRouter
+from sqlalchemy import not_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session as DbSession
 
+from auth_backend.auth_method.user_update import schedule_user_update
 from auth_backend.models.db import AuthMethod, User, UserSession
 from auth_backend.settings import get_settings
 
@@ -63,6 +65,8 @@ class AuthPluginMeta(metaclass=ABCMeta):
     async def user_updated(
         new_user: dict[str, Any] | None,
         old_user: dict[str, Any] | None = None,
+        *,
+        session: DbSession | AsyncSession,
     ):
         """Сообщить всем активированным провайдерам авторизации об обновлении пользователя
 
@@ -101,16 +105,20 @@ class AuthPluginMeta(metaclass=ABCMeta):
             "email": {"hashed_password": "tihsmodnaremos", "salt": "abracadabra", "password": "plain_password"}
         }
         ```
+
+        Событие пишется в `user_update_queue` в транзакции `session` и вызывается только после ее
+        коммита, поэтому функцию нужно вызывать до коммита изменений пользователя. Методы вызываются
+        параллельно, каждый не дольше `USER_UPDATE_TIMEOUT_SECONDS`. Упавшие и не успевшие обновления
+        повторяет воркер `user_update worker`.
         """
-        exceptions = await gather(
-            *[m.on_user_update(new_user, old_user) for m in AuthPluginMeta.active_auth_methods()],
-            return_exceptions=True,
-        )
-        exceptions = [exc for exc in exceptions if exc]
-        if len(exceptions) > 0:
-            logger.error("Following errors occurred during on_user_update: ")
-            for exc in exceptions:
-                logger.error(exc, exc_info=exc)
+        # Методы без своего on_user_update ничего не делают, их не ждем
+        methods = [
+            m
+            for m in AuthPluginMeta.active_auth_methods()
+            if getattr(m.on_user_update, "__func__", None) is not AuthPluginMeta.on_user_update.__func__
+        ]
+        if methods:
+            await schedule_user_update(session, methods, new_user, old_user)
 
     @classmethod
     async def on_user_update(cls, new_user: dict[str, Any], old_user: dict[str, Any] | None = None):
@@ -166,3 +174,20 @@ class AuthPluginMeta(metaclass=ABCMeta):
         for method in methods:
             retval[method.param] = method
         return retval
+
+    @classmethod
+    async def get_auth_method_params_async(
+        cls,
+        user_id: int,
+        *,
+        session: AsyncSession,
+    ) -> dict[str, AuthMethod]:
+        """То же, что `get_auth_method_params`, но через асинхронную сессию"""
+        methods = await session.scalars(
+            select(AuthMethod).where(
+                AuthMethod.user_id == user_id,
+                AuthMethod.auth_method == cls.get_name(),
+                not_(AuthMethod.is_deleted),
+            )
+        )
+        return {method.param: method for method in methods}
@@ -1,11 +1,12 @@
 from abc import ABCMeta, abstractmethod
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session as DbSession
 
 from auth_backend.auth_method.session import Session
 from auth_backend.models.db import User
 from auth_backend.schemas.types.scopes import Scope as TypeScope
-from auth_backend.utils.user_session_control import create_session
+from auth_backend.utils.user_session_control import create_session, create_session_in_transaction
 
 from .base import AuthPluginMeta
 from .session import Session
@@ -55,9 +56,20 @@ class LoginableMixin(AuthPluginMeta, metaclass=ABCMeta):
         scopes_list_names: list[TypeScope] | None,
         session_name: str | None = None,
         *,
-        db_session: DbSession,
+        db_session: DbSession | AsyncSession,
     ) -> Session:
-        """Создает сессию пользователя"""
-        return await create_session(
-            user, scopes_list_names, db_session=db_session, session_name=session_name, is_unbounded=True
+        """Создает сессию пользователя
+
+        Для плагинов на синхронной сессии сессия создается в той же транзакции, что и пользователь,
+        его методы входа и событие входа: все фиксируется одним коммитом или откатывается
+        """
+        user_id = user.id
+        if isinstance(db_session, AsyncSession):
+            return await create_session(
+                user_id, scopes_list_names, db_session=db_session, session_name=session_name, is_unbounded=True
+            )
+        session = create_session_in_transaction(
+            user_id, scopes_list_names, db_session=db_session, session_name=session_name, is_unbounded=True
         )
+        db_session.commit()
+        return session
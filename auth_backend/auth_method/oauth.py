@@ -49,7 +49,8 @@ class OauthMeta(UserdataMixin, LoginableMixin, RegistrableMixin, AuthPluginMeta)
         new_user = {"user_id": user_session.user.id}
         old_user_params = await cls._delete_auth_methods(user_session.user, db_session=db.session)
         old_user[cls.get_name()] = old_user_params
-        await AuthPluginMeta.user_updated(new_user, old_user)
+        await AuthPluginMeta.user_updated(new_user, old_user, session=db.session)
+        db.session.commit()
         return None
 
     @classmethod
@@ -95,5 +96,4 @@ class OauthMeta(UserdataMixin, LoginableMixin, RegistrableMixin, AuthPluginMeta)
         for method in auth_methods:
             method.is_deleted = True
         db_session.flush()
-        db_session.commit()
         return {m.param: m.value for m in auth_methods}
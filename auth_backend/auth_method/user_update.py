@@ -0,0 +1,303 @@
+import asyncio
+import base64
+import datetime
+import hashlib
+import json
+import logging
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Iterable
+
+from cryptography.fernet import Fernet
+from fastapi_sqlalchemy import db
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, sessionmaker
+
+from auth_backend.models.db import UserUpdateQueue
+from auth_backend.settings import get_settings
+from auth_backend.utils.http import get_http_clients
+from auth_backend.utils.metrics import get_metrics
+
+if TYPE_CHECKING:
+    from auth_backend.auth_method.base import AuthPluginMeta
+
+logger = logging.getLogger(__name__)
+
+# Задержка доходит до часов, бакеты шире стандартных
+LAG_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600, 21600)
+
+# Строки, которые запрос отправит сам после коммита своей транзакции, лежат в `Session.info`
+DELIVERIES_KEY = "user_update_deliveries"
+
+# Отправки после коммитов, идущие в этом процессе
+_deliveries: set[asyncio.Task] = set()
+
+
+@lru_cache
+def get_fernet() -> Fernet:
+    key = hashlib.sha256(get_settings().ENCRYPTION_KEY.encode()).digest()
+    return Fernet(base64.urlsafe_b64encode(key))
+
+
+def dump_payload(new_user: dict[str, Any] | None, old_user: dict[str, Any] | None) -> str:
+    data = json.dumps({"new_user": new_user, "old_user": old_user}, default=str)
+    return get_fernet().encrypt(data.encode()).decode()
+
+
+def load_payload(payload: str) -> tuple[dict[str, Any] | None, dict[str, Any] | None]:
+    data = json.loads(get_fernet().decrypt(payload.encode()))
+    return data["new_user"], data["old_user"]
+
+
+def user_update_backoff(attempts: int) -> datetime.timedelta:
+    """Задержка перед повтором после `attempts` неудачных попыток, удваивается до максимума"""
+    settings = get_settings()
+    seconds = settings.USER_UPDATE_QUEUE_BACKOFF_SECONDS * 2 ** max(attempts - 1, 0)
+    return datetime.timedelta(seconds=min(seconds, settings.USER_UPDATE_QUEUE_MAX_BACKOFF_SECONDS))
+
+
+def merge_user_update(pending: dict[str, Any] | None, new_user: dict[str, Any] | None) -> dict[str, Any] | None:
+    """Сливает новое событие с ожидающим: параметры методов входа дополняются, новые значения главнее
+
+    Так пароль из ожидающей смены не теряется, если следом пришло событие без пароля
+    """
+    if new_user is None or pending is None:
+        # Удаление пользователя перекрывает все, после удаления событий быть не должно
+        return new_user
+    merged = dict(pending)
+    for key, value in new_user.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = {**merged[key], **value}
+        else:
+            merged[key] = value
+    return merged
+
+
+def _has_running_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _snapshot(row: UserUpdateQueue) -> UserUpdateQueue:
+    """Копия строки вне сессии: после коммита запроса ее поля нужны для отправки и записи результата"""
+    return UserUpdateQueue(
+        id=row.id,
+        user_id=row.user_id,
+        auth_method=row.auth_method,
+        payload=row.payload,
+        attempts=row.attempts,
+        version=row.version,
+        create_ts=row.create_ts,
+    )
+
+
+def _enqueue(
+    session: Session,
+    user_id: int,
+    auth_method: str,
+    new_user: dict[str, Any] | None,
+    old_user: dict[str, Any] | None,
+    lease: datetime.timedelta | None = None,
+) -> UserUpdateQueue | None:
+    """Ставит событие в очередь в транзакции `session`, с ожидающим событием того же пользователя и метода оно сливается
+
+    `old_user` остается от ожидающего события: внешний сервис еще не видел изменений после него.
+    С `lease` строка, которую сейчас никто не отправляет, берется в аренду и возвращается для отправки
+    """
+    now = datetime.datetime.utcnow()
+    locked_until = now + lease if lease else None
+    while True:
+        row = session.scalar(
+            UserUpdateQueue.insert_query(user_id, auth_method, dump_payload(new_user, old_user), locked_until)
+        )
+        if row is not None:
+            return row if lease else None
+        row = session.scalar(UserUpdateQueue.pending_query(user_id, auth_method))
+        if row is not None:
+            pending_new, pending_old = load_payload(row.payload)
+            row.requeue(dump_payload(merge_user_update(pending_new, new_user), pending_old))
+            if not lease or (row.locked_until is not None and row.locked_until > now):
+                # Строку отправляет воркер или другой запрос: по новой версии он повторит ее сразу
+                return None
+            row.locked_until = locked_until
+            return row
+        # Воркер успел удалить строку между вставкой и чтением, пробуем вставить снова
+
+
+async def enqueue_user_update(
+    session: AsyncSession,
+    user_id: int,
+    auth_method: str,
+    new_user: dict[str, Any] | None,
+    old_user: dict[str, Any] | None,
+) -> None:
+    """Ставит событие в очередь для воркера, см. `_enqueue`"""
+    await session.run_sync(lambda sync_session: _enqueue(sync_session, user_id, auth_method, new_user, old_user))
+
+
+def _schedule(
+    session: Session,
+    methods: Iterable[type['AuthPluginMeta']],
+    new_user: dict[str, Any] | None,
+    old_user: dict[str, Any] | None,
+) -> None:
+    user_id = (new_user or old_user or {}).get("user_id")
+    if user_id is None:
+        logger.error("User update without user_id is not propagated")
+        return
+    # Отправить сразу после коммита можно только из event loop, иначе событие отправит воркер
+    lease = None
+    if _has_running_loop():
+        lease = datetime.timedelta(seconds=get_settings().USER_UPDATE_QUEUE_LEASE_SECONDS)
+    deliveries = session.info.setdefault(DELIVERIES_KEY, [])
+    for method in methods:
+        row = _enqueue(session, user_id, method.get_name(), new_user, old_user, lease)
+        if row is not None:
+            deliveries.append((_snapshot(row), method))
+
+
+async def schedule_user_update(
+    session: Session | AsyncSession,
+    methods: Iterable[type['AuthPluginMeta']],
+    new_user: dict[str, Any] | None,
+    old_user: dict[str, Any] | None,
+) -> None:
+    """Ставит событие в `user_update_queue` в транзакции `session` и отправляет его после коммита
+
+    Событие фиксируется или откатывается вместе с изменениями запроса. Внешние сервисы вызываются
+    только после коммита, без блокировок и соединения запроса, запрос их не ждет.
+    Неудачные попытки повторяет `user_update worker`
+    """
+    methods = list(methods)
+    if isinstance(session, AsyncSession):
+        await session.run_sync(lambda sync_session: _schedule(sync_session, methods, new_user, old_user))
+    else:
+        _schedule(session, methods, new_user, old_user)
+
+
+@event.listens_for(Session, "after_commit")
+def _deliver_after_commit(session: Session) -> None:
+    deliveries = session.info.pop(DELIVERIES_KEY, None)
+    if not deliveries:
+        return
+    try:
+        task = asyncio.get_running_loop().create_task(_deliver(deliveries))
+    except RuntimeError:
+        # Коммит вне event loop: строки отправит воркер, когда истечет аренда
+        logger.warning("User update committed outside of event loop, left for worker")
+        return
+    _deliveries.add(task)
+    task.add_done_callback(_deliveries.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_deliveries(session: Session) -> None:
+    session.info.pop(DELIVERIES_KEY, None)
+
+
+async def _deliver(deliveries: list[tuple[UserUpdateQueue, type['AuthPluginMeta']]]) -> None:
+    rows = [row for row, _ in deliveries]
+    methods = {method.get_name(): method for _, method in deliveries}
+    results = await _attempt(rows, methods)
+    try:
+        with db(commit_on_exit=True):
+            _record_results(rows, results, session=db.session)
+    except Exception:
+        logger.exception("Failed to record user update results, worker will retry after lease")
+        return
+    failed = [row.auth_method for row, result in zip(rows, results) if isinstance(result, Exception)]
+    if failed:
+        get_metrics().inc("user_update_queued_total", len(failed))
+        logger.info(f"User {rows[0].user_id} update queued for {', '.join(failed)}")
+
+
+async def wait_user_updates() -> None:
+    """Дожидается отправок, начатых после коммитов запросов"""
+    if _deliveries:
+        await asyncio.gather(*_deliveries, return_exceptions=True)
+
+
+async def _call(method: type['AuthPluginMeta'], new_user, old_user, timeout: float) -> None:
+    try:
+        await asyncio.wait_for(method.on_user_update(new_user, old_user), timeout)
+    except asyncio.TimeoutError:
+        get_metrics().inc("user_update_timeouts_total")
+        raise
+
+
+async def _retry(row: UserUpdateQueue, methods: dict[str, type['AuthPluginMeta']], timeout: float) -> None:
+    method = methods.get(row.auth_method)
+    if method is None:
+        raise LookupError(f"Auth method {row.auth_method} is not active")
+    new_user, old_user = load_payload(row.payload)
+    # Методы входа работают с db.session, у каждой попытки своя сессия
+    with db(commit_on_exit=True):
+        await _call(method, new_user, old_user, timeout)
+
+
+async def _attempt(rows: list[UserUpdateQueue], methods: dict[str, type['AuthPluginMeta']]) -> list[Any]:
+    """Отправляет события параллельно, каждое не дольше `USER_UPDATE_TIMEOUT_SECONDS`"""
+    timeout = get_settings().USER_UPDATE_TIMEOUT_SECONDS
+    return await asyncio.gather(*(_retry(row, methods, timeout) for row in rows), return_exceptions=True)
+
+
+def _record_results(rows: list[UserUpdateQueue], results: list[Any], *, session: Session) -> None:
+    """Удаляет отправленные события и откладывает упавшие, снимая аренду"""
+    settings = get_settings()
+    metrics = get_metrics()
+    now = datetime.datetime.utcnow()
+    for row, result in zip(rows, results):
+        if not isinstance(result, Exception):
+            if UserUpdateQueue.finish(row.id, row.version, session=session):
+                metrics.observe("user_update_propagation_seconds", (now - row.create_ts).total_seconds(), LAG_BUCKETS)
+        elif row.attempts + 1 >= settings.USER_UPDATE_QUEUE_MAX_ATTEMPTS:
+            if UserUpdateQueue.finish(row.id, row.version, session=session):
+                logger.error(f"Giving up on {row.auth_method} update for user {row.user_id}: {result!r}")
+                metrics.inc("user_update_failed_total")
+        else:
+            logger.warning(f"Attempt of {row.auth_method} update for user {row.user_id} failed: {result!r}")
+            UserUpdateQueue.fail(
+                row.id, row.version, repr(result), user_update_backoff(row.attempts + 1), session=session
+            )
+
+
+async def process_user_update_queue(
+    batch_size: int, *, session: Session, methods: dict[str, type['AuthPluginMeta']]
+) -> int:
+    """Повторяет одну пачку событий и записывает результат, отдает число обработанных событий
+
+    Пачка берется в аренду на `USER_UPDATE_QUEUE_LEASE_SECONDS` и коммитится до вызовов внешних
+    сервисов: новые события по тем же строкам не ждут воркер, параллельные воркеры берут следующие
+    """
+    lease = datetime.timedelta(seconds=get_settings().USER_UPDATE_QUEUE_LEASE_SECONDS)
+    rows = UserUpdateQueue.claim(batch_size, lease, session=session)
+    if not rows:
+        session.rollback()
+        return 0
+    session.expunge_all()
+    session.commit()
+    results = await _attempt(rows, methods)
+    _record_results(rows, results, session=session)
+    session.commit()
+    return len(rows)
+
+
+async def run_user_update_worker(
+    session_factory: sessionmaker, methods: dict[str, type['AuthPluginMeta']], batch_size: int, poll_interval: float
+) -> None:
+    """Разбирает `user_update_queue`, пока процесс не остановят"""
+    try:
+        while True:
+            try:
+                with session_factory() as session:
+                    processed = await process_user_update_queue(batch_size, session=session, methods=methods)
+            except Exception:
+                logger.exception("User update batch failed")
+                processed = 0
+            if processed < batch_size:
+                await asyncio.sleep(poll_interval)
+    finally:
+        await get_http_clients().close()
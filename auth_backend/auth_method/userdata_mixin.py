@@ -2,6 +2,11 @@ from abc import ABCMeta, abstractmethod
 from typing import Any, final
 
 from event_schema.auth import UserLogin, UserLoginKey
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session as DbSession
+
+from auth_backend.models.db import KafkaOutbox
+from auth_backend.settings import get_settings
 
 from .base import AuthPluginMeta
 
@@ -31,6 +36,24 @@ class UserdataMixin(AuthPluginMeta, metaclass=ABCMeta):
     async def _convert_data_to_userdata_format(cls, data: Any) -> UserLogin:
         raise NotImplementedError()
 
+    @classmethod
+    def publish_userdata(cls, user_id: int, userdata: UserLogin, *, db_session: DbSession | AsyncSession) -> None:
+        """Кладет данные пользователя в `kafka_outbox` в транзакции `db_session`
+
+        Сообщение уйдет в Kafka только после коммита, его отправит `kafka_outbox relay`
+        """
+        settings = get_settings()
+        if not settings.KAFKA_DSN or not settings.KAFKA_USER_LOGIN_TOPIC_NAME:
+            return
+        db_session.add(
+            KafkaOutbox(
+                topic=settings.KAFKA_USER_LOGIN_TOPIC_NAME,
+                user_id=user_id,
+                key=cls.generate_kafka_key(user_id).model_dump_json(),
+                value=userdata.model_dump_json(),
+            )
+        )
+
     @classmethod
     def userdata_process_empty_strings(cls, userdata: UserLogin) -> UserLogin:
         """Изменяет значения с пустыми строками в параметре категории юзердаты на None"""
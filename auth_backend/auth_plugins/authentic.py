@@ -2,22 +2,19 @@ import logging
 from typing import Any
 from urllib.parse import quote
 
-import aiohttp
-import jwt
-from aiocache import cached
 from event_schema.auth import UserLogin
 from fastapi import Depends
-from fastapi.background import BackgroundTasks
 from fastapi_sqlalchemy import db
 from pydantic import AnyHttpUrl, BaseModel, Field
 
 from auth_backend.auth_method import AuthPluginMeta, OauthMeta, Session
 from auth_backend.auth_method.outer import ConnectionIssue
 from auth_backend.exceptions import AlreadyExists, OauthAuthFailed
-from auth_backend.kafka.kafka import get_kafka_producer
 from auth_backend.models.db import AuthMethod, User, UserSession
 from auth_backend.schemas.types.scopes import Scope
 from auth_backend.settings import Settings
+from auth_backend.utils.http import http_client
+from auth_backend.utils.oidc_keys import OidcProvider, get_oidc_provider
 from auth_backend.utils.security import UnionAuth
 
 AUTH_METHOD_ID_PARAM_NAME = 'user_id'
@@ -47,66 +44,50 @@ class AuthenticAuth(OauthMeta):
         session_name: str | None = None
 
     @classmethod
-    @cached()
-    async def __get_configuration(cls):
+    def __get_provider(cls) -> OidcProvider:
         if not cls.settings.AUTHENTIC_OIDC_CONFIGURATION_URL:
             raise OauthAuthFailed(
                 'Error in OIDC configuration',
                 'Ошибка конфигурации OIDC',
-                500,
+                status_code=500,
             )
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                str(cls.settings.AUTHENTIC_OIDC_CONFIGURATION_URL),
-            ) as response:
-                res = await response.json()
-        logger.debug(res)
-        return res
+        return get_oidc_provider(cls.get_name(), str(cls.settings.AUTHENTIC_OIDC_CONFIGURATION_URL))
 
     @classmethod
-    @cached()
-    async def __get_jwks_options(cls) -> dict[str, list[dict[str]]]:
-        config = await cls.__get_configuration()
+    async def __get_configuration(cls) -> dict[str]:
+        config = await cls.__get_provider().configuration()
         if 'jwks_uri' not in config:
             logger.error('No OIDC JWKS config: %s', str(config))
             raise OauthAuthFailed(
                 'Error in OIDC configuration',
                 'Ошибка конфигурации OIDC',
-                500,
+                status_code=500,
             )
-        jwks_uri = config['jwks_uri']
-        async with aiohttp.ClientSession() as session:
-            async with session.get(jwks_uri) as response:
-                res = await response.json()
-        logger.debug(res)
-        return res
+        return config
 
     @classmethod
     async def __get_token(cls, code: str) -> dict[str]:
         token_url = (await cls.__get_configuration())['token_endpoint']
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                token_url,
-                data={
-                    "grant_type": "authorization_code",
-                    "code": code,
-                    "client_id": cls.settings.AUTHENTIC_CLIENT_ID,
-                    "client_secret": cls.settings.AUTHENTIC_CLIENT_SECRET,
-                    "redirect_uri": str(cls.settings.AUTHENTIC_REDIRECT_URL),
-                },
-                headers={"Accept": "application/x-www-form-urlencoded"},
-            ) as response:
-                token_result = await response.json()
-                logger.debug(token_result)
+        session = http_client(cls.get_name())
+        async with session.post(
+            token_url,
+            data={
+                "grant_type": "authorization_code",
+                "code": code,
+                "client_id": cls.settings.AUTHENTIC_CLIENT_ID,
+                "client_secret": cls.settings.AUTHENTIC_CLIENT_SECRET,
+                "redirect_uri": str(cls.settings.AUTHENTIC_REDIRECT_URL),
+            },
+            headers={"Accept": "application/x-www-form-urlencoded"},
+        ) as response:
+            token_result = await response.json()
+            logger.debug(token_result)
         return token_result
 
     @classmethod
     async def __decode_token(cls, token: str):
-        jwks = jwt.PyJWKSet.from_dict(await cls.__get_jwks_options())
-        algorithms = (await cls.__get_configuration()).get('id_token_signing_alg_values_supported', [])
-        id_token_info = jwt.decode(
-            token, jwks.keys[0], algorithms, {'verify_signature': True}, audience=cls.settings.AUTHENTIC_CLIENT_ID
-        )
+        await cls.__get_configuration()
+        id_token_info = await cls.__get_provider().decode(token, audience=cls.settings.AUTHENTIC_CLIENT_ID)
         logger.debug(id_token_info)
         return id_token_info
 
@@ -133,7 +114,6 @@ class AuthenticAuth(OauthMeta):
     async def _register(
         cls,
         user_inp: OauthResponseSchema,
-        background_tasks: BackgroundTasks,
         user_session: UserSession | None = Depends(UnionAuth(auto_error=True, scopes=[], allow_none=True)),
     ) -> Session:
         """Создает аккаунт или привязывает существующий"""
@@ -177,11 +157,8 @@ class AuthenticAuth(OauthMeta):
         )
 
         # Отправляем обновления пользовательских данных в userdata api
-        background_tasks.add_task(
-            get_kafka_producer().produce,
-            cls.settings.KAFKA_USER_LOGIN_TOPIC_NAME,
-            AuthenticAuth.generate_kafka_key(user.id),
-            await AuthenticAuth._convert_data_to_userdata_format(id_token_info),
+        AuthenticAuth.publish_userdata(
+            user.id, await AuthenticAuth._convert_data_to_userdata_format(id_token_info), db_session=db.session
         )
 
         # Формируем diff пользователя для обработки другими методами входа
@@ -190,7 +167,7 @@ class AuthenticAuth(OauthMeta):
             cls.get_name(): {AUTH_METHOD_ID_PARAM_NAME: authentic_id.value},
         }
         old_user = cls.__get_old_user(user_session)
-        await AuthPluginMeta.user_updated(new_user, old_user)
+        await AuthPluginMeta.user_updated(new_user, old_user, session=db.session)
 
         # Возвразаем сессию пользрвателя
         return await cls._create_session(
@@ -198,7 +175,7 @@ class AuthenticAuth(OauthMeta):
         )
 
     @classmethod
-    async def _login(cls, user_inp: OauthResponseSchema, background_tasks: BackgroundTasks) -> Session:
+    async def _login(cls, user_inp: OauthResponseSchema) -> Session:
         """Вход в пользователя с помощью аккаунта Authentic"""
         id_token = user_inp.id_token
 
@@ -232,25 +209,20 @@ class AuthenticAuth(OauthMeta):
                 'Пользователь с данным аккаунтом Authentic не найден',
                 id_token,
             )
-        user_session = await cls._create_session(
-            user, user_inp.scopes, db_session=db.session, session_name=user_inp.session_name
-        )
-
         # Отправляем обновления пользовательских данных в userdata api
-        background_tasks.add_task(
-            get_kafka_producer().produce,
-            cls.settings.KAFKA_USER_LOGIN_TOPIC_NAME,
-            AuthenticAuth.generate_kafka_key(user.id),
-            await AuthenticAuth._convert_data_to_userdata_format(id_token_info),
+        AuthenticAuth.publish_userdata(
+            user.id, await AuthenticAuth._convert_data_to_userdata_format(id_token_info), db_session=db.session
         )
 
         # Формируем diff пользователя для обработки другими методами входа
         new_user = {'user_id': user.id}
-        old_user = cls.__get_old_user(user_session)
-        await AuthPluginMeta.user_updated(new_user, old_user)
+        old_user = {'user_id': user.id}
+        await AuthPluginMeta.user_updated(new_user, old_user, session=db.session)
 
-        # Возвразаем сессию пользрвателя
-        return user_session
+        # Возвращаем сессию пользователя, она коммитится вместе с событиями выше
+        return await cls._create_session(
+            user, user_inp.scopes, db_session=db.session, session_name=user_inp.session_name
+        )
 
     @classmethod
     async def _redirect_url(cls):
@@ -328,30 +300,30 @@ class AuthenticAuth(OauthMeta):
     async def _is_outer_user_exists(cls, id: str) -> bool:
         """Проверяет наличие пользователя в Authentic"""
         logger.debug("_is_outer_user_exists class=%s started", cls.get_name())
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                str(cls.settings.AUTHENTIC_ROOT_URL).removesuffix('/') + f'/api/v3/core/users/{id}/',
-                headers={'authorization': "Bearer " + cls.settings.AUTHENTIC_TOKEN, 'Accept': 'application/json'},
-            ) as response:
-                if not response.ok:
-                    raise ConnectionIssue(response.text)
-                res: dict[str] = await response.json()
-                logger.debug(res)
-                return str(res.get('pk')) == id
+        session = http_client(cls.get_name())
+        async with session.get(
+            str(cls.settings.AUTHENTIC_ROOT_URL).removesuffix('/') + f'/api/v3/core/users/{id}/',
+            headers={'authorization': "Bearer " + cls.settings.AUTHENTIC_TOKEN, 'Accept': 'application/json'},
+        ) as response:
+            if not response.ok:
+                raise ConnectionIssue(response.text)
+            res: dict[str] = await response.json()
+            logger.debug(res)
+            return str(res.get('pk')) == id
 
     @classmethod
     async def _update_outer_user_password(cls, id: str, password: str):
         """Устанавливает пользователю новый пароль в Authentic"""
         logger.debug("_update_outer_user_password class=%s started", cls.get_name())
         res = False
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                str(cls.settings.AUTHENTIC_ROOT_URL).removesuffix('/') + f'/api/v3/core/users/{id}/set_password/',
-                headers={'authorization': "Bearer " + cls.settings.AUTHENTIC_TOKEN, 'Accept': 'application/json'},
-                json={'password': password},
-            ) as response:
-                res = response.ok
-                logger.debug("_update_outer_user_password class=%s response %s", cls.get_name(), str(response.status))
+        session = http_client(cls.get_name())
+        async with session.post(
+            str(cls.settings.AUTHENTIC_ROOT_URL).removesuffix('/') + f'/api/v3/core/users/{id}/set_password/',
+            headers={'authorization': "Bearer " + cls.settings.AUTHENTIC_TOKEN, 'Accept': 'application/json'},
+            json={'password': password},
+        ) as response:
+            res = response.ok
+            logger.debug("_update_outer_user_password class=%s response %s", cls.get_name(), str(response.status))
         if res:
             logger.info("User %s updated in %s", id, cls.get_name())
         else:
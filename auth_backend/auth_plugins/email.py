@@ -1,23 +1,22 @@
-import hashlib
 import logging
 from typing import Annotated, Self
 
 from annotated_types import MinLen
 from event_schema.auth import UserLogin
 from fastapi import Depends, Header, HTTPException, Request
-from fastapi.background import BackgroundTasks
-from fastapi_sqlalchemy import db
 from pydantic import field_validator, model_validator
-from sqlalchemy import func
-from sqlalchemy.orm import Session as DBSession
+from sqlalchemy import func, not_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from auth_backend.auth_method import AuthPluginMeta, LoginableMixin, RegistrableMixin, Session, UserdataMixin
 from auth_backend.base import Base, StatusResponseModel
 from auth_backend.exceptions import AlreadyExists, AuthFailed, IncorrectUserAuthType, SessionExpired
-from auth_backend.kafka.kafka import get_kafka_producer
 from auth_backend.models.db import AuthMethod, User, UserSession
 from auth_backend.schemas.types.scopes import Scope
 from auth_backend.settings import get_settings
+from auth_backend.utils.async_db import get_async_session
+from auth_backend.utils.email_template import get_email_templates
+from auth_backend.utils.password import hash_password_async, needs_rehash, validate_password_async
 from auth_backend.utils.security import UnionAuth
 from auth_backend.utils.smtp import SendEmailMessage
 from auth_backend.utils.string import random_string
@@ -104,9 +103,17 @@ class ResetForgottenPassword(Base):
 
 class Email(UserdataMixin, LoginableMixin, RegistrableMixin, AuthPluginMeta):
     prefix = "/email"
+    # Шаблоны писем и плейсхолдеры, которые в них подставляются
+    templates: dict[str, set[str]] = {
+        "main_confirmation.html": {"url"},
+        "mail_change_confirmation.html": {"url"},
+        "password_change_confirmation.html": {"url"},
+        "password_change_notification.html": set(),
+    }
 
     def __init__(self):
         super().__init__()
+        get_email_templates().check(self.templates)
 
         self.router.add_api_route("/approve", self._approve_email, methods=["GET"], response_model=StatusResponseModel)
         self.router.add_api_route(
@@ -139,56 +146,62 @@ class Email(UserdataMixin, LoginableMixin, RegistrableMixin, AuthPluginMeta):
         password: str,
         scopes: list[Scope],
         session_name: str | None,
-        background_tasks: BackgroundTasks,
+        *,
+        db_session: AsyncSession,
     ) -> Session:
         return await cls._login(
             EmailLogin(email=email, password=password, scopes=scopes, session_name=session_name),
-            background_tasks,
+            db_session,
         )
 
     @classmethod
-    async def _login(cls, user_inp: EmailLogin, background_tasks: BackgroundTasks) -> Session:
-        query = (
-            AuthMethod.query(session=db.session)
-            .filter(
+    async def _login(
+        cls,
+        user_inp: EmailLogin,
+        db_session: AsyncSession = Depends(get_async_session),
+    ) -> Session:
+        query: AuthMethod | None = await db_session.scalar(
+            select(AuthMethod).where(
                 func.lower(AuthMethod.value) == user_inp.email.lower(),
                 AuthMethod.param == "email",
                 AuthMethod.auth_method == Email.get_name(),
+                not_(AuthMethod.is_deleted),
             )
-            .one_or_none()
         )
         if not query:
             raise AuthFailed("Incorrect login or password", "Некорректный логин или пароль")
-        auth_params = Email.get_auth_method_params(query.user_id, session=db.session)
+        auth_params = await Email.get_auth_method_params_async(query.user_id, session=db_session)
         if auth_params["confirmed"].value.lower() == "false":
             raise AuthFailed(
                 "Registration wasn't completed. Try to registrate again and do not forget to approve your email",
                 "Регистрация не была завершена. Попробуйте зарегистрироваться снова и не забудьте подтвердить почту",
             )
-        if auth_params["email"].value.lower() != user_inp.email.lower() or not Email._validate_password(
+        if auth_params["email"].value.lower() != user_inp.email.lower() or not await Email._validate_password(
             user_inp.password,
             auth_params["hashed_password"].value,
             auth_params["salt"].value,
         ):
             raise AuthFailed("Incorrect login or password", "Некорректный логин или пароль")
+        if needs_rehash(auth_params["hashed_password"].value):
+            # Пароль известен только сейчас, пересчитываем хеш текущим алгоритмом
+            auth_params["hashed_password"].value = await Email._hash_password(
+                user_inp.password, auth_params["salt"].value
+            )
         userdata = await Email._convert_data_to_userdata_format({"email": auth_params["email"].value})
-        background_tasks.add_task(
-            get_kafka_producer().produce,
-            settings.KAFKA_USER_LOGIN_TOPIC_NAME,
-            Email.generate_kafka_key(query.user.id),
-            userdata,
-        )
+        Email.publish_userdata(query.user_id, userdata, db_session=db_session)
         return await cls._create_session(
-            query.user,
+            await query.awaitable_attrs.user,
             user_inp.scopes,
-            db_session=db.session,
+            db_session=db_session,
             session_name=user_inp.session_name,
         )
 
     @staticmethod
-    async def _add_to_db(user_inp: EmailRegister, confirmation_token: str, user: User) -> dict:
+    async def _add_to_db(
+        user_inp: EmailRegister, confirmation_token: str, user_id: int, *, session: AsyncSession
+    ) -> dict:
         salt = random_string()
-        hashed_password = Email._hash_password(user_inp.password, salt)
+        hashed_password = await Email._hash_password(user_inp.password, salt)
         method_params = {
             "email": user_inp.email,
             "hashed_password": hashed_password,
@@ -197,14 +210,15 @@ class Email(UserdataMixin, LoginableMixin, RegistrableMixin, AuthPluginMeta):
             "confirmation_token": confirmation_token,
         }
         for k, v in method_params.items():
-            AuthMethod.create(user_id=user.id, auth_method="email", param=k, value=v, session=db.session)
+            session.add(AuthMethod(user_id=user_id, auth_method="email", param=k, value=v))
+        await session.flush()
         return method_params
 
     @staticmethod
-    async def _change_confirmation_link(user: User, confirmation_token: str, *, session: DBSession) -> None:
-        auth_params = Email.get_auth_method_params(user.id, session=session)
+    async def _change_confirmation_link(user_id: int, confirmation_token: str, *, session: AsyncSession) -> None:
+        auth_params = await Email.get_auth_method_params_async(user_id, session=session)
         if auth_params["confirmed"].value == "true":
-            raise AlreadyExists(User, user.id)
+            raise AlreadyExists(User, user_id)
         else:
             auth_params["confirmation_token"].value = confirmation_token
 
@@ -213,87 +227,99 @@ class Email(UserdataMixin, LoginableMixin, RegistrableMixin, AuthPluginMeta):
         cls,
         request: Request,
         user_inp: EmailRegister,
-        background_tasks: BackgroundTasks,
         user_session: UserSession = Depends(UnionAuth(scopes=[], allow_none=True, auto_error=True)),
+        db_session: AsyncSession = Depends(get_async_session),
     ) -> StatusResponseModel:
         confirmation_token: str = random_string()
-        async with AuthMethod.lock(db.session) as txn:
-            auth_method: AuthMethod | None = (
-                AuthMethod.query(session=txn)
-                .filter(
+        lock_keys = [Email._lock_key(user_inp.email)]
+        if user_session:
+            lock_keys.append(f"user:{user_session.user_id}")
+        async with AuthMethod.lock(db_session, *lock_keys) as txn:
+            auth_method: AuthMethod | None = await txn.scalar(
+                select(AuthMethod).where(
                     AuthMethod.param == "email",
                     func.lower(AuthMethod.value) == user_inp.email.lower(),
                     AuthMethod.auth_method == Email.get_name(),
+                    not_(AuthMethod.is_deleted),
                 )
-                .one_or_none()
             )
             if auth_method:
-                await Email._change_confirmation_link(auth_method.user, confirmation_token, session=txn)
-                SendEmailMessage.send(
-                    user_inp.email,
-                    request.client.host,
-                    "main_confirmation.html",
-                    "Подтверждение регистрации Твой ФФ!",
-                    txn,
-                    background_tasks,
-                    url=f"{settings.APPLICATION_HOST}{settings.ROOT_PATH}/register/success?token={confirmation_token}",
+                await Email._change_confirmation_link(auth_method.user_id, confirmation_token, session=txn)
+                await txn.run_sync(
+                    lambda session: SendEmailMessage.send(
+                        user_inp.email,
+                        request.client.host,
+                        "main_confirmation.html",
+                        "Подтверждение регистрации Твой ФФ!",
+                        session,
+                        url=f"{settings.APPLICATION_HOST}{settings.ROOT_PATH}/register/success?token={confirmation_token}",
+                    )
                 )
                 return StatusResponseModel(
                     status="Success", message="Email confirmation link sent", ru="Ссылка отправлена на почту"
                 )
             if user_session:
-                user = await cls._get_user(user_session=user_session, db_session=txn)
-                if not user:
+                if user_session.expired:
                     raise SessionExpired(user_session.token)
-                auth_method: AuthMethod | None = (
-                    AuthMethod.query(session=txn)
-                    .filter(AuthMethod.auth_method == Email.get_name(), AuthMethod.user_id == user.id)
-                    .first()
+                user_id = user_session.user_id
+                auth_method: AuthMethod | None = await txn.scalar(
+                    select(AuthMethod).where(
+                        AuthMethod.auth_method == Email.get_name(),
+                        AuthMethod.user_id == user_id,
+                        not_(AuthMethod.is_deleted),
+                    )
                 )
                 if auth_method:
-                    raise AlreadyExists(User, user.id)
+                    raise AlreadyExists(User, user_id)
             else:
-                user = await cls._create_user(db_session=txn)
-            method_params = await Email._add_to_db(user_inp, confirmation_token, user)
+                user_id = await txn.run_sync(lambda session: User.create(session=session).id)
+            method_params = await Email._add_to_db(user_inp, confirmation_token, user_id, session=txn)
             method_params["password"] = user_inp.password  # В user_updated передаем пароль в открытую
-            SendEmailMessage.send(
-                user_inp.email,
-                request.client.host,
-                "main_confirmation.html",
-                "Подтверждение регистрации Твой ФФ!",
-                txn,
-                background_tasks,
-                url=f"{settings.APPLICATION_HOST}{settings.ROOT_PATH}/register/success?token={confirmation_token}",
+            await txn.run_sync(
+                lambda session: SendEmailMessage.send(
+                    user_inp.email,
+                    request.client.host,
+                    "main_confirmation.html",
+                    "Подтверждение регистрации Твой ФФ!",
+                    session,
+                    url=f"{settings.APPLICATION_HOST}{settings.ROOT_PATH}/register/success?token={confirmation_token}",
+                )
             )
 
             old_user = None
             if user_session:
-                old_user = {"user_id": user_session.user.id}
-            await AuthPluginMeta.user_updated({"user_id": user.id, Email.get_name(): method_params}, old_user)
+                old_user = {"user_id": user_session.user_id}
+            # Здесь событие только пишется в очередь, внешние сервисы вызываются после коммита и без блокировки
+            await AuthPluginMeta.user_updated(
+                {"user_id": user_id, Email.get_name(): method_params}, old_user, session=txn
+            )
             return StatusResponseModel(
                 status="Success", message="Email confirmation link sent", ru="Ссылка отправлена на почту"
             )
 
     @staticmethod
-    def _hash_password(password: str, salt: str) -> str:
-        enc = hashlib.pbkdf2_hmac("sha256", password.encode(), salt.encode(), 100_000)
-        return enc.hex()
+    def _lock_key(email: str) -> str:
+        """Ключ блокировки для `AuthMethod.lock`, одинаковый для любого написания почты"""
+        return f"email:{email.strip().lower()}"
 
     @staticmethod
-    def _validate_password(password: str, hashed_password: str, salt: str) -> bool:
+    async def _hash_password(password: str, salt: str) -> str:
+        return await hash_password_async(password, salt)
+
+    @staticmethod
+    async def _validate_password(password: str, hashed_password: str, salt: str) -> bool:
         """Проверяет, что хеш пароля совпадает с хешем из БД"""
-        return Email._hash_password(password, salt) == hashed_password
+        return await validate_password_async(password, hashed_password, salt)
 
     @staticmethod
-    async def _approve_email(token: str, background_tasks: BackgroundTasks) -> StatusResponseModel:
-        auth_method: AuthMethod | None = (
-            AuthMethod.query(session=db.session)
-            .filter(
+    async def _approve_email(token: str, db_session: AsyncSession = Depends(get_async_session)) -> StatusResponseModel:
+        auth_method: AuthMethod | None = await db_session.scalar(
+            select(AuthMethod).where(
                 AuthMethod.value == token,
                 AuthMethod.param == "confirmation_token",
                 AuthMethod.auth_method == Email.get_name(),
+                not_(AuthMethod.is_deleted),
             )
-            .one_or_none()
         )
         if not auth_method:
             raise HTTPException(
@@ -302,20 +328,16 @@ class Email(UserdataMixin, LoginableMixin, RegistrableMixin, AuthPluginMeta):
                     status="Error", message="Incorrect link", ru="Некорректная ссылка"
                 ).model_dump(),
             )
-        auth_params = Email.get_auth_method_params(auth_method.user.id, session=db.session)
+        auth_params = await Email.get_auth_method_params_async(auth_method.user_id, session=db_session)
         auth_params["confirmed"].value = "true"
         userdata = await Email._convert_data_to_userdata_format({"email": auth_params["email"].value})
-        background_tasks.add_task(
-            get_kafka_producer().produce,
-            settings.KAFKA_USER_LOGIN_TOPIC_NAME,
-            Email.generate_kafka_key(auth_method.user.id),
-            userdata,
-        )
+        Email.publish_userdata(auth_method.user_id, userdata, db_session=db_session)
         await AuthPluginMeta.user_updated(
-            {"user_id": auth_method.user.id, Email.get_name(): {"confirmed": True}},
-            {"user_id": auth_method.user.id, Email.get_name(): {"confirmed": False}},
+            {"user_id": auth_method.user_id, Email.get_name(): {"confirmed": True}},
+            {"user_id": auth_method.user_id, Email.get_name(): {"confirmed": False}},
+            session=db_session,
         )
-        db.session.commit()
+        await db_session.commit()
         return StatusResponseModel(status="Success", message="Email approved", ru="Почта подтверждена")
 
     @classmethod
@@ -323,11 +345,11 @@ class Email(UserdataMixin, LoginableMixin, RegistrableMixin, AuthPluginMeta):
         cls,
         request: Request,
         scheme: EmailChange,
-        background_tasks: BackgroundTasks,
         user_session: UserSession = Depends(UnionAuth(scopes=[], allow_none=False, auto_error=True)),
+        db_session: AsyncSession = Depends(get_async_session),
     ) -> StatusResponseModel:
-        async with AuthMethod.lock(db.session) as txn:
-            auth_params = Email.get_auth_method_params(user_session.user_id, session=txn)
+        async with AuthMethod.lock(db_session, Email._lock_key(scheme.email), f"user:{user_session.user_id}") as txn:
+            auth_params = await Email.get_auth_method_params_async(user_session.user_id, session=txn)
             if "email" not in auth_params:
                 raise IncorrectUserAuthType()
             if auth_params["confirmed"].value == "false":
@@ -353,42 +375,44 @@ class Email(UserdataMixin, LoginableMixin, RegistrableMixin, AuthPluginMeta):
                     "tmp_email_confirmation_token"
                 ].value
                 auth_params["tmp_email_confirmation_token"].is_deleted = True
-                txn.flush()
-            AuthMethod.create(
-                user_id=user_session.user_id,
-                auth_method="email",
-                param="tmp_email_confirmation_token",
-                value=token,
-                session=txn,
+                await txn.flush()
+            txn.add(
+                AuthMethod(
+                    user_id=user_session.user_id,
+                    auth_method="email",
+                    param="tmp_email_confirmation_token",
+                    value=token,
+                )
             )
             new_user[cls.get_name()]["tmp_email_confirmation_token"] = token
-            AuthMethod.create(
-                user_id=user_session.user_id, auth_method="email", param="tmp_email", value=scheme.email, session=txn
+            txn.add(
+                AuthMethod(user_id=user_session.user_id, auth_method="email", param="tmp_email", value=scheme.email)
             )
             new_user[cls.get_name()]["tmp_email"] = scheme.email
-            SendEmailMessage.send(
-                to_email=scheme.email,
-                ip=request.client.host,
-                message_file_name="mail_change_confirmation.html",
-                subject="Смена почты Твой ФФ!",
-                dbsession=txn,
-                background_tasks=background_tasks,
-                url=f"{settings.APPLICATION_HOST}{settings.ROOT_PATH}/reset/email?token={token}",
+            await txn.flush()
+            await txn.run_sync(
+                lambda session: SendEmailMessage.send(
+                    to_email=scheme.email,
+                    ip=request.client.host,
+                    message_file_name="mail_change_confirmation.html",
+                    subject="Смена почты Твой ФФ!",
+                    dbsession=session,
+                    url=f"{settings.APPLICATION_HOST}{settings.ROOT_PATH}/reset/email?token={token}",
+                )
             )
-            await AuthPluginMeta.user_updated(new_user, old_user)
+            await AuthPluginMeta.user_updated(new_user, old_user, session=txn)
             return StatusResponseModel(
                 status="Success", message="Email confirmation link sent", ru="Ссылка отправлена на почту"
             )
 
     @staticmethod
-    async def _reset_email(token: str, background_tasks: BackgroundTasks) -> StatusResponseModel:
-        auth: AuthMethod | None = (
-            AuthMethod.query(session=db.session)
-            .filter(
+    async def _reset_email(token: str, db_session: AsyncSession = Depends(get_async_session)) -> StatusResponseModel:
+        auth: AuthMethod | None = await db_session.scalar(
+            select(AuthMethod).where(
                 AuthMethod.param == 'tmp_email_confirmation_token',
                 AuthMethod.value == token,
+                not_(AuthMethod.is_deleted),
             )
-            .one_or_none()
         )
         if not auth:
             raise HTTPException(
@@ -397,8 +421,8 @@ class Email(UserdataMixin, LoginableMixin, RegistrableMixin, AuthPluginMeta):
                     status="Error", message="Incorrect confirmation token", ru="Неправильный токен подтверждения"
                 ).model_dump(),
             )
-        auth_params = Email.get_auth_method_params(auth.user_id, session=db.session)
-        user: User = auth.user
+        auth_params = await Email.get_auth_method_params_async(auth.user_id, session=db_session)
+        user: User = await auth.awaitable_attrs.user
         if auth_params["confirmed"].value == "false":
             raise AuthFailed(
                 "Registration wasn't completed. Try to registrate again and do not forget to approve your email",
@@ -420,26 +444,21 @@ class Email(UserdataMixin, LoginableMixin, RegistrableMixin, AuthPluginMeta):
             Email.get_name(): {"email": auth_params["email"].value},
         }
         userdata = await Email._convert_data_to_userdata_format({"email": auth_params["email"].value})
-        background_tasks.add_task(
-            get_kafka_producer().produce,
-            settings.KAFKA_USER_LOGIN_TOPIC_NAME,
-            Email.generate_kafka_key(user.id),
-            userdata,
-        )
-        await AuthPluginMeta.user_updated(new_user, old_user)
-        db.session.commit()
+        Email.publish_userdata(user.id, userdata, db_session=db_session)
+        await AuthPluginMeta.user_updated(new_user, old_user, session=db_session)
+        await db_session.commit()
         return StatusResponseModel(status="Success", message="Email successfully changed", ru="Почта изменена")
 
     @staticmethod
     async def _request_reset_password(
         request: Request,
         schema: ResetPassword,
-        background_tasks: BackgroundTasks,
         user_session: UserSession = Depends(UnionAuth(scopes=[], allow_none=False, auto_error=True)),
+        db_session: AsyncSession = Depends(get_async_session),
     ) -> StatusResponseModel:
         old_user = {"user_id": user_session.user_id, Email.get_name(): {}}
         new_user = {"user_id": user_session.user_id, Email.get_name(): {}}
-        auth_params = Email.get_auth_method_params(user_session.user.id, session=db.session)
+        auth_params = await Email.get_auth_method_params_async(user_session.user_id, session=db_session)
         if "email" not in auth_params:
             raise HTTPException(
                 status_code=401,
@@ -450,7 +469,7 @@ class Email(UserdataMixin, LoginableMixin, RegistrableMixin, AuthPluginMeta):
                 ).model_dump(),
             )
         salt = random_string()
-        if not Email._validate_password(
+        if not await Email._validate_password(
             schema.password,
             auth_params["hashed_password"].value,
             auth_params["salt"].value,
@@ -458,38 +477,40 @@ class Email(UserdataMixin, LoginableMixin, RegistrableMixin, AuthPluginMeta):
             raise AuthFailed("Incorrect password", "Неправильный пароль")
         old_user[Email.get_name()]["hashed_password"] = auth_params["hashed_password"].value
         old_user[Email.get_name()]["salt"] = auth_params["salt"].value
-        auth_params["hashed_password"].value = Email._hash_password(schema.new_password, salt)
+        auth_params["hashed_password"].value = await Email._hash_password(schema.new_password, salt)
         auth_params["salt"].value = salt
         new_user[Email.get_name()]["password"] = schema.new_password
         new_user[Email.get_name()]["hashed_password"] = auth_params["hashed_password"].value
         new_user[Email.get_name()]["salt"] = auth_params["salt"].value
-        SendEmailMessage.send(
-            to_email=auth_params["email"].value,
-            ip=request.client.host,
-            message_file_name="password_change_notification.html",
-            subject="Смена пароля Твой ФФ!",
-            dbsession=db.session,
-            background_tasks=background_tasks,
+        await db_session.run_sync(
+            lambda session: SendEmailMessage.send(
+                to_email=auth_params["email"].value,
+                ip=request.client.host,
+                message_file_name="password_change_notification.html",
+                subject="Смена пароля Твой ФФ!",
+                dbsession=session,
+            )
         )
-        await AuthPluginMeta.user_updated(new_user, old_user)
-        db.session.commit()
+        await AuthPluginMeta.user_updated(new_user, old_user, session=db_session)
+        await db_session.commit()
         return StatusResponseModel(
             status="Success", message="Password has been successfully changed", ru="Пароль изменен"
         )
 
     @staticmethod
     async def _request_reset_forgotten_password(
-        request: Request, schema: RequestResetForgottenPassword, background_tasks: BackgroundTasks
+        request: Request,
+        schema: RequestResetForgottenPassword,
+        db_session: AsyncSession = Depends(get_async_session),
     ) -> StatusResponseModel:
-        async with AuthMethod.lock(db.session) as txn:
-            auth_method_email: AuthMethod | None = (
-                AuthMethod.query(session=txn)
-                .filter(
+        async with AuthMethod.lock(db_session, Email._lock_key(schema.email)) as txn:
+            auth_method_email: AuthMethod | None = await txn.scalar(
+                select(AuthMethod).where(
                     AuthMethod.auth_method == Email.get_name(),
                     AuthMethod.param == "email",
                     AuthMethod.value == schema.email,
+                    not_(AuthMethod.is_deleted),
                 )
-                .one_or_none()
             )
             if not auth_method_email:
                 raise HTTPException(
@@ -498,9 +519,10 @@ class Email(UserdataMixin, LoginableMixin, RegistrableMixin, AuthPluginMeta):
                         status="Error", message="Email not found", ru="Почта не найдена"
                     ).model_dump(),
                 )
-            auth_params = Email.get_auth_method_params(auth_method_email.user.id, session=txn)
-            old_user = {"user_id": auth_method_email.user.id, Email.get_name(): {}}
-            new_user = {"user_id": auth_method_email.user.id, Email.get_name(): {}}
+            user_id = auth_method_email.user_id
+            auth_params = await Email.get_auth_method_params_async(user_id, session=txn)
+            old_user = {"user_id": user_id, Email.get_name(): {}}
+            new_user = {"user_id": user_id, Email.get_name(): {}}
             if "email" not in auth_params:
                 raise HTTPException(
                     status_code=401,
@@ -518,43 +540,40 @@ class Email(UserdataMixin, LoginableMixin, RegistrableMixin, AuthPluginMeta):
             if "reset_token" in auth_params:
                 old_user[Email.get_name()]["reset_token"] = auth_params["reset_token"].value
                 auth_params["reset_token"].is_deleted = True
-                txn.flush()
+                await txn.flush()
             reset_token_value = random_string(length=settings.TOKEN_LENGTH)
-            AuthMethod.create(
-                user_id=auth_method_email.user.id,
-                auth_method="email",
-                param="reset_token",
-                value=reset_token_value,
-                session=txn,
-            )
+            txn.add(AuthMethod(user_id=user_id, auth_method="email", param="reset_token", value=reset_token_value))
+            await txn.flush()
             new_user[Email.get_name()]["reset_token"] = reset_token_value
-            auth_params = Email.get_auth_method_params(auth_method_email.user.id, session=txn)
-            SendEmailMessage.send(
-                to_email=auth_params["email"].value,
-                ip=request.client.host,
-                message_file_name="password_change_confirmation.html",
-                subject="Смена пароля Твой ФФ!",
-                dbsession=txn,
-                background_tasks=background_tasks,
-                url=f"{settings.APPLICATION_HOST}{settings.ROOT_PATH}/reset/password?token={auth_params['reset_token'].value}",
+            auth_params = await Email.get_auth_method_params_async(user_id, session=txn)
+            await txn.run_sync(
+                lambda session: SendEmailMessage.send(
+                    to_email=auth_params["email"].value,
+                    ip=request.client.host,
+                    message_file_name="password_change_confirmation.html",
+                    subject="Смена пароля Твой ФФ!",
+                    dbsession=session,
+                    url=f"{settings.APPLICATION_HOST}{settings.ROOT_PATH}/reset/password?token={auth_params['reset_token'].value}",
+                )
             )
-            await AuthPluginMeta.user_updated(new_user, old_user)
+            await AuthPluginMeta.user_updated(new_user, old_user, session=txn)
             return StatusResponseModel(
                 status="Success", message="Reset link has been successfully mailed", ru="Ссылка отправлена на почту"
             )
 
     @staticmethod
     async def _reset_forgotten_password(
-        schema: ResetForgottenPassword, reset_token: str = Header(min_length=1)
+        schema: ResetForgottenPassword,
+        reset_token: str = Header(min_length=1),
+        db_session: AsyncSession = Depends(get_async_session),
     ) -> StatusResponseModel:
-        auth_method = (
-            AuthMethod.query(session=db.session)
-            .filter(
+        auth_method: AuthMethod | None = await db_session.scalar(
+            select(AuthMethod).where(
                 AuthMethod.auth_method == Email.get_name(),
                 AuthMethod.param == "reset_token",
                 AuthMethod.value == reset_token,
+                not_(AuthMethod.is_deleted),
             )
-            .one_or_none()
         )
         if not auth_method:
             raise HTTPException(
@@ -563,18 +582,18 @@ class Email(UserdataMixin, LoginableMixin, RegistrableMixin, AuthPluginMeta):
                     status="Error", message="Invalid reset token", ru="Неправильный токен сброса"
                 ).model_dump(),
             )
-        auth_params = Email.get_auth_method_params(auth_method.user.id, session=db.session)
-        old_user = {"user_id": auth_method.user.id, Email.get_name(): {"reset_token": auth_params["reset_token"].value}}
-        new_user = {"user_id": auth_method.user.id, Email.get_name(): {}}
+        auth_params = await Email.get_auth_method_params_async(auth_method.user_id, session=db_session)
+        old_user = {"user_id": auth_method.user_id, Email.get_name(): {"reset_token": auth_params["reset_token"].value}}
+        new_user = {"user_id": auth_method.user_id, Email.get_name(): {}}
         salt = random_string()
-        auth_params["hashed_password"].value = Email._hash_password(schema.new_password, salt)
+        auth_params["hashed_password"].value = await Email._hash_password(schema.new_password, salt)
         new_user[Email.get_name()]["password"] = schema.new_password  # В user_updated передаем пароль в открытую
         new_user[Email.get_name()]["hashed_password"] = auth_params["hashed_password"].value
         auth_params["salt"].value = salt
         new_user[Email.get_name()]["salt"] = auth_params["salt"].value
         auth_params["reset_token"].is_deleted = True
-        await AuthPluginMeta.user_updated(new_user, old_user)
-        db.session.commit()
+        await AuthPluginMeta.user_updated(new_user, old_user, session=db_session)
+        await db_session.commit()
         return StatusResponseModel(
             status="Success", message="Password has been successfully changed", ru="Пароль изменен"
         )
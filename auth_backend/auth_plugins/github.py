@@ -2,20 +2,18 @@ import logging
 from typing import Any
 from urllib.parse import quote
 
-import aiohttp
 import jwt
 from event_schema.auth import UserLogin
 from fastapi import Depends
-from fastapi.background import BackgroundTasks
 from fastapi_sqlalchemy import db
 from pydantic import BaseModel, Field
 
 from auth_backend.auth_method import AuthPluginMeta, OauthMeta, Session
 from auth_backend.exceptions import AlreadyExists, OauthAuthFailed
-from auth_backend.kafka.kafka import get_kafka_producer
 from auth_backend.models.db import User, UserSession
 from auth_backend.schemas.types.scopes import Scope
 from auth_backend.settings import Settings
+from auth_backend.utils.http import http_client
 from auth_backend.utils.security import UnionAuth
 
 logger = logging.getLogger(__name__)
@@ -44,7 +42,6 @@ class GithubAuth(OauthMeta):
     async def _register(
         cls,
         user_inp: OauthResponseSchema,
-        background_tasks: BackgroundTasks,
         user_session: UserSession = Depends(UnionAuth(auto_error=True, scopes=[], allow_none=True)),
     ) -> Session:
         """Создает аккаунт или привязывает существующий
@@ -65,28 +62,28 @@ class GithubAuth(OauthMeta):
         userinfo = None
 
         if user_inp.id_token is None:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    'https://github.com/login/oauth/access_token',
-                    json=payload,
-                    headers={"Accept": "application/json"},
-                ) as response:
-                    token_result = await response.json()
-                    logger.debug(token_result)
-                if 'access_token' not in token_result:
-                    raise OauthAuthFailed('Invalid credentials for github account', 'Неправильные учетные данные')
-                token = token_result['access_token']
-
-                async with session.get(
-                    'https://api.github.com/user',
-                    headers={
-                        "Authorization": f"Bearer {token}",
-                        "Accept": "application/json",
-                    },
-                ) as response:
-                    userinfo = await response.json()
-                    logger.error(userinfo)
-                    github_user_id = userinfo['id']
+            session = http_client(cls.get_name())
+            async with session.post(
+                'https://github.com/login/oauth/access_token',
+                json=payload,
+                headers={"Accept": "application/json"},
+            ) as response:
+                token_result = await response.json()
+                logger.debug(token_result)
+            if 'access_token' not in token_result:
+                raise OauthAuthFailed('Invalid credentials for github account', 'Неправильные учетные данные')
+            token = token_result['access_token']
+
+            async with session.get(
+                'https://api.github.com/user',
+                headers={
+                    "Authorization": f"Bearer {token}",
+                    "Accept": "application/json",
+                },
+            ) as response:
+                userinfo = await response.json()
+                logger.error(userinfo)
+                github_user_id = userinfo['id']
         else:
             userinfo = jwt.decode(user_inp.id_token, cls.settings.ENCRYPTION_KEY, algorithms=["HS256"])
             github_user_id = userinfo['id']
@@ -105,13 +102,8 @@ class GithubAuth(OauthMeta):
         gh_id = cls.create_auth_method_param('user_id', github_user_id, user.id, db_session=db.session)
         new_user[cls.get_name()] = {"user_id": gh_id.value}
         userdata = await GithubAuth._convert_data_to_userdata_format(userinfo)
-        background_tasks.add_task(
-            get_kafka_producer().produce,
-            cls.settings.KAFKA_USER_LOGIN_TOPIC_NAME,
-            GithubAuth.generate_kafka_key(user.id),
-            userdata,
-        )
-        await AuthPluginMeta.user_updated(new_user, old_user)
+        GithubAuth.publish_userdata(user.id, userdata, db_session=db.session)
+        await AuthPluginMeta.user_updated(new_user, old_user, session=db.session)
         return await cls._create_session(
             user,
             user_inp.scopes,
@@ -120,7 +112,7 @@ class GithubAuth(OauthMeta):
         )
 
     @classmethod
-    async def _login(cls, user_inp: OauthResponseSchema, background_tasks: BackgroundTasks) -> Session:
+    async def _login(cls, user_inp: OauthResponseSchema) -> Session:
         """Вход в пользователя с помощью аккаунта https://github.com
 
         Производит вход, если находит пользователя по уникальному идендификатору. Если аккаунт не
@@ -134,28 +126,28 @@ class GithubAuth(OauthMeta):
         }
         github_user_id = None
         userinfo = None
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                'https://github.com/login/oauth/access_token',
-                json=payload,
-                headers={"Accept": "application/json"},
-            ) as response:
-                token_result = await response.json()
-                logger.debug(token_result)
-            if 'access_token' not in token_result:
-                raise OauthAuthFailed('Invalid credentials for github account', 'Неправильные учетные данные')
-            token = token_result['access_token']
-
-            async with session.get(
-                'https://api.github.com/user',
-                headers={
-                    "Authorization": f"Bearer {token}",
-                    "Accept": "application/json",
-                },
-            ) as response:
-                userinfo = await response.json()
-                logger.error(userinfo)
-                github_user_id = userinfo['id']
+        session = http_client(cls.get_name())
+        async with session.post(
+            'https://github.com/login/oauth/access_token',
+            json=payload,
+            headers={"Accept": "application/json"},
+        ) as response:
+            token_result = await response.json()
+            logger.debug(token_result)
+        if 'access_token' not in token_result:
+            raise OauthAuthFailed('Invalid credentials for github account', 'Неправильные учетные данные')
+        token = token_result['access_token']
+
+        async with session.get(
+            'https://api.github.com/user',
+            headers={
+                "Authorization": f"Bearer {token}",
+                "Accept": "application/json",
+            },
+        ) as response:
+            userinfo = await response.json()
+            logger.error(userinfo)
+            github_user_id = userinfo['id']
 
         user = await cls._get_user('user_id', github_user_id, db_session=db.session)
         if not user:
@@ -164,12 +156,7 @@ class GithubAuth(OauthMeta):
                 'No users found for github account', 'Не найдено пользователей для аккаунта GitHub', id_token
             )
         userdata = await GithubAuth._convert_data_to_userdata_format(userinfo)
-        background_tasks.add_task(
-            get_kafka_producer().produce,
-            cls.settings.KAFKA_USER_LOGIN_TOPIC_NAME,
-            GithubAuth.generate_kafka_key(user.id),
-            userdata,
-        )
+        GithubAuth.publish_userdata(user.id, userdata, db_session=db.session)
         return await cls._create_session(
             user,
             user_inp.scopes,
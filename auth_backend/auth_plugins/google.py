@@ -1,27 +1,29 @@
 import logging
 from typing import Any
 
+import aiohttp
 import google_auth_oauthlib.flow
-import oauthlib.oauth2.rfc6749.errors
+import jwt
 from event_schema.auth import UserLogin
 from fastapi import Depends
-from fastapi.background import BackgroundTasks
 from fastapi_sqlalchemy import db
-from google.auth.exceptions import GoogleAuthError
-from google.auth.transport import requests
-from google.oauth2.id_token import verify_oauth2_token
 from pydantic import BaseModel, Field, Json
 
 from auth_backend.auth_method import AuthPluginMeta, OauthMeta, Session
 from auth_backend.exceptions import AlreadyExists, OauthAuthFailed, OauthCredentialsIncorrect
-from auth_backend.kafka.kafka import get_kafka_producer
 from auth_backend.models.db import User, UserSession
 from auth_backend.schemas.types.scopes import Scope
 from auth_backend.settings import Settings
+from auth_backend.utils.http import http_client
+from auth_backend.utils.oidc_keys import get_oidc_provider
 from auth_backend.utils.security import UnionAuth
 
 logger = logging.getLogger(__name__)
 
+GOOGLE_OIDC_CONFIGURATION_URL = 'https://accounts.google.com/.well-known/openid-configuration'
+GOOGLE_TOKEN_URL = 'https://oauth2.googleapis.com/token'
+GOOGLE_ISSUERS = ['accounts.google.com', 'https://accounts.google.com']
+
 
 class GoogleSettings(Settings):
     GOOGLE_REDIRECT_URL: str = 'https://app.test.profcomff.com/auth/oauth-authorized/google'
@@ -53,7 +55,6 @@ class GoogleAuth(OauthMeta):
     async def _register(
         cls,
         user_inp: OauthResponseSchema,
-        background_tasks: BackgroundTasks,
         user_session: UserSession | None = Depends(UnionAuth(scopes=[], allow_none=True, auto_error=True)),
     ) -> Session:
         """Создает аккаунт или привязывает существующий
@@ -65,26 +66,12 @@ class GoogleAuth(OauthMeta):
         new_user = {}
         credentials = None
         if not user_inp.id_token:
-            flow = await cls._default_flow()
-            try:
-                credentials = flow.fetch_token(**user_inp.model_dump(exclude_unset=True))
-            except oauthlib.oauth2.rfc6749.errors.InvalidGrantError as exc:
-                raise OauthCredentialsIncorrect(
-                    f'Google account response invalid: {exc}', 'Запрос к АПИ Гугла неуспешен'
-                )
+            credentials = await cls._fetch_token(user_inp.code)
             id_token = credentials.get("id_token")
         else:
             id_token = user_inp.id_token
 
-        try:
-            userinfo = verify_oauth2_token(
-                id_token,
-                requests.Request(),
-                cls.settings.GOOGLE_CREDENTIALS['web']['client_id'],
-                clock_skew_in_seconds=1,
-            )
-        except GoogleAuthError as exc:
-            raise OauthCredentialsIncorrect(f'Google account response invalid: {exc}', 'Запрос к АПИ Гугла неуспешен')
+        userinfo = await cls._verify_id_token(id_token)
         user = await cls._get_user('unique_google_id', userinfo['sub'], db_session=db.session)
         if user is not None:
             raise AlreadyExists(User, user.id)
@@ -113,13 +100,8 @@ class GoogleAuth(OauthMeta):
         google_id = cls.create_auth_method_param('unique_google_id', userinfo['sub'], user.id, db_session=db.session)
         new_user = {cls.get_name(): {"unique_google_id": google_id.value}}
         userdata = await GoogleAuth._convert_data_to_userdata_format(userinfo)
-        background_tasks.add_task(
-            get_kafka_producer().produce,
-            cls.settings.KAFKA_USER_LOGIN_TOPIC_NAME,
-            GoogleAuth.generate_kafka_key(user.id),
-            userdata,
-        )
-        await AuthPluginMeta.user_updated(new_user, old_user)
+        GoogleAuth.publish_userdata(user.id, userdata, db_session=db.session)
+        await AuthPluginMeta.user_updated(new_user, old_user, session=db.session)
         return await cls._create_session(
             user,
             user_inp.scopes,
@@ -128,26 +110,14 @@ class GoogleAuth(OauthMeta):
         )
 
     @classmethod
-    async def _login(cls, user_inp: OauthResponseSchema, background_tasks: BackgroundTasks):
+    async def _login(cls, user_inp: OauthResponseSchema):
         """Вход в пользователя с помощью аккаунта Google
 
         Производит вход, если находит пользователя по Google client_id. Если аккаунт не найден,
         возвращает ошибка.
         """
-        flow = await cls._default_flow()
-        try:
-            credentials = flow.fetch_token(**user_inp.model_dump(exclude_unset=True))
-        except oauthlib.oauth2.rfc6749.errors.OAuth2Error as exc:
-            raise OauthCredentialsIncorrect(f'Google account response invalid: {exc}', 'Запрос к АПИ Гугла неуспешен')
-        try:
-            userinfo = verify_oauth2_token(
-                credentials.get("id_token"),
-                requests.Request(),
-                cls.settings.GOOGLE_CREDENTIALS['web']['client_id'],
-                clock_skew_in_seconds=1,
-            )
-        except GoogleAuthError as exc:
-            raise OauthCredentialsIncorrect(f'Google account response invalid: {exc}', 'Запрос к АПИ Гугла неуспешен')
+        credentials = await cls._fetch_token(user_inp.code)
+        userinfo = await cls._verify_id_token(credentials.get("id_token"))
         user = await cls._get_user('unique_google_id', userinfo['sub'], db_session=db.session)
         if not user:
             raise OauthAuthFailed(
@@ -156,12 +126,7 @@ class GoogleAuth(OauthMeta):
                 id_token=credentials.get("id_token"),
             )
         userdata = await GoogleAuth._convert_data_to_userdata_format(userinfo)
-        background_tasks.add_task(
-            get_kafka_producer().produce,
-            cls.settings.KAFKA_USER_LOGIN_TOPIC_NAME,
-            GoogleAuth.generate_kafka_key(user.id),
-            userdata,
-        )
+        GoogleAuth.publish_userdata(user.id, userdata, db_session=db.session)
         return await cls._create_session(
             user,
             user_inp.scopes,
@@ -169,6 +134,47 @@ class GoogleAuth(OauthMeta):
             session_name=user_inp.session_name,
         )
 
+    @classmethod
+    async def _fetch_token(cls, code: str | None) -> dict[str, Any]:
+        """Обменивает код авторизации на токены Google"""
+        client_config = cls.settings.GOOGLE_CREDENTIALS['web']
+        try:
+            async with http_client(cls.get_name()).post(
+                client_config.get('token_uri', GOOGLE_TOKEN_URL),
+                data={
+                    "grant_type": "authorization_code",
+                    "code": code or '',
+                    "client_id": client_config['client_id'],
+                    "client_secret": client_config['client_secret'],
+                    "redirect_uri": cls.settings.GOOGLE_REDIRECT_URL,
+                },
+                headers={"Accept": "application/json"},
+            ) as response:
+                token_result = await response.json()
+        except aiohttp.ClientError as exc:
+            raise OauthCredentialsIncorrect(f'Google account response invalid: {exc}', 'Запрос к АПИ Гугла неуспешен')
+        if 'error' in token_result:
+            error = token_result.get('error_description', token_result['error'])
+            raise OauthCredentialsIncorrect(f'Google account response invalid: {error}', 'Запрос к АПИ Гугла неуспешен')
+        return token_result
+
+    @classmethod
+    async def _verify_id_token(cls, id_token: str | None) -> dict[str, Any]:
+        """Проверяет id_token по сертификатам Google, сертификаты кэшируются и общие для всех плагинов"""
+        if not id_token:
+            raise OauthCredentialsIncorrect(
+                'Google account response invalid: no id_token', 'Запрос к АПИ Гугла неуспешен'
+            )
+        try:
+            return await get_oidc_provider(GoogleAuth.get_name(), GOOGLE_OIDC_CONFIGURATION_URL).decode(
+                id_token,
+                audience=cls.settings.GOOGLE_CREDENTIALS['web']['client_id'],
+                issuer=GOOGLE_ISSUERS,
+                leeway=1,
+            )
+        except (jwt.PyJWTError, aiohttp.ClientError) as exc:
+            raise OauthCredentialsIncorrect(f'Google account response invalid: {exc}', 'Запрос к АПИ Гугла неуспешен')
+
     @classmethod
     async def _redirect_url(cls):
         """URL на который происходит редирект после завершения входа на стороне провайдера"""
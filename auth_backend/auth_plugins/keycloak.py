@@ -6,16 +6,15 @@ import aiohttp
 import jwt
 from event_schema.auth import UserLogin
 from fastapi import Depends
-from fastapi.background import BackgroundTasks
 from fastapi_sqlalchemy import db
 from pydantic import BaseModel, Field
 
 from auth_backend.auth_method import AuthPluginMeta, OauthMeta, Session
 from auth_backend.exceptions import AlreadyExists, OauthAuthFailed
-from auth_backend.kafka.kafka import get_kafka_producer
 from auth_backend.models.db import User, UserSession
 from auth_backend.schemas.types.scopes import Scope
 from auth_backend.settings import Settings
+from auth_backend.utils.http import http_client
 from auth_backend.utils.security import UnionAuth
 
 logger = logging.getLogger(__name__)
@@ -45,7 +44,6 @@ class KeycloakAuth(OauthMeta):
     async def _register(
         cls,
         user_inp: OauthResponseSchema,
-        background_tasks: BackgroundTasks,
         user_session: UserSession = Depends(UnionAuth(auto_error=True, scopes=[], allow_none=True)),
     ) -> Session:
         """Создает аккаунт или привязывает существующий"""
@@ -55,76 +53,7 @@ class KeycloakAuth(OauthMeta):
         userinfo = None
 
         if user_inp.id_token is None:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f'{cls.settings.KEYCLOAK_ROOT_URL}/token',
-                    data={
-                        "grant_type": "authorization_code",
-                        "code": user_inp.code,
-                        "client_id": cls.settings.KEYCLOAK_CLIENT_ID,
-                        "client_secret": cls.settings.KEYCLOAK_CLIENT_SECRET,
-                        "redirect_uri": cls.settings.KEYCLOAK_REDIRECT_URL,
-                    },
-                    headers={"Accept": "application/x-www-form-urlencoded"},
-                ) as response:
-                    token_result = await response.json()
-                    logger.debug(token_result)
-                if 'access_token' not in token_result:
-                    raise OauthAuthFailed(
-                        'Invalid credentials for keycloak account',
-                        'Неверные данные для входа в аккаунт keycloak',
-                    )
-                token = token_result['access_token']
-
-                async with session.get(
-                    f'{cls.settings.KEYCLOAK_ROOT_URL}/userinfo',
-                    headers={
-                        "Authorization": f"Bearer {token}",
-                        "Accept": "application/json",
-                    },
-                ) as response:
-                    userinfo = await response.json()
-                    logger.error(userinfo)
-                    keycloak_user_id = userinfo['sub']
-        else:
-            userinfo = jwt.decode(user_inp.id_token, cls.settings.ENCRYPTION_KEY, algorithms=["HS256"])
-            keycloak_user_id = userinfo['sub']
-            logger.debug(userinfo)
-
-        user = await cls._get_user('user_id', keycloak_user_id, db_session=db.session)
-
-        if user is not None:
-            raise AlreadyExists(User, user.id)
-        if user_session is None:
-            user = await cls._create_user(db_session=db.session) if user_session is None else user_session.user
-        else:
-            user = user_session.user
-            old_user = {'user_id': user.id}
-        new_user["user_id"] = user.id
-        keycloak_id = cls.create_auth_method_param('user_id', keycloak_user_id, user.id, db_session=db.session)
-        new_user = {cls.get_name(): {"user_id": keycloak_id.value}}
-        userdata = await KeycloakAuth._convert_data_to_userdata_format(userinfo)
-        background_tasks.add_task(
-            get_kafka_producer().produce,
-            cls.settings.KAFKA_USER_LOGIN_TOPIC_NAME,
-            KeycloakAuth.generate_kafka_key(user.id),
-            userdata,
-        )
-        await AuthPluginMeta.user_updated(new_user, old_user)
-        return await cls._create_session(
-            user,
-            user_inp.scopes,
-            db_session=db.session,
-            session_name=user_inp.session_name,
-        )
-
-    @classmethod
-    async def _login(cls, user_inp: OauthResponseSchema, background_tasks: BackgroundTasks) -> Session:
-        """Вход в пользователя с помощью аккаунта Keycloak"""
-        form = aiohttp.FormData()
-        keycloak_user_id = None
-        userinfo = None
-        async with aiohttp.ClientSession() as session:
+            session = http_client(cls.get_name())
             async with session.post(
                 f'{cls.settings.KEYCLOAK_ROOT_URL}/token',
                 data={
@@ -155,6 +84,70 @@ class KeycloakAuth(OauthMeta):
                 userinfo = await response.json()
                 logger.error(userinfo)
                 keycloak_user_id = userinfo['sub']
+        else:
+            userinfo = jwt.decode(user_inp.id_token, cls.settings.ENCRYPTION_KEY, algorithms=["HS256"])
+            keycloak_user_id = userinfo['sub']
+            logger.debug(userinfo)
+
+        user = await cls._get_user('user_id', keycloak_user_id, db_session=db.session)
+
+        if user is not None:
+            raise AlreadyExists(User, user.id)
+        if user_session is None:
+            user = await cls._create_user(db_session=db.session) if user_session is None else user_session.user
+        else:
+            user = user_session.user
+            old_user = {'user_id': user.id}
+        new_user["user_id"] = user.id
+        keycloak_id = cls.create_auth_method_param('user_id', keycloak_user_id, user.id, db_session=db.session)
+        new_user = {cls.get_name(): {"user_id": keycloak_id.value}}
+        userdata = await KeycloakAuth._convert_data_to_userdata_format(userinfo)
+        KeycloakAuth.publish_userdata(user.id, userdata, db_session=db.session)
+        await AuthPluginMeta.user_updated(new_user, old_user, session=db.session)
+        return await cls._create_session(
+            user,
+            user_inp.scopes,
+            db_session=db.session,
+            session_name=user_inp.session_name,
+        )
+
+    @classmethod
+    async def _login(cls, user_inp: OauthResponseSchema) -> Session:
+        """Вход в пользователя с помощью аккаунта Keycloak"""
+        form = aiohttp.FormData()
+        keycloak_user_id = None
+        userinfo = None
+        session = http_client(cls.get_name())
+        async with session.post(
+            f'{cls.settings.KEYCLOAK_ROOT_URL}/token',
+            data={
+                "grant_type": "authorization_code",
+                "code": user_inp.code,
+                "client_id": cls.settings.KEYCLOAK_CLIENT_ID,
+                "client_secret": cls.settings.KEYCLOAK_CLIENT_SECRET,
+                "redirect_uri": cls.settings.KEYCLOAK_REDIRECT_URL,
+            },
+            headers={"Accept": "application/x-www-form-urlencoded"},
+        ) as response:
+            token_result = await response.json()
+            logger.debug(token_result)
+        if 'access_token' not in token_result:
+            raise OauthAuthFailed(
+                'Invalid credentials for keycloak account',
+                'Неверные данные для входа в аккаунт keycloak',
+            )
+        token = token_result['access_token']
+
+        async with session.get(
+            f'{cls.settings.KEYCLOAK_ROOT_URL}/userinfo',
+            headers={
+                "Authorization": f"Bearer {token}",
+                "Accept": "application/json",
+            },
+        ) as response:
+            userinfo = await response.json()
+            logger.error(userinfo)
+            keycloak_user_id = userinfo['sub']
 
         user = await cls._get_user('user_id', keycloak_user_id, db_session=db.session)
         if not user:
@@ -165,12 +158,7 @@ class KeycloakAuth(OauthMeta):
                 id_token,
             )
         userdata = await KeycloakAuth._convert_data_to_userdata_format(userinfo)
-        background_tasks.add_task(
-            get_kafka_producer().produce,
-            cls.settings.KAFKA_USER_LOGIN_TOPIC_NAME,
-            KeycloakAuth.generate_kafka_key(user.id),
-            userdata,
-        )
+        KeycloakAuth.publish_userdata(user.id, userdata, db_session=db.session)
         return await cls._create_session(
             user,
             user_inp.scopes,
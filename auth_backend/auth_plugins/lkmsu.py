@@ -2,21 +2,19 @@ import logging
 from typing import Any
 from urllib.parse import quote
 
-import aiohttp
 import jwt
 from event_schema.auth import UserLogin
 from fastapi import Depends
 from fastapi_sqlalchemy import db
 from pydantic import BaseModel, Field
-from starlette.background import BackgroundTasks
 
 from auth_backend.auth_method import AuthPluginMeta, OauthMeta, Session
 from auth_backend.exceptions import AlreadyExists, OauthAuthFailed
-from auth_backend.kafka.kafka import get_kafka_producer
-from auth_backend.models.db import Group, User, UserGroup, UserSession
+from auth_backend.models.db import Group, User, UserEffectiveScope, UserGroup, UserSession
 from auth_backend.models.dynamic_settings import DynamicOption
 from auth_backend.schemas.types.scopes import Scope
 from auth_backend.settings import Settings
+from auth_backend.utils.http import http_client
 from auth_backend.utils.security import UnionAuth
 from auth_backend.utils.string import concantenate_strings
 
@@ -47,7 +45,6 @@ class LkmsuAuth(OauthMeta):
     async def _register(
         cls,
         user_inp: OauthResponseSchema,
-        background_tasks: BackgroundTasks,
         user_session: UserSession = Depends(UnionAuth(auto_error=True, scopes=[], allow_none=True)),
     ) -> Session:
         """Создает аккаунт или привязывает существующий
@@ -69,20 +66,20 @@ class LkmsuAuth(OauthMeta):
         userinfo = None
 
         if user_inp.id_token is None:
-            async with aiohttp.ClientSession() as session:
-                async with session.post('https://lk.msu.ru/oauth/token', json=payload) as response:
-                    token_result = await response.json()
-                    logger.debug(token_result)
-                if 'access_token' not in token_result:
-                    raise OauthAuthFailed('Invalid credentials for lk msu account', 'Неправильные учетные данные')
-                token = token_result['access_token']
+            session = http_client(cls.get_name())
+            async with session.post('https://lk.msu.ru/oauth/token', json=payload) as response:
+                token_result = await response.json()
+                logger.debug(token_result)
+            if 'access_token' not in token_result:
+                raise OauthAuthFailed('Invalid credentials for lk msu account', 'Неправильные учетные данные')
+            token = token_result['access_token']
 
-                async with session.get(
-                    'https://lk.msu.ru/oauth/userinfo', headers={"Authorization": f"Bearer {token}"}
-                ) as response:
-                    userinfo = await response.json()
-                    logger.debug(userinfo)
-                    lk_user_id = userinfo['user_id']
+            async with session.get(
+                'https://lk.msu.ru/oauth/userinfo', headers={"Authorization": f"Bearer {token}"}
+            ) as response:
+                userinfo = await response.json()
+                logger.debug(userinfo)
+                lk_user_id = userinfo['user_id']
         else:
             userinfo = jwt.decode(user_inp.id_token, cls.settings.ENCRYPTION_KEY, algorithms=["HS256"])
             lk_user_id = userinfo['user_id']
@@ -102,13 +99,8 @@ class LkmsuAuth(OauthMeta):
         cls.assign_verified_user(user)
         new_user = {cls.get_name(): {"user_id": lk_id.value}}
         userdata = await LkmsuAuth._convert_data_to_userdata_format(userinfo)
-        background_tasks.add_task(
-            get_kafka_producer().produce,
-            cls.settings.KAFKA_USER_LOGIN_TOPIC_NAME,
-            LkmsuAuth.generate_kafka_key(user.id),
-            userdata,
-        )
-        await AuthPluginMeta.user_updated(new_user, old_user)
+        LkmsuAuth.publish_userdata(user.id, userdata, db_session=db.session)
+        await AuthPluginMeta.user_updated(new_user, old_user, session=db.session)
         return await cls._create_session(
             user,
             user_inp.scopes,
@@ -120,7 +112,6 @@ class LkmsuAuth(OauthMeta):
     async def _login(
         cls,
         user_inp: OauthResponseSchema,
-        background_tasks: BackgroundTasks,
     ) -> Session:
         """Вход в пользователя с помощью аккаунта https://lk.msu.ru
 
@@ -136,20 +127,20 @@ class LkmsuAuth(OauthMeta):
         }
         lk_user_id = None
         userinfo = None
-        async with aiohttp.ClientSession() as session:
-            async with session.post('https://lk.msu.ru/oauth/token', json=payload) as response:
-                token_result = await response.json()
-                logger.debug(token_result)
-            if 'access_token' not in token_result:
-                raise OauthAuthFailed('Invalid credentials for lk msu account', 'Неправильные учетные данные')
-            token = token_result['access_token']
+        session = http_client(cls.get_name())
+        async with session.post('https://lk.msu.ru/oauth/token', json=payload) as response:
+            token_result = await response.json()
+            logger.debug(token_result)
+        if 'access_token' not in token_result:
+            raise OauthAuthFailed('Invalid credentials for lk msu account', 'Неправильные учетные данные')
+        token = token_result['access_token']
 
-            async with session.get(
-                'https://lk.msu.ru/oauth/userinfo', headers={"Authorization": f"Bearer {token}"}
-            ) as response:
-                userinfo = await response.json()
-                logger.error(userinfo)
-                lk_user_id = userinfo['user_id']
+        async with session.get(
+            'https://lk.msu.ru/oauth/userinfo', headers={"Authorization": f"Bearer {token}"}
+        ) as response:
+            userinfo = await response.json()
+            logger.error(userinfo)
+            lk_user_id = userinfo['user_id']
 
         user = await cls._get_user('user_id', lk_user_id, db_session=db.session)
         if not user:
@@ -159,12 +150,7 @@ class LkmsuAuth(OauthMeta):
             )
         cls.assign_verified_user(user)
         userdata = await LkmsuAuth._convert_data_to_userdata_format(userinfo)
-        background_tasks.add_task(
-            get_kafka_producer().produce,
-            cls.settings.KAFKA_USER_LOGIN_TOPIC_NAME,
-            LkmsuAuth.generate_kafka_key(user.id),
-            userdata,
-        )
+        LkmsuAuth.publish_userdata(user.id, userdata, db_session=db.session)
         return await cls._create_session(
             user,
             user_inp.scopes,
@@ -196,7 +182,8 @@ class LkmsuAuth(OauthMeta):
         new_user = {"user_id": user_session.user.id}
         old_user_params = await cls._delete_auth_methods(user_session.user, db_session=db.session)
         old_user[cls.get_name()] = old_user_params
-        await AuthPluginMeta.user_updated(new_user, old_user)
+        await AuthPluginMeta.user_updated(new_user, old_user, session=db.session)
+        db.session.commit()
         return None
 
     @classmethod
@@ -219,6 +206,7 @@ class LkmsuAuth(OauthMeta):
             if verified_group:
                 if verified_group not in user.groups:
                     user.groups.append(verified_group)
+                    UserEffectiveScope.refresh_users([user.id], session=db.session)
             else:
                 logger.error("Verified group not found")
         else:
@@ -1,62 +1,94 @@
 import logging
 import re
-from contextlib import contextmanager
-from typing import Generator
+from contextlib import asynccontextmanager
+from typing import Annotated, AsyncIterator
 
+from annotated_types import Gt
 from pydantic import PostgresDsn
-from sqlalchemy import Result, create_engine, text
-from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy import String, bindparam, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
 
 from auth_backend.auth_method import OuterAuthMeta
 from auth_backend.settings import Settings
+from auth_backend.utils.async_db import async_dsn
 
 logger = logging.getLogger(__name__)
 
 
 class PostgresOuterAuthSettings(Settings):
     POSTGRES_AUTH_DB_DSN: PostgresDsn = 'postgresql://postgres@localhost:5432/postgres'
+    POSTGRES_AUTH_POOL_SIZE: Annotated[int, Gt(0)] = 2
+    POSTGRES_AUTH_POOL_MAX_OVERFLOW: int = 0
+    POSTGRES_AUTH_POOL_TIMEOUT_SECONDS: float = 5
+    POSTGRES_AUTH_POOL_RECYCLE_SECONDS: int = 1800
+    POSTGRES_AUTH_CONNECT_TIMEOUT_SECONDS: float = 5
+    POSTGRES_AUTH_STATEMENT_TIMEOUT_SECONDS: float = 5
 
 
 class PostgresOuterAuth(OuterAuthMeta):
     prefix = '/postgres'
     settings = PostgresOuterAuthSettings()
-    __sessionmaker: type[Session] | None = None
+    __engine: AsyncEngine | None = None
 
     @classmethod
-    @contextmanager
-    def _session(cls) -> Generator[Session, None, None]:
-        if not cls.__sessionmaker:
-            engine = create_engine(str(cls.settings.POSTGRES_AUTH_DB_DSN), pool_pre_ping=True)
-            cls.__sessionmaker = sessionmaker(engine)
-        with cls.__sessionmaker() as conn:
-            conn: Session
-            with conn.begin():
-                yield conn
+    def _engine(cls) -> AsyncEngine:
+        """Пул соединений с внешней БД, создается при первом обращении"""
+        if cls.__engine is None:
+            statement_timeout = cls.settings.POSTGRES_AUTH_STATEMENT_TIMEOUT_SECONDS
+            cls.__engine = create_async_engine(
+                async_dsn(str(cls.settings.POSTGRES_AUTH_DB_DSN)),
+                pool_size=cls.settings.POSTGRES_AUTH_POOL_SIZE,
+                max_overflow=cls.settings.POSTGRES_AUTH_POOL_MAX_OVERFLOW,
+                pool_timeout=cls.settings.POSTGRES_AUTH_POOL_TIMEOUT_SECONDS,
+                pool_recycle=cls.settings.POSTGRES_AUTH_POOL_RECYCLE_SECONDS,
+                pool_pre_ping=True,
+                connect_args={
+                    "timeout": cls.settings.POSTGRES_AUTH_CONNECT_TIMEOUT_SECONDS,
+                    # Таймаут и на сервере, и на клиенте: зависший запрос не держит соединение из пула
+                    "command_timeout": statement_timeout,
+                    "server_settings": {"statement_timeout": str(int(statement_timeout * 1000))},
+                },
+            )
+        return cls.__engine
+
+    @classmethod
+    async def dispose(cls) -> None:
+        """Закрывает пул соединений, если он был создан"""
+        engine, cls.__engine = cls.__engine, None
+        if engine is not None:
+            await engine.dispose()
+
+    @classmethod
+    @asynccontextmanager
+    async def _connection(cls) -> AsyncIterator[AsyncConnection]:
+        async with cls._engine().begin() as conn:
+            yield conn
 
     @classmethod
     async def _is_outer_user_exists(cls, username: str) -> bool:
         """Проверяет наличие пользователя в Postgres"""
         logger.debug("_is_outer_user_exists class=%s started", cls.get_name())
-        with cls._session() as session:
-            exists = session.execute(
+        async with cls._connection() as conn:
+            exists = await conn.scalar(
                 text("SELECT 1 FROM pg_roles WHERE rolname=:username;"),
                 {"username": username},
-            ).scalar()  # returns 1 or None
+            )  # returns 1 or None
         return bool(exists)
 
     @classmethod
     async def _update_outer_user_password(cls, username: str, password: str):
         """Устанавливает пользователю новый пароль в Postgres"""
         logger.debug("_update_outer_user_password class=%s started", cls.get_name())
-        try:
-            with cls._session() as session:
-                if len(re.findall(r"\W", username)) > 0:
-                    raise ValueError(f"Username {username} contains invalid characters")
-                res: Result = session.execute(
-                    text(f"ALTER USER {username} WITH PASSWORD :password;"),
-                    {"password": password},
-                )
-                logger.debug("_update_outer_user_password class=%s response %s", cls.get_name(), str(res))
-            logger.info("User %s updated in Postgres", username)
-        except:
-            logger.error("User %s can't be updated in Postgres", username)
+        if len(re.findall(r"\W", username)) > 0:
+            # Повтор не поможет, поэтому не падаем
+            logger.error("User %s can't be updated in Postgres: username contains invalid characters", username)
+            return
+        async with cls._connection() as conn:
+            # ALTER USER не принимает параметры запроса, пароль подставляется экранированной строкой
+            stmt = text(f"ALTER USER {username} WITH PASSWORD :password").bindparams(
+                bindparam("password", password, type_=String)
+            )
+            sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+            res = await conn.exec_driver_sql(sql)
+            logger.debug("_update_outer_user_password class=%s response %s", cls.get_name(), str(res))
+        logger.info("User %s updated in Postgres", username)
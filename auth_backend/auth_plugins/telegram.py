@@ -7,13 +7,11 @@ from urllib.parse import unquote
 import jwt
 from event_schema.auth import UserLogin
 from fastapi import Depends
-from fastapi.background import BackgroundTasks
 from fastapi_sqlalchemy import db
 from pydantic import BaseModel
 
 from auth_backend.auth_method import AuthPluginMeta, OauthMeta, Session
 from auth_backend.exceptions import AlreadyExists, OauthAuthFailed
-from auth_backend.kafka.kafka import get_kafka_producer
 from auth_backend.models.db import User, UserSession
 from auth_backend.schemas.types.scopes import Scope
 from auth_backend.settings import Settings
@@ -50,7 +48,6 @@ class TelegramAuth(OauthMeta):
     async def _register(
         cls,
         user_inp: TGAuthResponseSchema,
-        background_tasks: BackgroundTasks,
         user_session: UserSession = Depends(UnionAuth(auto_error=True, scopes=[], allow_none=True)),
     ) -> Session:
         """Добавление метода аутентификации через (виджет) Телеграма."""
@@ -74,13 +71,8 @@ class TelegramAuth(OauthMeta):
         tg_auth = cls.create_auth_method_param('user_id', tg_user_id, user.id, db_session=db.session)
         new_user[cls.get_name()] = {"user_id": tg_auth.value}
         userdata = await TelegramAuth._convert_data_to_userdata_format(userinfo)
-        background_tasks.add_task(
-            get_kafka_producer().produce,
-            cls.settings.KAFKA_USER_LOGIN_TOPIC_NAME,
-            TelegramAuth.generate_kafka_key(user.id),
-            userdata,
-        )
-        await AuthPluginMeta.user_updated(new_user, old_user)
+        TelegramAuth.publish_userdata(user.id, userdata, db_session=db.session)
+        await AuthPluginMeta.user_updated(new_user, old_user, session=db.session)
         return await cls._create_session(
             user,
             user_inp.scopes,
@@ -89,7 +81,7 @@ class TelegramAuth(OauthMeta):
         )
 
     @classmethod
-    async def _login(cls, user_inp: TGAuthResponseSchema, background_tasks: BackgroundTasks) -> Session:
+    async def _login(cls, user_inp: TGAuthResponseSchema) -> Session:
         """Вход в пользователя с помощью аккаунта ТГ.
 
         Производит вход, если находит пользователя по id (из Телеграма). Если аккаунт не
@@ -108,12 +100,7 @@ class TelegramAuth(OauthMeta):
                 'No users found for Telegram account', 'Не найдено пользователей с таким ТГ аккаунтом', id_token
             )
         userdata = await TelegramAuth._convert_data_to_userdata_format(userinfo)
-        background_tasks.add_task(
-            get_kafka_producer().produce,
-            cls.settings.KAFKA_USER_LOGIN_TOPIC_NAME,
-            TelegramAuth.generate_kafka_key(user.id),
-            userdata,
-        )
+        TelegramAuth.publish_userdata(user.id, userdata, db_session=db.session)
         return await cls._create_session(
             user,
             user_inp.scopes,
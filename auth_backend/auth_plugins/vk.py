@@ -2,19 +2,17 @@ import logging
 from typing import Any
 from urllib.parse import quote
 
-import aiohttp
 import jwt
 from event_schema.auth import UserLogin
 from fastapi import Depends
-from fastapi.background import BackgroundTasks
 from fastapi_sqlalchemy import db
 from pydantic import BaseModel, Field
 
 from auth_backend.auth_method import AuthPluginMeta, OauthMeta, Session
 from auth_backend.exceptions import AlreadyExists, OauthAuthFailed
-from auth_backend.kafka.kafka import get_kafka_producer
 from auth_backend.models.db import User, UserSession
 from auth_backend.settings import Settings
+from auth_backend.utils.http import http_client
 from auth_backend.utils.security import UnionAuth
 from auth_backend.utils.string import concantenate_strings
 
@@ -58,7 +56,6 @@ class VkAuth(OauthMeta):
     async def _register(
         cls,
         user_inp: OauthResponseSchema,
-        background_tasks: BackgroundTasks,
         user_session: UserSession = Depends(UnionAuth(auto_error=True, scopes=[], allow_none=True)),
     ) -> Session:
         """Создает аккаунт или привязывает существующий
@@ -78,22 +75,22 @@ class VkAuth(OauthMeta):
         vk_user_id = None
         userinfo = None
         if user_inp.id_token is None:
-            async with aiohttp.ClientSession() as session:
-                async with session.get('https://oauth.vk.com/access_token', params=payload) as response:
-                    token_result = await response.json()
-                    logger.debug(token_result)
-                if 'access_token' not in token_result:
-                    raise OauthAuthFailed('Invalid credentials for VK account', 'Неправильные учетные данные')
-                token = token_result['access_token']
-
-                async with session.get(
-                    'https://api.vk.com/method/users.get?',
-                    params={"v": '5.131', 'fields': ','.join(cls.settings.VK_USERDATA)},
-                    headers={"Authorization": f"Bearer {token}"},
-                ) as response:
-                    userinfo = await response.json()
-                    logger.debug(userinfo)
-                    vk_user_id = userinfo['response'][0]['id']
+            session = http_client(cls.get_name())
+            async with session.get('https://oauth.vk.com/access_token', params=payload) as response:
+                token_result = await response.json()
+                logger.debug(token_result)
+            if 'access_token' not in token_result:
+                raise OauthAuthFailed('Invalid credentials for VK account', 'Неправильные учетные данные')
+            token = token_result['access_token']
+
+            async with session.get(
+                'https://api.vk.com/method/users.get?',
+                params={"v": '5.131', 'fields': ','.join(cls.settings.VK_USERDATA)},
+                headers={"Authorization": f"Bearer {token}"},
+            ) as response:
+                userinfo = await response.json()
+                logger.debug(userinfo)
+                vk_user_id = userinfo['response'][0]['id']
         else:
             userinfo = jwt.decode(user_inp.id_token, cls.settings.ENCRYPTION_KEY, algorithms=["HS256"])
             vk_user_id = userinfo['response'][0]['id']
@@ -112,13 +109,8 @@ class VkAuth(OauthMeta):
         vk_id = cls.create_auth_method_param('user_id', vk_user_id, user.id, db_session=db.session)
         new_user[cls.get_name()] = {"user_id": vk_id.value}
         userdata = await VkAuth._convert_data_to_userdata_format(userinfo['response'][0])
-        background_tasks.add_task(
-            get_kafka_producer().produce,
-            cls.settings.KAFKA_USER_LOGIN_TOPIC_NAME,
-            VkAuth.generate_kafka_key(user.id),
-            userdata,
-        )
-        await AuthPluginMeta.user_updated(new_user, old_user)
+        VkAuth.publish_userdata(user.id, userdata, db_session=db.session)
+        await AuthPluginMeta.user_updated(new_user, old_user, session=db.session)
         return await cls._create_session(
             user,
             user_inp.scopes,
@@ -127,7 +119,7 @@ class VkAuth(OauthMeta):
         )
 
     @classmethod
-    async def _login(cls, user_inp: OauthResponseSchema, background_tasks: BackgroundTasks) -> Session:
+    async def _login(cls, user_inp: OauthResponseSchema) -> Session:
         """Вход в пользователя с помощью аккаунта https://lk.msu.ru
 
         Производит вход, если находит пользователя по уникаотному идендификатору. Если аккаунт не
@@ -141,22 +133,22 @@ class VkAuth(OauthMeta):
         }
         vk_user_id = None
         userinfo = None
-        async with aiohttp.ClientSession() as session:
-            async with session.get('https://oauth.vk.com/access_token', params=payload) as response:
-                token_result = await response.json()
-                logger.debug(token_result)
-            if 'access_token' not in token_result:
-                raise OauthAuthFailed('Invalid credentials for VK account', 'Неправильные учетные данные')
-            token = token_result['access_token']
-
-            async with session.get(
-                'https://api.vk.com/method/users.get?',
-                params={"v": '5.131', 'fields': ','.join(cls.settings.VK_USERDATA)},
-                headers={"Authorization": f"Bearer {token}"},
-            ) as response:
-                userinfo = await response.json()
-                logger.debug(userinfo)
-                vk_user_id = userinfo['response'][0]['id']
+        session = http_client(cls.get_name())
+        async with session.get('https://oauth.vk.com/access_token', params=payload) as response:
+            token_result = await response.json()
+            logger.debug(token_result)
+        if 'access_token' not in token_result:
+            raise OauthAuthFailed('Invalid credentials for VK account', 'Неправильные учетные данные')
+        token = token_result['access_token']
+
+        async with session.get(
+            'https://api.vk.com/method/users.get?',
+            params={"v": '5.131', 'fields': ','.join(cls.settings.VK_USERDATA)},
+            headers={"Authorization": f"Bearer {token}"},
+        ) as response:
+            userinfo = await response.json()
+            logger.debug(userinfo)
+            vk_user_id = userinfo['response'][0]['id']
 
         user = await cls._get_user('user_id', vk_user_id, db_session=db.session)
         if not user:
@@ -165,12 +157,7 @@ class VkAuth(OauthMeta):
                 'No users found for VK account', 'Не найдено пользователей с таким аккаунтом ВК', id_token
             )
         userdata = await VkAuth._convert_data_to_userdata_format(userinfo['response'][0])
-        background_tasks.add_task(
-            get_kafka_producer().produce,
-            cls.settings.KAFKA_USER_LOGIN_TOPIC_NAME,
-            VkAuth.generate_kafka_key(user.id),
-            userdata,
-        )
+        VkAuth.publish_userdata(user.id, userdata, db_session=db.session)
         return await cls._create_session(
             user,
             user_inp.scopes,
@@ -202,13 +189,13 @@ class VkAuth(OauthMeta):
                 'group_id': group_id,
                 'fields': 'name',
             }
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    'https://api.vk.com/method/groups.getById?',
-                    params=payload,
-                ) as response:
-                    company_info = await response.json()
-                    company_name = company_info.get('response', [{}])[0].get('name')
+            session = http_client(cls.get_name())
+            async with session.get(
+                'https://api.vk.com/method/groups.getById?',
+                params=payload,
+            ) as response:
+                company_info = await response.json()
+                company_name = company_info.get('response', [{}])[0].get('name')
         return [
             {"category": "Карьера", "param": "Место работы", "value": company_name},
             {"category": "Карьера", "param": "Расположение работы", "value": career[0].get("city_name")},
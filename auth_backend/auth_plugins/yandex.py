@@ -2,20 +2,18 @@ import logging
 from typing import Any
 from urllib.parse import quote
 
-import aiohttp
 import jwt
 from event_schema.auth import UserLogin
 from fastapi import Depends
-from fastapi.background import BackgroundTasks
 from fastapi_sqlalchemy import db
 from pydantic import BaseModel, Field
 
 from auth_backend.auth_method import AuthPluginMeta, OauthMeta, Session
 from auth_backend.exceptions import AlreadyExists, OauthAuthFailed
-from auth_backend.kafka.kafka import get_kafka_producer
 from auth_backend.models.db import User, UserSession
 from auth_backend.schemas.types.scopes import Scope
 from auth_backend.settings import Settings
+from auth_backend.utils.http import http_client
 from auth_backend.utils.security import UnionAuth
 from auth_backend.utils.string import concantenate_strings
 
@@ -45,7 +43,6 @@ class YandexAuth(OauthMeta):
     async def _register(
         cls,
         user_inp: OauthResponseSchema,
-        background_tasks: BackgroundTasks,
         user_session: UserSession = Depends(UnionAuth(auto_error=True, scopes=[], allow_none=True)),
     ) -> Session:
         """Создает аккаунт или привязывает существующий
@@ -66,22 +63,20 @@ class YandexAuth(OauthMeta):
         userinfo = None
         yandex_user_id = None
         if user_inp.id_token is None:
-            async with aiohttp.ClientSession(headers=header) as session:
-                async with session.post("https://oauth.yandex.ru/token", data=payload) as response:
-                    token_result = await response.json()
-                    logger.debug(token_result)
-                    if 'access_token' not in token_result:
-                        raise OauthAuthFailed('Invalid credentials for Yandex account', 'Неправильные учетные данные')
-                    token = token_result['access_token']
-
-                get_headers = {"Authorization": f"OAuth {token}"}
-                get_payload = {"format": "json"}
-                async with session.get(
-                    "https://login.yandex.ru/info?", headers=get_headers, data=get_payload
-                ) as response:
-                    userinfo = await response.json()
-                    logger.debug(userinfo)
-                    yandex_user_id = userinfo['id']
+            session = http_client(cls.get_name())
+            async with session.post("https://oauth.yandex.ru/token", headers=header, data=payload) as response:
+                token_result = await response.json()
+                logger.debug(token_result)
+                if 'access_token' not in token_result:
+                    raise OauthAuthFailed('Invalid credentials for Yandex account', 'Неправильные учетные данные')
+                token = token_result['access_token']
+
+            get_headers = {**header, "Authorization": f"OAuth {token}"}
+            get_payload = {"format": "json"}
+            async with session.get("https://login.yandex.ru/info?", headers=get_headers, data=get_payload) as response:
+                userinfo = await response.json()
+                logger.debug(userinfo)
+                yandex_user_id = userinfo['id']
         else:
             userinfo = jwt.decode(user_inp.id_token, cls.settings.ENCRYPTION_KEY, algorithms=["HS256"])
             yandex_user_id = userinfo['id']
@@ -117,13 +112,8 @@ class YandexAuth(OauthMeta):
         ya_id = cls.create_auth_method_param('user_id', yandex_user_id, user.id, db_session=db.session)
         new_user[cls.get_name()] = {"user_id": ya_id.value}
         userdata = await YandexAuth._convert_data_to_userdata_format(userinfo)
-        background_tasks.add_task(
-            get_kafka_producer().produce,
-            cls.settings.KAFKA_USER_LOGIN_TOPIC_NAME,
-            YandexAuth.generate_kafka_key(user.id),
-            userdata,
-        )
-        await AuthPluginMeta.user_updated(new_user, old_user)
+        YandexAuth.publish_userdata(user.id, userdata, db_session=db.session)
+        await AuthPluginMeta.user_updated(new_user, old_user, session=db.session)
         return await cls._create_session(
             user,
             user_inp.scopes,
@@ -132,7 +122,7 @@ class YandexAuth(OauthMeta):
         )
 
     @classmethod
-    async def _login(cls, user_inp: OauthResponseSchema, background_tasks: BackgroundTasks) -> Session:
+    async def _login(cls, user_inp: OauthResponseSchema) -> Session:
         """Вход в пользователя с помощью аккаунта Yandex
         Производит вход, если находит пользователя по уникаотному идендификатору. Если аккаунт не
         найден, возвращает ошибка.
@@ -146,20 +136,20 @@ class YandexAuth(OauthMeta):
         }
         userinfo = None
         yandex_user_id = None
-        async with aiohttp.ClientSession(headers=header) as session:
-            async with session.post("https://oauth.yandex.ru/token", data=payload) as response:
-                token_result = await response.json()
-                logger.debug(token_result)
-            if 'access_token' not in token_result:
-                raise OauthAuthFailed('Invalid credentials for Yandex account', 'Неправильные учетные данные')
-            token = token_result['access_token']
-
-            get_headers = {"Authorization": f"OAuth {token}"}
-            get_payload = {"format": "json"}
-            async with session.get("https://login.yandex.ru/info?", headers=get_headers, data=get_payload) as response:
-                userinfo = await response.json()
-                logger.debug(userinfo)
-                yandex_user_id = userinfo['id']
+        session = http_client(cls.get_name())
+        async with session.post("https://oauth.yandex.ru/token", headers=header, data=payload) as response:
+            token_result = await response.json()
+            logger.debug(token_result)
+        if 'access_token' not in token_result:
+            raise OauthAuthFailed('Invalid credentials for Yandex account', 'Неправильные учетные данные')
+        token = token_result['access_token']
+
+        get_headers = {**header, "Authorization": f"OAuth {token}"}
+        get_payload = {"format": "json"}
+        async with session.get("https://login.yandex.ru/info?", headers=get_headers, data=get_payload) as response:
+            userinfo = await response.json()
+            logger.debug(userinfo)
+            yandex_user_id = userinfo['id']
 
         user = await cls._get_user('user_id', yandex_user_id, db_session=db.session)
 
@@ -169,12 +159,7 @@ class YandexAuth(OauthMeta):
                 'No users found for Yandex account', 'Не найдено пользователей для аккаунт Яндекс', id_token
             )
         userdata = await YandexAuth._convert_data_to_userdata_format(userinfo)
-        background_tasks.add_task(
-            get_kafka_producer().produce,
-            cls.settings.KAFKA_USER_LOGIN_TOPIC_NAME,
-            YandexAuth.generate_kafka_key(user.id),
-            userdata,
-        )
+        YandexAuth.publish_userdata(user.id, userdata, db_session=db.session)
         return await cls._create_session(
             user,
             user_inp.scopes,
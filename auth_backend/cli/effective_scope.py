@@ -0,0 +1,22 @@
+import errno
+
+from sqlalchemy.orm import Session
+
+from auth_backend.models.db import UserEffectiveScope
+
+
+def rebuild_effective_scopes(session: Session) -> None:
+    UserEffectiveScope.rebuild(session=session)
+    session.commit()
+    print("Rebuilt user_effective_scope")
+
+
+def verify_effective_scopes(session: Session) -> None:
+    missing, extra = UserEffectiveScope.diff(session=session)
+    for user_id, scope_id in sorted(missing):
+        print(f"Missing: user_id={user_id}, scope_id={scope_id}")
+    for user_id, scope_id in sorted(extra):
+        print(f"Extra: user_id={user_id}, scope_id={scope_id}")
+    if missing or extra:
+        exit(errno.EIO)
+    print("user_effective_scope is consistent")
@@ -0,0 +1,8 @@
+import asyncio
+
+from auth_backend.utils.async_db import get_async_sessionmaker
+from auth_backend.utils.email_outbox import run_email_outbox_worker
+
+
+def run_email_worker(batch_size: int, poll_interval: float) -> None:
+    asyncio.run(run_email_outbox_worker(get_async_sessionmaker(), batch_size, poll_interval))
@@ -2,7 +2,7 @@ import errno
 
 from sqlalchemy.orm import Session
 
-from auth_backend.models.db import Group, GroupScope
+from auth_backend.models.db import Group, GroupClosure, GroupScope
 
 
 def create_group(name: str, scopes: str, parent_id: int, session: Session) -> None:
@@ -10,7 +10,7 @@ def create_group(name: str, scopes: str, parent_id: int, session: Session) -> No
         print("Group already exists")
         exit(errno.EIO)
     group = Group.create(name=name, parent_id=parent_id, session=session)
-    session.flush()
+    GroupClosure.add_group(group.id, int(parent_id) if parent_id else None, session=session)
     for id in scopes:
         session.add(GroupScope(group_id=group.id, scope_id=id))
     session.commit()
@@ -0,0 +1,44 @@
+import time
+
+from auth_backend.utils.password import PasswordHasher, Pbkdf2Sha256Hasher, ScryptHasher
+
+
+def measure(hasher: PasswordHasher, rounds: int = 3) -> float:
+    """Лучшее время одного хеширования в секундах"""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        hasher.digest("calibration-password", "calibration-salt")
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def calibrate(algorithm: str, target_ms: float) -> PasswordHasher:
+    """Подбирает стоимость хеширования под целевое время на этой машине"""
+    target = target_ms / 1000
+    if algorithm == Pbkdf2Sha256Hasher.algorithm:
+        # Время PBKDF2 линейно по числу итераций
+        probe = Pbkdf2Sha256Hasher(iterations=10_000)
+        iterations = int(probe.iterations * target / measure(probe))
+        return Pbkdf2Sha256Hasher(iterations=max(1_000, iterations // 1_000 * 1_000))
+    if algorithm == ScryptHasher.algorithm:
+        # n должно быть степенью двойки, берем наибольшее, которое укладывается в цель
+        hasher = ScryptHasher(n=2**10, r=8, p=1)
+        while True:
+            candidate = ScryptHasher(n=hasher.n * 2, r=hasher.r, p=hasher.p)
+            if measure(candidate) > target:
+                return hasher
+            hasher = candidate
+    raise ValueError(f"Unknown password hasher {algorithm}")
+
+
+def calibrate_password_hasher(algorithm: str, target_ms: float) -> None:
+    hasher = calibrate(algorithm, target_ms)
+    print(f"{hasher!r}: {measure(hasher) * 1000:.1f} ms per hash, target {target_ms:.1f} ms")
+    print(f"PASSWORD_HASHER={hasher.algorithm}")
+    if isinstance(hasher, Pbkdf2Sha256Hasher):
+        print(f"PASSWORD_PBKDF2_ITERATIONS={hasher.iterations}")
+    else:
+        print(f"PASSWORD_SCRYPT_N={hasher.n}")
+        print(f"PASSWORD_SCRYPT_R={hasher.r}")
+        print(f"PASSWORD_SCRYPT_P={hasher.p}")
@@ -3,13 +3,21 @@ import argparse
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
+from auth_backend.kafka.outbox import run_kafka_outbox_relay
 from auth_backend.settings import get_settings
+from auth_backend.utils.metrics import start_metrics_server
+from auth_backend.utils.password import PASSWORD_HASHERS
 
 from ..routes import app
+from .effective_scope import rebuild_effective_scopes, verify_effective_scopes
+from .email_outbox import run_email_worker
 from .group import create_group
+from .password import calibrate_password_hasher
+from .rate_limit import cleanup_rate_limits
 from .scope import create_scope
 from .user import create_user
 from .user_group import create_user_group
+from .user_update import run_user_update_queue
 
 settings = get_settings()
 engine = create_engine(str(settings.DB_DSN))
@@ -47,12 +55,54 @@ def get_args():
     user_group_create = user_group_subparsers.add_parser("create")
     user_group_create.add_argument('--email', type=str, required=True)
 
+    effective_scope = subparsers.add_parser("effective_scope")
+    effective_scope_subparsers = effective_scope.add_subparsers(dest='subcommand')
+    effective_scope_subparsers.add_parser("rebuild")
+    effective_scope_subparsers.add_parser("verify")
+
+    password = subparsers.add_parser("password")
+    password_subparsers = password.add_subparsers(dest='subcommand')
+    password_calibrate = password_subparsers.add_parser("calibrate")
+    password_calibrate.add_argument(
+        '--algorithm', type=str, choices=sorted(PASSWORD_HASHERS), default=settings.PASSWORD_HASHER
+    )
+    password_calibrate.add_argument('--target_ms', type=float, default=250)
+
+    rate_limit = subparsers.add_parser("rate_limit")
+    rate_limit_subparsers = rate_limit.add_subparsers(dest='subcommand')
+    rate_limit_subparsers.add_parser("cleanup")
+
+    email_outbox = subparsers.add_parser("email_outbox")
+    email_outbox_subparsers = email_outbox.add_subparsers(dest='subcommand')
+    email_outbox_worker = email_outbox_subparsers.add_parser("worker")
+    email_outbox_worker.add_argument('--batch_size', type=int, default=settings.EMAIL_OUTBOX_BATCH_SIZE)
+    email_outbox_worker.add_argument('--poll_interval', type=float, default=settings.EMAIL_OUTBOX_POLL_INTERVAL_SECONDS)
+    email_outbox_worker.add_argument('--metrics_port', type=int, default=settings.METRICS_PORT)
+
+    kafka_outbox = subparsers.add_parser("kafka_outbox")
+    kafka_outbox_subparsers = kafka_outbox.add_subparsers(dest='subcommand')
+    kafka_outbox_relay = kafka_outbox_subparsers.add_parser("relay")
+    kafka_outbox_relay.add_argument('--batch_size', type=int, default=settings.KAFKA_OUTBOX_BATCH_SIZE)
+    kafka_outbox_relay.add_argument('--poll_interval', type=float, default=settings.KAFKA_OUTBOX_POLL_INTERVAL_SECONDS)
+    kafka_outbox_relay.add_argument('--metrics_port', type=int, default=settings.METRICS_PORT)
+
+    user_update = subparsers.add_parser("user_update")
+    user_update_subparsers = user_update.add_subparsers(dest='subcommand')
+    user_update_worker = user_update_subparsers.add_parser("worker")
+    user_update_worker.add_argument('--batch_size', type=int, default=settings.USER_UPDATE_QUEUE_BATCH_SIZE)
+    user_update_worker.add_argument(
+        '--poll_interval', type=float, default=settings.USER_UPDATE_QUEUE_POLL_INTERVAL_SECONDS
+    )
+    user_update_worker.add_argument('--metrics_port', type=int, default=settings.METRICS_PORT)
+
     return parser.parse_args()
 
 
 def process() -> None:
     args = get_args()
     session = Session()
+    if getattr(args, "metrics_port", None) is not None:
+        start_metrics_server(args.metrics_port)
     if args.command == "start":
         import uvicorn
 
@@ -69,3 +119,24 @@ def process() -> None:
     elif args.command == 'user_group' and args.subcommand == 'create':
         print(f'Creating user_group with params {args}')
         create_user_group(args.email, session)
+    elif args.command == 'effective_scope' and args.subcommand == 'rebuild':
+        print('Rebuilding user_effective_scope')
+        rebuild_effective_scopes(session)
+    elif args.command == 'effective_scope' and args.subcommand == 'verify':
+        print('Verifying user_effective_scope')
+        verify_effective_scopes(session)
+    elif args.command == 'password' and args.subcommand == 'calibrate':
+        print(f'Calibrating password hasher with params {args}')
+        calibrate_password_hasher(args.algorithm, args.target_ms)
+    elif args.command == 'rate_limit' and args.subcommand == 'cleanup':
+        print('Deleting expired rate limit windows')
+        cleanup_rate_limits(session)
+    elif args.command == 'email_outbox' and args.subcommand == 'worker':
+        print(f'Starting email outbox worker with params {args}')
+        run_email_worker(args.batch_size, args.poll_interval)
+    elif args.command == 'kafka_outbox' and args.subcommand == 'relay':
+        print(f'Starting Kafka outbox relay with params {args}')
+        run_kafka_outbox_relay(Session, args.batch_size, args.poll_interval)
+    elif args.command == 'user_update' and args.subcommand == 'worker':
+        print(f'Starting user update worker with params {args}')
+        run_user_update_queue(Session, args.batch_size, args.poll_interval)
@@ -0,0 +1,9 @@
+from sqlalchemy.orm import Session
+
+from auth_backend.models.db import RateLimitWindow
+
+
+def cleanup_rate_limits(session: Session) -> None:
+    deleted = RateLimitWindow.cleanup(session=session)
+    session.commit()
+    print(f"Deleted {deleted} expired rate limit windows")
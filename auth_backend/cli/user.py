@@ -4,6 +4,7 @@ from sqlalchemy.orm import Session
 
 from auth_backend.auth_plugins import Email
 from auth_backend.models import AuthMethod, User
+from auth_backend.utils.password import hash_password
 from auth_backend.utils.string import random_string
 
 
@@ -24,7 +25,7 @@ def create_user(email: str, password: str, session: Session) -> None:
     password = AuthMethod.create(
         user_id=user.id,
         param="hashed_password",
-        value=Email._hash_password(password, _salt),
+        value=hash_password(password, _salt),
         auth_method=Email.get_name(),
         session=session,
     )
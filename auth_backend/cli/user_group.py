@@ -2,7 +2,7 @@ import errno
 
 from sqlalchemy.orm import Session
 
-from auth_backend.models.db import AuthMethod, Group, UserGroup
+from auth_backend.models.db import AuthMethod, Group, UserEffectiveScope, UserGroup
 
 
 def create_user_group(email: str, session: Session) -> None:
@@ -21,5 +21,6 @@ def create_user_group(email: str, session: Session) -> None:
         print("User already in group")
         exit(errno.EIO)
     session.add(user_group := UserGroup(user_id=user_id, group_id=group_id))
+    UserEffectiveScope.refresh_users([user_id], session=session)
     session.commit()
     print(f"Created user_group: {user_group}")
@@ -0,0 +1,14 @@
+import asyncio
+
+from fastapi_sqlalchemy import DBSessionMiddleware
+from sqlalchemy.orm import sessionmaker
+
+from auth_backend.auth_method import AuthPluginMeta
+from auth_backend.auth_method.user_update import run_user_update_worker
+
+
+def run_user_update_queue(session_factory: sessionmaker, batch_size: int, poll_interval: float) -> None:
+    # Методы входа берут db.session, вне HTTP-запросов фабрику сессий настраиваем сами
+    DBSessionMiddleware(None, custom_engine=session_factory.kw["bind"])
+    methods = {method.get_name(): method for method in AuthPluginMeta.active_auth_methods()}
+    asyncio.run(run_user_update_worker(session_factory, methods, batch_size, poll_interval))
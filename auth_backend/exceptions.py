@@ -57,12 +57,21 @@ class OauthCredentialsIncorrect(AuthAPIError):
         super().__init__(error_eng, error_ru)
 
 
-class TooManyEmailRequests(AuthAPIError):
+class TooManyRequests(AuthAPIError):
     delay_time: datetime.timedelta
 
-    def __init__(self, dtime: datetime.timedelta):
+    def __init__(self, dtime: datetime.timedelta, eng: str | None = None, ru: str | None = None):
         self.delay_time = dtime
         super().__init__(
+            eng or f'Too many requests. Delay: {dtime}',
+            ru or f'Слишком много запросов. Задержка: {dtime}',
+        )
+
+
+class TooManyEmailRequests(TooManyRequests):
+    def __init__(self, dtime: datetime.timedelta):
+        super().__init__(
+            dtime,
             f'Too many email requests. Delay: {dtime}',
             f'Слишком много запросов к email. Задержка: {dtime}',
         )
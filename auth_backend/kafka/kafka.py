@@ -1,6 +1,9 @@
 import logging
+import threading
+import time
+from collections import deque
 from functools import lru_cache
-from typing import Any
+from typing import Any, Callable
 
 from confluent_kafka import KafkaError, KafkaException, Message, Producer
 from event_schema.auth import UserLogin, UserLoginKey
@@ -8,10 +11,55 @@ from event_schema.auth import UserLogin, UserLoginKey
 from auth_backend import __version__
 from auth_backend.kafka.kafkameta import KafkaMeta
 from auth_backend.settings import get_settings
+from auth_backend.utils.metrics import get_metrics
 
 log = logging.getLogger(__name__)
 
 
+class TopicCache:
+    """Список топиков кластера с временем жизни
+
+    Устаревший список обновляется в фоновом потоке, до конца обновления отдается старый.
+    Пока список не получен ни разу, `get` отдает None
+    """
+
+    def __init__(self, fetch: Callable[[], set[str]], ttl: float, on_refresh: Callable[[], None] | None = None) -> None:
+        self._fetch = fetch
+        self._ttl = ttl
+        self._on_refresh = on_refresh
+        self._topics: frozenset[str] | None = None
+        self._expires = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def get(self) -> frozenset[str] | None:
+        if time.monotonic() >= self._expires:
+            self.refresh_in_background()
+        return self._topics
+
+    def refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self.refresh, name="kafka-topics", daemon=True).start()
+
+    def refresh(self) -> None:
+        try:
+            self._topics = frozenset(self._fetch())
+            self._expires = time.monotonic() + self._ttl
+            get_metrics().inc("kafka_topic_cache_refresh_total")
+        except Exception as e:
+            # Повторим при следующем сообщении, пока живем со старым списком
+            log.warning(f"Failed to fetch Kafka topics: {e!r}")
+            get_metrics().inc("kafka_topic_cache_refresh_errors_total")
+        finally:
+            with self._lock:
+                self._refreshing = False
+        if self._topics is not None and self._on_refresh:
+            self._on_refresh()
+
+
 class Kafka(KafkaMeta):
     """
     Класс для работы с Kafka
@@ -26,6 +74,7 @@ class Kafka(KafkaMeta):
     _producer: Producer
 
     def __configurate(self) -> None:
+        settings = get_settings()
         if self.__devel:
             self.__conf = {"bootstrap.servers": self.__dsn}
         else:
@@ -36,12 +85,40 @@ class Kafka(KafkaMeta):
                 'sasl.username': self.__login,
                 'sasl.password': self.__password,
             }
+        # Сообщения копятся в локальной очереди и уходят пачками, колбэки вызывает поток `kafka-poll`
+        self.__conf |= {
+            'linger.ms': settings.KAFKA_LINGER_MS,
+            'batch.size': settings.KAFKA_BATCH_SIZE_BYTES,
+            'compression.type': settings.KAFKA_COMPRESSION_TYPE,
+            'queue.buffering.max.messages': settings.KAFKA_QUEUE_MAX_MESSAGES,
+            # Повторы внутри продюсера не меняют порядок сообщений одного ключа
+            'enable.idempotence': True,
+        }
 
     def __init__(self) -> None:
         self.__configurate()
         self._producer = Producer(self.__conf)
+        self._pending: deque[tuple[str, UserLoginKey, UserLogin]] = deque()
+        self._pending_lock = threading.Lock()
+        self._topics = TopicCache(
+            self._fetch_topics, get_settings().KAFKA_TOPICS_CACHE_TTL_SECONDS, on_refresh=self._flush_pending
+        )
+        self._topics.refresh_in_background()
+        self._stopped = threading.Event()
+        self._poller = threading.Thread(target=self._poll_loop, name="kafka-poll", daemon=True)
+        self._poller.start()
         log.info("Kafka init done")
 
+    def _poll_loop(self) -> None:
+        """Вызывает колбэки доставки независимо от того, идут ли запросы"""
+        interval = get_settings().KAFKA_POLL_INTERVAL_SECONDS
+        while not self._stopped.is_set():
+            self._producer.poll(interval)
+            get_metrics().set("kafka_queue_messages", len(self._producer))
+
+    def _fetch_topics(self) -> set[str]:
+        return set(self._producer.list_topics(timeout=get_settings().KAFKA_METADATA_TIMEOUT_SECONDS).topics)
+
     def delivery_callback(self, err: KafkaError, msg: Message) -> None:
         """
 
@@ -53,9 +130,13 @@ class Kafka(KafkaMeta):
             Ничего
         """
         if err:
+            get_metrics().inc("kafka_messages_failed_total")
             log.error('%% Message failed delivery: %s\n' % err)
         else:
+            get_metrics().inc("kafka_messages_delivered_total")
             log.info('%% Message delivered to %s [%d] @ %d\n' % (msg.topic(), msg.partition(), msg.offset()))
+        if (latency := msg.latency()) is not None:
+            get_metrics().observe("kafka_delivery_latency_seconds", latency)
 
     def produce(self, topic: str, key: UserLoginKey, value: UserLogin) -> None:
         """
@@ -68,26 +149,104 @@ class Kafka(KafkaMeta):
         Returns:
             Ничего
         """
-        if topic not in self._producer.list_topics().topics:
+        topics = self._topics.get()
+        if topics is None:
+            # Список топиков еще не получен, ждем его в фоне, не блокируя отправителя
+            self._enqueue(topic, key, value)
+            return
+        if topic not in topics:
+            get_metrics().inc("kafka_topic_cache_misses_total")
+            get_metrics().inc("kafka_messages_skipped_total")
             log.warning(f"Message {key=}, {value=} skipped due to {topic=} don't exists")
             return
-        try:
-            self._producer.produce(
-                topic, key=key.model_dump_json(), value=value.model_dump_json(), callback=self.delivery_callback
-            )
-        except KafkaException:
-            log.critical("Kafka is down")
+        get_metrics().inc("kafka_topic_cache_hits_total")
+        self._send(topic, key, value)
+
+    def _send(self, topic: str, key: UserLoginKey, value: UserLogin) -> None:
+        deadline = time.monotonic() + get_settings().KAFKA_QUEUE_FULL_TIMEOUT_SECONDS
+        while True:
+            try:
+                self._producer.produce(
+                    topic, key=key.model_dump_json(), value=value.model_dump_json(), callback=self.delivery_callback
+                )
+                get_metrics().inc("kafka_messages_queued_total")
+                return
+            except BufferError:
+                # Локальная очередь заполнена: ждем, пока брокер примет часть сообщений
+                if time.monotonic() >= deadline:
+                    get_metrics().inc("kafka_messages_failed_total")
+                    log.error(f"Message {key=} to {topic=} dropped, producer queue is full")
+                    return
+                self._producer.poll(0.05)
+            except KafkaException:
+                get_metrics().inc("kafka_messages_failed_total")
+                log.critical("Kafka is down")
+                return
 
-        self._producer.poll(0)
+    def _enqueue(self, topic: str, key: UserLoginKey, value: UserLogin) -> None:
+        with self._pending_lock:
+            if len(self._pending) >= get_settings().KAFKA_PENDING_MESSAGES:
+                dropped_topic, dropped_key, _ = self._pending.popleft()
+                get_metrics().inc("kafka_messages_skipped_total")
+                log.warning(f"Message {dropped_key=} to {dropped_topic=} dropped, pending queue is full")
+            self._pending.append((topic, key, value))
+            get_metrics().inc("kafka_messages_pending_total")
+
+    def _flush_pending(self) -> None:
+        """Отправляет сообщения, ждавшие списка топиков"""
+        with self._pending_lock:
+            pending, self._pending = self._pending, deque()
+        for topic, key, value in pending:
+            self.produce(topic, key, value)
+
+    def produce_batch(self, messages: list[tuple[str, str, str]], timeout: float) -> list[bool]:
+        """Отправляет пачку и ждет подтверждений до `timeout` секунд
+
+        Сообщения в топики, которых нет в кластере, пропускаются и считаются доставленными
+        """
+        delivered = [False] * len(messages)
+        topics = self._topics.get()
+
+        def on_delivery(index: int):
+            def callback(err: KafkaError, msg: Message) -> None:
+                self.delivery_callback(err, msg)
+                delivered[index] = err is None
+
+            return callback
+
+        for index, (topic, key, value) in enumerate(messages):
+            if topics is not None and topic not in topics:
+                get_metrics().inc("kafka_messages_skipped_total")
+                log.warning(f"Message {key=} skipped due to {topic=} don't exists")
+                delivered[index] = True
+                continue
+            try:
+                self._producer.produce(topic, key=key, value=value, callback=on_delivery(index))
+            except BufferError:
+                # Очередь заполнена, остальное отправим следующей пачкой
+                break
+            except KafkaException:
+                log.critical("Kafka is down")
+                break
+            get_metrics().inc("kafka_messages_queued_total")
+        self._producer.flush(timeout)
+        return delivered
 
     def close(self) -> None:
-        self._producer.flush()
+        self._stopped.set()
+        self._poller.join()
+        self._producer.flush(get_settings().KAFKA_TIMEOUT)
 
 
 class KafkaMock(KafkaMeta):
     def produce(self, topic: str, key: Any, value: Any) -> Any:
         log.debug(f"Kafka cluster disabled, debug msg: {topic=}, {key=}, {value=}")
 
+    def produce_batch(self, messages: list[tuple[str, str, str]], timeout: float) -> list[bool]:
+        for topic, key, value in messages:
+            self.produce(topic, key, value)
+        return [True] * len(messages)
+
     def close(self) -> None:
         return
 
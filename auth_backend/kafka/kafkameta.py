@@ -7,6 +7,11 @@ class KafkaMeta(ABC):
     def produce(self, topic: str, key: Any, value: Any) -> Any:
         raise NotImplementedError()
 
+    @abstractmethod
+    def produce_batch(self, messages: list[tuple[str, str, str]], timeout: float) -> list[bool]:
+        """Отправляет сериализованные сообщения `(topic, key, value)`, отдает признак доставки каждого"""
+        raise NotImplementedError()
+
     @abstractmethod
     def close(self) -> None:
         raise NotImplementedError()
@@ -0,0 +1,62 @@
+import logging
+import time
+
+from sqlalchemy import delete
+from sqlalchemy.orm import Session, sessionmaker
+
+from auth_backend.kafka.kafka import get_kafka_producer
+from auth_backend.models.db import KafkaOutbox
+from auth_backend.settings import get_settings
+from auth_backend.utils.metrics import get_metrics
+
+log = logging.getLogger(__name__)
+
+
+def relay_kafka_outbox(batch_size: int, *, session: Session) -> int:
+    """Отправляет одну пачку из `kafka_outbox` и удаляет доставленное, отдает число удаленных строк
+
+    Пачка уходит волнами: в волне не больше одного сообщения пользователя, следующее
+    отправляется только после подтверждения предыдущего. Если сообщение не доставлено,
+    следующие сообщения пользователя не отправляются и ждут повтора – порядок по пользователю сохраняется
+    """
+    rows = session.scalars(KafkaOutbox.batch_query(batch_size)).all()
+    if not rows:
+        session.rollback()
+        return 0
+    producer = get_kafka_producer()
+    timeout = get_settings().KAFKA_OUTBOX_DELIVERY_TIMEOUT_SECONDS
+    by_user: dict[int, list[KafkaOutbox]] = {}
+    for row in rows:
+        by_user.setdefault(row.user_id, []).append(row)
+    done = []
+    while by_user:
+        wave = [user_rows.pop(0) for user_rows in by_user.values()]
+        delivered = producer.produce_batch([(row.topic, row.key, row.value) for row in wave], timeout)
+        for row, ok in zip(wave, delivered):
+            if ok:
+                done.append(row.id)
+            else:
+                by_user.pop(row.user_id)
+        by_user = {user_id: user_rows for user_id, user_rows in by_user.items() if user_rows}
+    session.execute(delete(KafkaOutbox).where(KafkaOutbox.id.in_(done)))
+    session.commit()
+    get_metrics().inc("kafka_outbox_relayed_total", len(done))
+    if len(done) < len(rows):
+        log.warning(f"{len(rows) - len(done)} Kafka outbox messages will be retried")
+    return len(done)
+
+
+def run_kafka_outbox_relay(session_factory: sessionmaker, batch_size: int, poll_interval: float) -> None:
+    """Разбирает `kafka_outbox`, пока процесс не остановят"""
+    try:
+        while True:
+            try:
+                with session_factory() as session:
+                    relayed = relay_kafka_outbox(batch_size, session=session)
+            except Exception:
+                log.exception("Kafka outbox batch failed")
+                relayed = 0
+            if relayed < batch_size:
+                time.sleep(poll_interval)
+    finally:
+        get_kafka_producer().close()
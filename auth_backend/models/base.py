@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import asyncio
 import re
 from contextlib import asynccontextmanager
 from typing import AsyncIterator
@@ -8,13 +7,14 @@ from typing import AsyncIterator
 import sqlalchemy
 from sqlalchemy import Integer, not_
 from sqlalchemy.exc import NoResultFound
+from sqlalchemy.ext.asyncio import AsyncAttrs, AsyncSession
 from sqlalchemy.orm import Mapped, Query, Session, as_declarative, declared_attr, mapped_column
 
 from auth_backend.exceptions import AuthAPIError, ObjectNotFound
 
 
 @as_declarative()
-class Base:
+class Base(AsyncAttrs):
     """Base class for all database entities"""
 
     @declared_attr
@@ -81,39 +81,34 @@ class BaseDbModel(Base):
 
     @classmethod
     @asynccontextmanager
-    async def lock(cls, session: Session) -> AsyncIterator[Session]:
-        """
-        Сначала пытаемся захватить блокировку таблицы.
-
-        Так как используем синхронную алхимимю, сставим таймаут и не будем ждать больше него
+    async def lock(cls, session: AsyncSession, *keys: str) -> AsyncIterator[AsyncSession]:
+        """Транзакционные advisory-блокировки по ключам в пределах таблицы
 
-        Если удерживается блокировка другой корутиной, то в конце концов выйдем из ожидания по таймауту
-        и заблочим корутину асинхронным сном
+        Таблица не блокируется, чтение и запись по другим ключам идут параллельно.
+        Блокировки берутся в отсортированном порядке, чтобы не было взаимных блокировок,
+        и отпускаются вместе с завершением транзакции.
 
-        Таким образом дадим корутине, удерживающей блокировку, доделать свою работу
+        Ждем не дольше `lock_timeout`, чтобы не держать соединение из пула
         """
-        for _ in range(3):
-            nested = session.begin_nested()
-            session.execute(sqlalchemy.text("SET LOCAL lock_timeout = '0.2s';"))
-            try:
-                session.execute(sqlalchemy.text(f'LOCK TABLE {cls.__tablename__} IN ACCESS EXCLUSIVE MODE;'))
-            except sqlalchemy.exc.OperationalError:
-                nested.rollback()
-                await asyncio.sleep(1.5)
-            else:
-                break
-        else:
+        try:
+            await session.execute(sqlalchemy.text("SET LOCAL lock_timeout = '5s';"))
+            for key in sorted(set(keys)):
+                await session.execute(
+                    sqlalchemy.select(
+                        sqlalchemy.func.pg_advisory_xact_lock(
+                            sqlalchemy.func.hashtextextended(f"{cls.__tablename__}:{key}", 0)
+                        )
+                    )
+                )
+        except sqlalchemy.exc.DBAPIError:
+            await session.rollback()
             raise AuthAPIError("Internal Server Error", "Произошла ошибка, попробуйте позже")
         try:
             yield session
         except Exception:
-            nested.rollback()
-            session.rollback()
-            if session and session.is_active:
-                session.close()
+            await session.rollback()
+            await session.close()
             raise
         else:
-            nested.commit()
-            session.commit()
-            if session and session.is_active:
-                session.close()
+            await session.commit()
+            await session.close()
@@ -2,15 +2,37 @@ from __future__ import annotations
 
 import datetime
 import logging
-from typing import Iterator
 
 import sqlalchemy.orm
-from sqlalchemy import Boolean, DateTime, ForeignKey, Integer, String, func
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    Boolean,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    Select,
+    String,
+    Update,
+    case,
+    delete,
+    exists,
+    func,
+    insert,
+    literal,
+    literal_column,
+    not_,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm import Mapped, Session, backref, mapped_column, relationship
+from sqlalchemy.orm import Mapped, Session, aliased, backref, mapped_column, object_session, relationship
 
 from auth_backend.exceptions import ObjectNotFound
-from auth_backend.models.base import BaseDbModel
+from auth_backend.models.base import Base, BaseDbModel
 from auth_backend.models.dynamic_settings import DynamicOption
 from auth_backend.settings import get_settings
 from auth_backend.utils.user_session_basics import session_expires_date
@@ -18,6 +40,8 @@ from auth_backend.utils.user_session_basics import session_expires_date
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
+TOKEN_SUFFIX_LENGTH = 4
+
 
 class User(BaseDbModel):
     __auth_methods_cached = None
@@ -58,26 +82,42 @@ class User(BaseDbModel):
         else:
             logger.error("Root group not found")
         session.flush()
+        UserEffectiveScope.refresh_users([user.id], session=session)
         return user
 
+    @classmethod
+    def delete(cls, id: int, *, session: Session) -> None:
+        super().delete(id, session=session)
+        UserEffectiveScope.refresh_users([id], session=session)
+
+    @staticmethod
+    def effective_scopes_query(user_id: int, *columns) -> Select:
+        return (
+            select(*columns)
+            .join(UserEffectiveScope, UserEffectiveScope.scope_id == Scope.id)
+            .where(UserEffectiveScope.user_id == user_id, not_(Scope.is_deleted))
+        )
+
     @hybrid_property
     def scopes(self) -> set[Scope]:
-        _scopes = set()
-        for group in self.groups:
-            _scopes.update(group.indirect_scopes)
-        return _scopes
+        session = object_session(self)
+        return set(session.scalars(self.effective_scopes_query(self.id, Scope)).all())
 
     @hybrid_property
     def scope_names(self) -> set[str]:
-        return set(s.name.lower() for s in self.scopes)
+        session = object_session(self)
+        return set(session.scalars(self.effective_scopes_query(self.id, func.lower(Scope.name))).all())
 
     @hybrid_property
     def indirect_groups(self) -> set[Group]:
-        _groups = set()
-        _groups.update(set(self.groups))
-        for group in self.groups:
-            _groups.update(group.parents)
-        return _groups
+        """Группы пользователя и все их предки по замыканию дерева групп"""
+        session = object_session(self)
+        ancestors = (
+            select(GroupClosure.ancestor_id)
+            .join(UserGroup, UserGroup.group_id == GroupClosure.descendant_id)
+            .where(UserGroup.user_id == self.id, not_(UserGroup.is_deleted))
+        )
+        return set(session.scalars(select(Group).where(Group.id.in_(ancestors), not_(Group.is_deleted))).all())
 
     @hybrid_property
     def active_sessions(self) -> list[UserSession]:
@@ -121,17 +161,106 @@ class Group(BaseDbModel):
 
     @hybrid_property
     def indirect_scopes(self) -> set[Scope]:
-        _indirect_scopes = set()
-        _indirect_scopes.update(self.scopes)
-        for group in self.parents:
-            _indirect_scopes.update(group.scopes)
-        return _indirect_scopes
+        session = object_session(self)
+        return set(
+            session.scalars(
+                select(Scope)
+                .join(GroupScope, GroupScope.scope_id == Scope.id)
+                .join(GroupClosure, GroupClosure.ancestor_id == GroupScope.group_id)
+                .where(GroupClosure.descendant_id == self.id, not_(GroupScope.is_deleted), not_(Scope.is_deleted))
+                .distinct()
+            ).all()
+        )
 
     @hybrid_property
-    def parents(self) -> Iterator[Group]:
-        parent = self
-        while parent := parent.parent:
-            yield parent
+    def parents(self) -> list[Group]:
+        """Предки группы, начиная с непосредственного родителя"""
+        session = object_session(self)
+        return list(
+            session.scalars(
+                select(Group)
+                .join(GroupClosure, GroupClosure.ancestor_id == Group.id)
+                .where(GroupClosure.descendant_id == self.id, GroupClosure.depth > 0)
+                .order_by(GroupClosure.depth)
+            ).all()
+        )
+
+
+class GroupClosure(Base):
+    """Транзитивное замыкание дерева групп
+
+    Для каждой живой группы хранит строки (предок, потомок, глубина), включая саму группу с глубиной 0.
+    Поддерживается вызовами `add_group`, `move_group` и `delete_group` в тех же транзакциях,
+    что меняют `group.parent_id`.
+    """
+
+    ancestor_id: Mapped[int] = mapped_column(Integer, ForeignKey(Group.id, ondelete="CASCADE"), primary_key=True)
+    descendant_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey(Group.id, ondelete="CASCADE"), primary_key=True, index=True
+    )
+    depth: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    @classmethod
+    def add_group(cls, group_id: int, parent_id: int | None, *, session: Session) -> None:
+        """Добавляет новую группу-лист под `parent_id`"""
+        session.add(cls(ancestor_id=group_id, descendant_id=group_id, depth=0))
+        if parent_id is not None:
+            session.execute(
+                insert(cls).from_select(
+                    ["ancestor_id", "descendant_id", "depth"],
+                    select(cls.ancestor_id, literal(group_id), cls.depth + 1).where(cls.descendant_id == parent_id),
+                )
+            )
+        session.flush()
+
+    @classmethod
+    def is_descendant(cls, group_id: int, ancestor_id: int, *, session: Session) -> bool:
+        """Является ли `group_id` потомком `ancestor_id` или им самим"""
+        return session.execute(
+            select(
+                exists().where(cls.ancestor_id == ancestor_id, cls.descendant_id == group_id),
+            )
+        ).scalar()
+
+    @classmethod
+    def move_group(cls, group_id: int, parent_id: int | None, *, session: Session) -> None:
+        """Переносит поддерево `group_id` под `parent_id`"""
+        subtree = select(cls.descendant_id).where(cls.ancestor_id == group_id)
+        old_ancestors = select(cls.ancestor_id).where(cls.descendant_id == group_id, cls.ancestor_id != group_id)
+        session.execute(
+            delete(cls)
+            .where(cls.descendant_id.in_(subtree), cls.ancestor_id.in_(old_ancestors))
+            .execution_options(synchronize_session=False)
+        )
+        if parent_id is not None:
+            ancestor, descendant = aliased(cls), aliased(cls)
+            session.execute(
+                insert(cls).from_select(
+                    ["ancestor_id", "descendant_id", "depth"],
+                    select(ancestor.ancestor_id, descendant.descendant_id, ancestor.depth + descendant.depth + 1)
+                    .join(descendant, descendant.ancestor_id == group_id)
+                    .where(ancestor.descendant_id == parent_id),
+                )
+            )
+        session.flush()
+
+    @classmethod
+    def delete_group(cls, group_id: int, *, session: Session) -> None:
+        """Убирает группу из дерева, ее потомки переходят к ее родителю"""
+        descendants = select(cls.descendant_id).where(cls.ancestor_id == group_id, cls.descendant_id != group_id)
+        ancestors = select(cls.ancestor_id).where(cls.descendant_id == group_id, cls.ancestor_id != group_id)
+        session.execute(
+            update(cls)
+            .where(cls.descendant_id.in_(descendants), cls.ancestor_id.in_(ancestors))
+            .values(depth=cls.depth - 1)
+            .execution_options(synchronize_session=False)
+        )
+        session.execute(
+            delete(cls)
+            .where(or_(cls.ancestor_id == group_id, cls.descendant_id == group_id))
+            .execution_options(synchronize_session=False)
+        )
+        session.flush()
 
 
 class UserGroup(BaseDbModel):
@@ -189,6 +318,31 @@ class UserSession(BaseDbModel):
     def scope_names(self) -> set[str]:
         return set(s.name.lower() for s in self.scopes)
 
+    def scopes_query(self, *columns) -> Select:
+        """Скоупы сессии, для бессрочной сессии – все скоупы пользователя"""
+        if self.is_unbounded:
+            return User.effective_scopes_query(self.user_id, *columns)
+        return (
+            select(*columns)
+            .join(UserSessionScope, UserSessionScope.scope_id == Scope.id)
+            .where(
+                UserSessionScope.user_session_id == self.id,
+                not_(UserSessionScope.is_deleted),
+                not_(Scope.is_deleted),
+            )
+        )
+
+    @hybrid_property
+    def token_suffix(self) -> str:
+        """Последние символы токена, по которым сессию можно найти в `DELETE /session/{token}`"""
+        return self.token[-TOKEN_SUFFIX_LENGTH:].lower()
+
+    @token_suffix.inplace.expression
+    @classmethod
+    def _token_suffix_expression(cls):
+        # Длина подставляется литералом, иначе выражение не совпадет с выражением индекса
+        return func.lower(func.right(cls.token, literal_column(str(TOKEN_SUFFIX_LENGTH))))
+
 
 class Scope(BaseDbModel):
     creator_id: Mapped[int] = mapped_column(Integer, ForeignKey(User.id))
@@ -226,8 +380,14 @@ class Scope(BaseDbModel):
         else:
             logger.error("Root group not found")
         session.flush()
+        UserEffectiveScope.refresh_scope(scope.id, session=session)
         return scope
 
+    @classmethod
+    def delete(cls, id: int, *, session: Session) -> None:
+        super().delete(id, session=session)
+        UserEffectiveScope.refresh_scope(id, session=session)
+
     @classmethod
     def get_by_name(cls, name: str, *, with_deleted: bool = False, session: Session) -> Scope:
         return cls.get_by_names([name], with_deleted=with_deleted, session=session)[0]
@@ -247,13 +407,356 @@ class GroupScope(BaseDbModel):
     is_deleted: Mapped[bool] = mapped_column(Boolean, default=False)
 
 
+class UserEffectiveScope(Base):
+    """Права пользователя с учетом всех его групп и их предков
+
+    Проекция `user_group` x `group_closure` x `group_scope`, по которой проверяются права.
+    Поддерживается вызовами `refresh_users` и `refresh_scope` в тех же транзакциях,
+    что меняют группы пользователя, права групп, дерево групп или удаляют права.
+    """
+
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey(User.id, ondelete="CASCADE"), primary_key=True)
+    scope_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey(Scope.id, ondelete="CASCADE"), primary_key=True, index=True
+    )
+
+    @staticmethod
+    def source(*whereclause) -> Select:
+        """Права пользователей, посчитанные по исходным таблицам"""
+        return (
+            select(UserGroup.user_id, GroupScope.scope_id)
+            .join(User, User.id == UserGroup.user_id)
+            .join(GroupClosure, GroupClosure.descendant_id == UserGroup.group_id)
+            .join(GroupScope, GroupScope.group_id == GroupClosure.ancestor_id)
+            .join(Scope, Scope.id == GroupScope.scope_id)
+            .where(
+                not_(User.is_deleted),
+                not_(UserGroup.is_deleted),
+                not_(GroupScope.is_deleted),
+                not_(Scope.is_deleted),
+                *whereclause,
+            )
+            .distinct()
+        )
+
+    @classmethod
+    def group_users(cls, group_id: int, *, session: Session) -> list[int]:
+        """Пользователи, состоящие в группе или в любой из ее потомков"""
+        return list(
+            session.scalars(
+                select(UserGroup.user_id)
+                .join(GroupClosure, GroupClosure.descendant_id == UserGroup.group_id)
+                .where(GroupClosure.ancestor_id == group_id, not_(UserGroup.is_deleted))
+                .distinct()
+            ).all()
+        )
+
+    @classmethod
+    def refresh_users(cls, user_ids: list[int], *, session: Session) -> None:
+        """Пересчитывает права пользователей `user_ids`"""
+        if not user_ids:
+            return
+        session.flush()
+        session.execute(delete(cls).where(cls.user_id.in_(user_ids)).execution_options(synchronize_session=False))
+        session.execute(
+            postgresql.insert(cls)
+            .from_select(["user_id", "scope_id"], cls.source(UserGroup.user_id.in_(user_ids)))
+            .on_conflict_do_nothing()
+        )
+
+    @classmethod
+    def refresh_scope(cls, scope_id: int, *, session: Session) -> None:
+        """Пересчитывает права пользователей, у которых право `scope_id` есть или должно появиться"""
+        session.flush()
+        user_ids = set(session.scalars(select(cls.user_id).where(cls.scope_id == scope_id)).all())
+        user_ids |= set(session.scalars(cls.source(GroupScope.scope_id == scope_id)).all())
+        cls.refresh_users(list(user_ids), session=session)
+
+    @classmethod
+    def rebuild(cls, *, session: Session) -> None:
+        """Полностью пересобирает проекцию"""
+        session.execute(delete(cls).execution_options(synchronize_session=False))
+        session.execute(insert(cls).from_select(["user_id", "scope_id"], cls.source()))
+        session.flush()
+
+    @classmethod
+    def diff(cls, *, session: Session) -> tuple[set[tuple[int, int]], set[tuple[int, int]]]:
+        """Расхождения с исходными таблицами: недостающие и лишние пары (user_id, scope_id)"""
+        expected = set(session.execute(cls.source()).tuples().all())
+        actual = set(session.execute(select(cls.user_id, cls.scope_id)).tuples().all())
+        return expected - actual, actual - expected
+
+
 class UserSessionScope(BaseDbModel):
     user_session_id: Mapped[int] = mapped_column(Integer, ForeignKey(UserSession.id))
     scope_id: Mapped[int] = mapped_column(Integer, ForeignKey(Scope.id))
     is_deleted: Mapped[bool] = mapped_column(Boolean, default=False)
 
 
-class UserMessageDelay(BaseDbModel):
-    delay_time: Mapped[datetime.datetime] = mapped_column(DateTime, default=datetime.datetime.utcnow)
-    user_email: Mapped[str] = mapped_column(String, unique=False)
-    user_ip: Mapped[str] = mapped_column(String, unique=False)
+class RateLimitWindow(Base):
+    """Счетчики ограничителя частоты запросов: текущее и предыдущее окно для ключа
+
+    Окно – номер интервала `window_id = unix_time // длина окна`. Строка на ключ одна,
+    при переходе в следующее окно счетчик текущего становится счетчиком предыдущего.
+    """
+
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    window_id: Mapped[int] = mapped_column(BigInteger)
+    count: Mapped[int] = mapped_column(Integer)
+    prev_count: Mapped[int] = mapped_column(Integer)
+    expires: Mapped[datetime.datetime] = mapped_column(DateTime, index=True)
+
+    @classmethod
+    def hit(cls, key: str, window_id: int, expires: datetime.datetime, *, session: Session) -> tuple[int, int]:
+        """Засчитывает запрос одним запросом в БД, отдает счетчики текущего и предыдущего окна"""
+        table = cls.__table__
+        stmt = postgresql.insert(cls).values(key=key, window_id=window_id, count=1, prev_count=0, expires=expires)
+        same_window = table.c.window_id == stmt.excluded.window_id
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.key],
+            set_={
+                "prev_count": case(
+                    (same_window, table.c.prev_count),
+                    (table.c.window_id == stmt.excluded.window_id - 1, table.c.count),
+                    else_=0,
+                ),
+                "count": case((same_window, table.c.count + 1), else_=1),
+                "window_id": stmt.excluded.window_id,
+                "expires": stmt.excluded.expires,
+            },
+        ).returning(cls.count, cls.prev_count)
+        count, prev_count = session.execute(stmt).one()
+        return count, prev_count
+
+    @classmethod
+    def release(cls, key: str, window_id: int, *, session: Session) -> None:
+        """Отменяет запрос, засчитанный `hit` в то же окно"""
+        session.execute(
+            update(cls).where(cls.key == key, cls.window_id == window_id, cls.count > 0).values(count=cls.count - 1)
+        )
+
+    @classmethod
+    def cleanup(cls, *, session: Session, limit: int | None = None) -> int:
+        """Удаляет счетчики, окна которых уже не влияют на лимиты, не больше `limit` за раз"""
+        expired = select(cls.key).where(cls.expires < datetime.datetime.utcnow())
+        if limit is not None:
+            # Занятые конкурентными запросами строки пропускаем, их удалит следующая чистка
+            expired = expired.limit(limit).with_for_update(skip_locked=True)
+        return session.execute(delete(cls).where(cls.key.in_(expired.scalar_subquery()))).rowcount
+
+
+class EmailOutbox(BaseDbModel):
+    """Очередь писем, отправляемых воркером `email_outbox worker`
+
+    Письмо пишется в той же транзакции, что и изменения, ради которых оно отправляется.
+    Неотправленные письма повторяются с экспоненциальной задержкой до `max_attempts` раз.
+    Взятое воркером письмо арендуется сдвигом `next_attempt_at`: если воркер упал, не записав
+    результат, письмо снова попадет в очередь после окончания аренды.
+    """
+
+    PENDING, SENT, FAILED = "pending", "sent", "failed"
+
+    to_email: Mapped[str] = mapped_column(String)
+    template: Mapped[str] = mapped_column(String)
+    subject: Mapped[str] = mapped_column(String)
+    context: Mapped[dict[str, str]] = mapped_column(JSON, default=dict)
+    status: Mapped[str] = mapped_column(String, default=PENDING)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    next_attempt_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=datetime.datetime.utcnow)
+    last_error: Mapped[str | None] = mapped_column(String, nullable=True)
+    create_ts: Mapped[datetime.datetime] = mapped_column(DateTime, default=datetime.datetime.utcnow)
+    sent_ts: Mapped[datetime.datetime | None] = mapped_column(DateTime, nullable=True)
+
+    @classmethod
+    def claim_query(cls, limit: int, lease: datetime.timedelta) -> Update:
+        """Берет в аренду письма, которые пора отправить. Строки, взятые другими воркерами, пропускаются"""
+        now = datetime.datetime.utcnow()
+        due = (
+            select(cls.id)
+            # Статус подставляется в текст запроса, чтобы подготовленный запрос попадал в частичный индекс
+            .where(
+                cls.status == literal(cls.PENDING, literal_execute=True),
+                cls.next_attempt_at <= now,
+            )
+            .order_by(cls.next_attempt_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        return update(cls).where(cls.id.in_(due.scalar_subquery())).values(next_attempt_at=now + lease).returning(cls)
+
+    def mark_sent(self) -> None:
+        self.status = self.SENT
+        self.attempts += 1
+        self.sent_ts = datetime.datetime.utcnow()
+        self.last_error = None
+
+    def mark_failed(self, error: str, retry_in: datetime.timedelta, max_attempts: int) -> None:
+        self.attempts += 1
+        self.last_error = error
+        if self.attempts >= max_attempts:
+            self.status = self.FAILED
+        else:
+            self.next_attempt_at = datetime.datetime.utcnow() + retry_in
+
+
+class KafkaOutbox(BaseDbModel):
+    """Сообщения для Kafka, записанные в одной транзакции с изменениями, о которых они сообщают
+
+    Отправляет их `kafka_outbox relay` по порядку `id`, отправленные строки удаляются.
+    Ключ и значение хранятся уже сериализованными в JSON
+    """
+
+    topic: Mapped[str] = mapped_column(String)
+    user_id: Mapped[int] = mapped_column(Integer)
+    key: Mapped[str] = mapped_column(String)
+    value: Mapped[str] = mapped_column(String)
+    create_ts: Mapped[datetime.datetime] = mapped_column(DateTime, default=datetime.datetime.utcnow)
+
+    @classmethod
+    def batch_query(cls, limit: int) -> Select:
+        """Самые старые сообщения. Параллельные реле ждут друг друга, чтобы не нарушить порядок"""
+        return select(cls).order_by(cls.id).limit(limit).with_for_update()
+
+
+class UserUpdateQueue(BaseDbModel):
+    """События `on_user_update` методов входа, пишутся в транзакции изменения пользователя
+
+    Запрос отправляет свои события сам после коммита, упавшие и не уложившиеся в таймаут
+    повторяет `user_update worker`. На пользователя и метод входа одна строка: новое событие
+    сливается с ожидающим, так во внешний сервис уходит накопленное состояние и одновременно
+    идет не больше одного обновления. В `payload` зашифрованы `new_user` и `old_user`, там может
+    быть пароль в открытом виде.
+
+    Отправляющий не держит блокировку строки, пока ходит во внешний сервис: он берет строку в аренду
+    до `locked_until`. `version` растет с каждым новым событием, по ней отправляющий понимает, что
+    за время попытки пришло новое событие и строку удалять нельзя
+    """
+
+    user_id: Mapped[int] = mapped_column(Integer)
+    auth_method: Mapped[str] = mapped_column(String)
+    payload: Mapped[str] = mapped_column(String)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    version: Mapped[int] = mapped_column(Integer, default=0)
+    next_attempt_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=datetime.datetime.utcnow)
+    locked_until: Mapped[datetime.datetime | None] = mapped_column(DateTime, nullable=True)
+    last_error: Mapped[str | None] = mapped_column(String, nullable=True)
+    create_ts: Mapped[datetime.datetime] = mapped_column(DateTime, default=datetime.datetime.utcnow)
+
+    @classmethod
+    def insert_query(
+        cls, user_id: int, auth_method: str, payload: str, locked_until: datetime.datetime | None = None
+    ) -> postgresql.Insert:
+        """Новое событие, если ожидающего еще нет. Отдает вставленную строку или ничего"""
+        now = datetime.datetime.utcnow()
+        return (
+            postgresql.insert(cls)
+            .values(
+                user_id=user_id,
+                auth_method=auth_method,
+                payload=payload,
+                attempts=0,
+                version=0,
+                next_attempt_at=now,
+                locked_until=locked_until,
+                create_ts=now,
+            )
+            .on_conflict_do_nothing(index_elements=[cls.user_id, cls.auth_method])
+            .returning(cls)
+        )
+
+    @classmethod
+    def pending_query(cls, user_id: int, auth_method: str | None = None) -> Select:
+        if auth_method is None:
+            return select(cls.auth_method).where(cls.user_id == user_id)
+        return select(cls).where(cls.user_id == user_id, cls.auth_method == auth_method).with_for_update()
+
+    def requeue(self, payload: str) -> None:
+        """Заменяет `payload` слитым событием, повторы начинаются заново
+
+        `create_ts` остается от первого непереданного события, от него считается задержка
+        """
+        self.payload = payload
+        self.attempts = 0
+        self.version += 1
+        self.next_attempt_at = datetime.datetime.utcnow()
+        self.last_error = None
+
+    @classmethod
+    def claim(cls, limit: int, lease: datetime.timedelta, *, session: Session) -> list[UserUpdateQueue]:
+        """Берет в аренду события, которые пора повторить. Строки, взятые другими воркерами, пропускаются"""
+        now = datetime.datetime.utcnow()
+        due = (
+            select(cls.id)
+            .where(cls.next_attempt_at <= now, or_(cls.locked_until.is_(None), cls.locked_until < now))
+            .order_by(cls.next_attempt_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        return list(
+            session.scalars(
+                update(cls).where(cls.id.in_(due.scalar_subquery())).values(locked_until=now + lease).returning(cls)
+            )
+        )
+
+    @classmethod
+    def finish(cls, id: int, version: int, *, session: Session) -> bool:
+        """Удаляет событие после попытки, если за это время не пришло новое, иначе снимает аренду"""
+        deleted = session.execute(delete(cls).where(cls.id == id, cls.version == version)).rowcount
+        if not deleted:
+            session.execute(update(cls).where(cls.id == id).values(locked_until=None))
+        return bool(deleted)
+
+    @classmethod
+    def fail(cls, id: int, version: int, error: str, retry_in: datetime.timedelta, *, session: Session) -> None:
+        """Откладывает повтор. Если за время попытки пришло новое событие, оно идет сразу и с нуля"""
+        session.execute(
+            update(cls)
+            .where(cls.id == id, cls.version == version)
+            .values(
+                attempts=cls.attempts + 1,
+                last_error=error,
+                next_attempt_at=datetime.datetime.utcnow() + retry_in,
+            )
+        )
+        session.execute(update(cls).where(cls.id == id).values(locked_until=None))
+
+
+# Индексы под частые запросы. В базе создаются миграциями через CREATE INDEX CONCURRENTLY
+Index("ix_user_session_user_id_expires", UserSession.user_id, UserSession.expires)
+Index("ix_user_session_user_id_token_suffix", UserSession.user_id, UserSession.token_suffix)
+Index(
+    "ix_auth_method_auth_method_param_value",
+    AuthMethod.auth_method,
+    AuthMethod.param,
+    AuthMethod.value,
+    postgresql_where=not_(AuthMethod.is_deleted),
+)
+Index(
+    "ix_auth_method_auth_method_param_lower_value",
+    AuthMethod.auth_method,
+    AuthMethod.param,
+    func.lower(AuthMethod.value),
+    postgresql_where=not_(AuthMethod.is_deleted),
+)
+Index(
+    "ix_auth_method_user_id_auth_method",
+    AuthMethod.user_id,
+    AuthMethod.auth_method,
+    postgresql_where=not_(AuthMethod.is_deleted),
+)
+Index("ix_scope_lower_name", func.lower(Scope.name), postgresql_where=not_(Scope.is_deleted))
+Index("ix_user_group_user_id", UserGroup.user_id, postgresql_where=not_(UserGroup.is_deleted))
+Index("ix_user_group_group_id", UserGroup.group_id, postgresql_where=not_(UserGroup.is_deleted))
+Index("ix_group_scope_group_id", GroupScope.group_id, postgresql_where=not_(GroupScope.is_deleted))
+Index(
+    "ix_user_session_scope_user_session_id",
+    UserSessionScope.user_session_id,
+    postgresql_where=not_(UserSessionScope.is_deleted),
+)
+Index(
+    "ix_email_outbox_next_attempt_at",
+    EmailOutbox.next_attempt_at,
+    postgresql_where=EmailOutbox.status == EmailOutbox.PENDING,
+)
+Index("ix_user_update_queue_user_id_auth_method", UserUpdateQueue.user_id, UserUpdateQueue.auth_method, unique=True)
+Index("ix_user_update_queue_next_attempt_at", UserUpdateQueue.next_attempt_at)
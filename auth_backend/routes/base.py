@@ -1,17 +1,27 @@
-from contextlib import asynccontextmanager
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI
 from fastapi_sqlalchemy import DBSessionMiddleware
 from sqladmin import Admin
 from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
 from starlette.middleware.cors import CORSMiddleware
 
 from auth_backend import __version__
 from auth_backend.admin.admin import GroupAdmin, ScopeAdmin, UserAdmin
 from auth_backend.admin.auth import AdminAuth
 from auth_backend.auth_method import AuthPluginMeta
-from auth_backend.kafka.kafka import get_kafka_producer
+from auth_backend.auth_method.user_update import wait_user_updates
+from auth_backend.auth_plugins.postgres import PostgresOuterAuth
 from auth_backend.settings import get_settings
+from auth_backend.utils.async_db import get_async_engine
+from auth_backend.utils.http import get_http_clients
+from auth_backend.utils.metrics import dump_metrics_periodically, start_metrics_server
+from auth_backend.utils.session_activity import flush_last_activity, flush_last_activity_periodically
+from auth_backend.utils.smtp_pool import get_smtp_pool
 
 from .groups import groups as groups_router
 from .oidc import router as openid_router
@@ -20,12 +30,50 @@ from .user import user as user_router
 from .user_session import user_session as user_session_router
 
 
+def start_app_metrics() -> threading.Event | None:
+    """Метрики приложения отдаются только на `METRICS_PORT`, не через публичное API
+
+    Воркеры gunicorn пишут метрики в `METRICS_DIR`, порт занимает первый запустившийся
+    и отдает метрики всех воркеров с меткой `pid`
+    """
+    if settings.METRICS_PORT is None:
+        return None
+    metrics_dump = None
+    if settings.METRICS_DIR is not None:
+        metrics_dump = dump_metrics_periodically(settings.METRICS_DIR, settings.METRICS_DUMP_INTERVAL_SECONDS)
+    try:
+        start_metrics_server(settings.METRICS_PORT, directory=settings.METRICS_DIR)
+    except OSError:
+        # Порт уже занят другим воркером, он отдаст и наши метрики
+        logger.debug(f"Metrics port {settings.METRICS_PORT} is busy")
+    return metrics_dump
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    http_clients = get_http_clients()
+    activity_flusher = None
+    if settings.SESSION_ACTIVITY_FLUSH_INTERVAL_SECONDS > 0:
+        activity_flusher = asyncio.create_task(
+            flush_last_activity_periodically(sessionmaker(engine), settings.SESSION_ACTIVITY_FLUSH_INTERVAL_SECONDS)
+        )
+    metrics_dump = start_app_metrics()
     yield
-    get_kafka_producer().close()
+    if metrics_dump:
+        metrics_dump.set()
+    if activity_flusher:
+        activity_flusher.cancel()
+        with suppress(asyncio.CancelledError):
+            await activity_flusher
+        flush_last_activity(sessionmaker(engine))
+    await wait_user_updates()
+    get_smtp_pool().close()
+    await http_clients.close()
+    await PostgresOuterAuth.dispose()
+    await get_async_engine().dispose()
 
 
+logger = logging.getLogger(__name__)
 settings = get_settings()
 
 engine = create_engine(str(settings.DB_DSN), pool_pre_ping=True)
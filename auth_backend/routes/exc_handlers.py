@@ -13,7 +13,7 @@ from auth_backend.exceptions import (
     OidcGrantTypeClientNotSupported,
     OidcGrantTypeNotImplementedError,
     SessionExpired,
-    TooManyEmailRequests,
+    TooManyRequests,
 )
 
 from .base import app
@@ -78,8 +78,8 @@ async def session_expired_handler(req: starlette.requests.Request, exc: SessionE
     )
 
 
-@app.exception_handler(TooManyEmailRequests)
-async def too_many_requests_handler(req: starlette.requests.Request, exc: TooManyEmailRequests):
+@app.exception_handler(TooManyRequests)
+async def too_many_requests_handler(req: starlette.requests.Request, exc: TooManyRequests):
     return JSONResponse(
         content=StatusResponseModel(
             status="Error",
@@ -2,13 +2,15 @@ from typing import Any, Literal
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi_sqlalchemy import db
+from sqlalchemy import not_, update
 
 from auth_backend.base import StatusResponseModel
 from auth_backend.exceptions import AlreadyExists, ObjectNotFound
 from auth_backend.models.db import Group as DbGroup
-from auth_backend.models.db import GroupScope, Scope, UserSession
+from auth_backend.models.db import GroupClosure, GroupScope, Scope, UserEffectiveScope, UserSession
 from auth_backend.schemas.models import Group, GroupGet, GroupPatch, GroupPost, GroupsGet
 from auth_backend.utils.security import UnionAuth
+from auth_backend.utils.session_cache import get_session_cache
 
 groups = APIRouter(prefix="/group", tags=["Groups"])
 
@@ -52,7 +54,7 @@ def create_group_logic(group_inp: GroupPost, session) -> dict:
             scopes.add(Scope.get(session=session, id=_scope_id))
     result = {}
     group = DbGroup.create(session=session, name=group_inp.name, parent_id=group_inp.parent_id)
-    session.flush()
+    GroupClosure.add_group(group.id, group.parent_id, session=session)
     result = result | {"name": group.name, "id": group.id, "parent_id": group.parent_id}
     for scope in scopes:
         GroupScope.create(session=session, group_id=group.id, scope_id=scope.id)
@@ -80,7 +82,8 @@ def patch_group_logic(id: int, group_inp: GroupPatch, session) -> DbGroup:
     ):
         raise AlreadyExists(Group, exists_check.id)
     group = DbGroup.get(id, session=session)
-    if group_inp.parent_id in (row.id for row in group.child):
+    old_parent_id = group.parent_id
+    if group_inp.parent_id is not None and GroupClosure.is_descendant(group_inp.parent_id, id, session=session):
         raise HTTPException(
             status_code=400,
             detail=StatusResponseModel(status="Error", message="Cycle detected", ru="Найден цикл").model_dump(),
@@ -88,12 +91,17 @@ def patch_group_logic(id: int, group_inp: GroupPatch, session) -> DbGroup:
     result = Group.model_validate(
         DbGroup.update(id, session=session, **group_inp.model_dump(exclude_unset=True, exclude={"scopes"}))
     ).model_dump(exclude_unset=True)
+    if group.parent_id != old_parent_id:
+        GroupClosure.move_group(id, group.parent_id, session=session)
     scopes = set()
     if group_inp.scopes is not None:
         for _scope_id in group_inp.scopes:
             scopes.add(Scope.get(session=session, id=_scope_id))
         group.scopes = scopes
+    if group.parent_id != old_parent_id or group_inp.scopes is not None:
+        UserEffectiveScope.refresh_users(UserEffectiveScope.group_users(id, session=session), session=session)
     session.commit()
+    get_session_cache().clear()
     return group
 
 
@@ -112,12 +120,18 @@ async def patch_group(
 
 def delete_group_id(id: int, session) -> None:
     group: DbGroup = DbGroup.get(id, session=session)
-    if child := group.child:
-        for children in child:
-            children.parent_id = group.parent_id
-        session.flush()
+    user_ids = UserEffectiveScope.group_users(id, session=session)
+    session.execute(
+        update(DbGroup)
+        .where(DbGroup.parent_id == id, not_(DbGroup.is_deleted))
+        .values(parent_id=group.parent_id)
+        .execution_options(synchronize_session="fetch")
+    )
+    GroupClosure.delete_group(id, session=session)
     DbGroup.delete(id, session=session)
+    UserEffectiveScope.refresh_users(user_ids, session=session)
     session.commit()
+    get_session_cache().clear()
 
 
 @groups.delete("/{id}", response_model=None)
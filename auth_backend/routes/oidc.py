@@ -2,14 +2,16 @@ import logging
 from datetime import datetime
 from typing import Annotated, Optional
 
-from fastapi import APIRouter, BackgroundTasks, Form, Header
+from fastapi import APIRouter, Depends, Form, Header
 from fastapi_sqlalchemy import db
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from auth_backend.auth_plugins.email import Email
 from auth_backend.exceptions import OidcGrantTypeClientNotSupported, OidcGrantTypeNotImplementedError
 from auth_backend.models.db import Scope
 from auth_backend.schemas.oidc import PostTokenResponse
 from auth_backend.settings import get_settings
+from auth_backend.utils.async_db import get_async_session
 from auth_backend.utils.jwt import create_jwks
 from auth_backend.utils.oidc_token import OidcGrantType, token_by_client_credentials, token_by_refresh_token
 
@@ -33,7 +35,7 @@ def openid_configuration():
         "response_types_supported": ["token"],
         "subject_types_supported": ["public"],
         "id_token_signing_alg_values_supported": ["RS256"],
-        "claims_supported": ["sub", "iss", "exp", "iat"],
+        "claims_supported": ["sub", "iss", "exp", "iat"] + (["sid", "scopes"] if settings.JWT_STATELESS_AUTH else []),
         "grant_types_supported": [
             OidcGrantType.refresh_token,
             OidcGrantType.client_credentials,
@@ -49,7 +51,6 @@ def jwks():
 
 @router.post("/token")
 async def token(
-    background_tasks: BackgroundTasks,
     # Общие OIDC параметры
     grant_type: Annotated[str, Form()],
     client_id: Annotated[str, Form()],  # Тут должна быть любая строка, которую проверяем в БД
@@ -61,6 +62,7 @@ async def token(
     # grant_type=client_credentials
     username: Annotated[Optional[str], Form()] = None,
     password: Annotated[Optional[str], Form()] = None,
+    db_session: AsyncSession = Depends(get_async_session),
 ) -> PostTokenResponse:
     """Ручка для получения токена доступа
 
@@ -94,9 +96,9 @@ async def token(
 
     # Разные методы обмена токенов
     if grant_type == OidcGrantType.refresh_token:
-        new_session = await token_by_refresh_token(refresh_token, scopes)
+        new_session = await token_by_refresh_token(refresh_token, scopes, db_session=db_session)
     elif grant_type == OidcGrantType.client_credentials and Email.is_active():
-        new_session = await token_by_client_credentials(username, password, scopes, user_agent, background_tasks)
+        new_session = await token_by_client_credentials(username, password, scopes, user_agent, db_session=db_session)
     else:
         raise OidcGrantTypeClientNotSupported(grant_type, client_id)
 
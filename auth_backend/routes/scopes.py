@@ -7,6 +7,7 @@ from auth_backend.base import StatusResponseModel
 from auth_backend.models.db import Scope, UserSession
 from auth_backend.schemas.models import ScopeGet, ScopePatch, ScopePost
 from auth_backend.utils.security import UnionAuth
+from auth_backend.utils.session_cache import get_session_cache
 
 scopes = APIRouter(prefix="/scope", tags=["Scopes"])
 
@@ -20,6 +21,7 @@ def create_scope_logic(scope: ScopePost, session, creator_id) -> dict:
     scope.name = scope.name.lower()
     retval = ScopeGet.model_validate(Scope.create(**scope.model_dump(), creator_id=creator_id, session=session))
     session.commit()
+    get_session_cache().clear()
     return retval
 
 
@@ -37,7 +39,8 @@ async def create_scope(
 
 @scopes.get("/{id}", response_model=ScopeGet)
 async def get_scope(
-    id: int, _: UserSession = Depends(UnionAuth(scopes=["auth.scope.read"], allow_none=False, auto_error=True))
+    id: int,
+    _: UserSession = Depends(UnionAuth(scopes=["auth.scope.read"], allow_none=False, auto_error=True, stateless=True)),
 ) -> ScopeGet:
     """
     Scopes: `["auth.scope.read"]`
@@ -47,7 +50,7 @@ async def get_scope(
 
 @scopes.get("", response_model=list[ScopeGet])
 async def get_scopes(
-    _: UserSession = Depends(UnionAuth(scopes=["auth.scope.read"], allow_none=False, auto_error=True))
+    _: UserSession = Depends(UnionAuth(scopes=["auth.scope.read"], allow_none=False, auto_error=True, stateless=True))
 ) -> list[ScopeGet]:
     """
     Scopes: `["auth.scope.read"]`
@@ -70,6 +73,7 @@ async def update_scope(
         Scope.update(scope.id, **scope_inp.model_dump(exclude_unset=True), session=db.session)
     )
     db.session.commit()
+    get_session_cache().clear()
     return retval
 
 
@@ -83,4 +87,5 @@ async def delete_scope(
     Scope.delete(session=db.session, id=id)
     retval = StatusResponseModel(status="Success", message="Scope has been deleted", ru="Скоуп удален")
     db.session.commit()
+    get_session_cache().clear()
     return retval
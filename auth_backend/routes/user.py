@@ -1,15 +1,25 @@
 import logging
 from datetime import datetime
-from typing import Any, Literal
+from typing import Any, AsyncIterator, Iterable, Literal, Sequence
 
 from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
 from fastapi_sqlalchemy import db
-from sqlalchemy import not_
+from sqlalchemy import Select, exists, func, not_, select
 from sqlalchemy.orm import Session
 
 from auth_backend.auth_method import AuthPluginMeta
 from auth_backend.auth_plugins.email import Email
-from auth_backend.models.db import AuthMethod, Group, User, UserGroup, UserSession
+from auth_backend.models.db import (
+    AuthMethod,
+    Group,
+    GroupClosure,
+    Scope,
+    User,
+    UserEffectiveScope,
+    UserGroup,
+    UserSession,
+)
 from auth_backend.schemas.models import User as UserModel
 from auth_backend.schemas.models import (
     UserAuthMethods,
@@ -21,9 +31,13 @@ from auth_backend.schemas.models import (
     UserScopes,
     UsersGet,
 )
+from auth_backend.settings import get_settings
+from auth_backend.utils.async_db import get_async_sessionmaker
 from auth_backend.utils.security import UnionAuth
+from auth_backend.utils.session_cache import get_session_cache
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
 user = APIRouter(prefix="/user", tags=["User"])
 
 
@@ -66,46 +80,132 @@ async def get_user(
     return UserGet(**result).model_dump(exclude_unset=True, exclude={"session_scopes"})
 
 
-def get_users_auth_params(auth_method: str, session: Session) -> dict[int, dict[str, AuthMethod]]:
-    """Don't use it in public API routes"""
-    retval = {}
-    methods: list[AuthMethod] = AuthMethod.query(session=session).filter(AuthMethod.auth_method == auth_method).all()
-    for method in methods:
-        if method.user_id not in retval:
-            retval[method.user_id] = {}
-        retval[method.user_id][method.param] = method
-    return retval
+def users_query(
+    after_id: int | None = None,
+    group_id: int | None = None,
+    auth_method: str | None = None,
+    email: str | None = None,
+) -> Select:
+    """id живых пользователей по возрастанию, постранично через `after_id`"""
+    query = select(User.id).where(not_(User.is_deleted))
+    if after_id is not None:
+        query = query.where(User.id > after_id)
+    if group_id is not None:
+        query = query.where(
+            exists().where(UserGroup.user_id == User.id, UserGroup.group_id == group_id, not_(UserGroup.is_deleted))
+        )
+    if auth_method is not None:
+        query = query.where(
+            exists().where(
+                AuthMethod.user_id == User.id, AuthMethod.auth_method == auth_method, not_(AuthMethod.is_deleted)
+            )
+        )
+    if email is not None:
+        query = query.where(
+            exists().where(
+                AuthMethod.user_id == User.id,
+                AuthMethod.auth_method == Email.get_name(),
+                AuthMethod.param == "email",
+                func.lower(AuthMethod.value) == email.lower(),
+                not_(AuthMethod.is_deleted),
+            )
+        )
+    return query.order_by(User.id)
+
+
+def users_info(session: Session, user_ids: Sequence[int], info: Iterable[str]) -> list[dict[str, Any]]:
+    """Данные пользователей в порядке `user_ids`, каждая связь грузится одним запросом на всех"""
+    items = {user_id: {"id": user_id, "email": None} for user_id in user_ids}
+    if not items:
+        return []
+    emails = session.execute(
+        select(AuthMethod.user_id, AuthMethod.value).where(
+            AuthMethod.user_id.in_(user_ids),
+            AuthMethod.auth_method == Email.get_name(),
+            AuthMethod.param == "email",
+            not_(AuthMethod.is_deleted),
+        )
+    )
+    for user_id, value in emails:
+        items[user_id]["email"] = value
+    if "groups" in info:
+        for item in items.values():
+            item["groups"] = []
+        groups = session.execute(
+            select(UserGroup.user_id, UserGroup.group_id)
+            .join(Group, Group.id == UserGroup.group_id)
+            .where(UserGroup.user_id.in_(user_ids), not_(UserGroup.is_deleted), not_(Group.is_deleted))
+            .order_by(UserGroup.group_id)
+        )
+        for user_id, group_id in groups:
+            items[user_id]["groups"].append(group_id)
+    if "indirect_groups" in info:
+        for item in items.values():
+            item["indirect_groups"] = []
+        # Группы пользователя и все их предки по замыканию дерева, без обхода дерева на каждого
+        indirect_groups = session.execute(
+            select(UserGroup.user_id, GroupClosure.ancestor_id)
+            .join(GroupClosure, GroupClosure.descendant_id == UserGroup.group_id)
+            .join(Group, Group.id == GroupClosure.ancestor_id)
+            .where(UserGroup.user_id.in_(user_ids), not_(UserGroup.is_deleted), not_(Group.is_deleted))
+            .distinct()
+            .order_by(GroupClosure.ancestor_id)
+        )
+        for user_id, group_id in indirect_groups:
+            items[user_id]["indirect_groups"].append(group_id)
+    if "scopes" in info:
+        for item in items.values():
+            item["user_scopes"] = []
+        scopes = session.execute(
+            select(UserEffectiveScope.user_id, Scope)
+            .join(Scope, Scope.id == UserEffectiveScope.scope_id)
+            .where(UserEffectiveScope.user_id.in_(user_ids), not_(Scope.is_deleted))
+            .order_by(Scope.id)
+        )
+        for user_id, scope in scopes:
+            items[user_id]["user_scopes"].append(scope)
+    return list(items.values())
+
+
+async def stream_users(query: Select, info: list[str]) -> AsyncIterator[str]:
+    """Пользователи запроса в NDJSON, id читаются серверным курсором пачками"""
+    async with get_async_sessionmaker()() as session:
+        result = await session.stream_scalars(query.execution_options(yield_per=settings.USERS_BATCH_SIZE))
+        async for user_ids in result.partitions():
+            for item in await session.run_sync(users_info, user_ids, info):
+                yield UserGet(**item).model_dump_json(exclude_unset=True, exclude={"session_scopes"}) + "\n"
 
 
 @user.get("", response_model=UsersGet, response_model_exclude_unset=True)
 async def get_users(
     _: UserSession = Depends(UnionAuth(scopes=["auth.user.read"], allow_none=False, auto_error=True)),
     info: list[Literal["groups", "indirect_groups", "scopes", ""]] = Query(default=[]),
+    limit: int | None = Query(default=None, ge=1, le=1000),
+    after_id: int | None = None,
+    group_id: int | None = None,
+    auth_method: str | None = None,
+    email: str | None = None,
+    stream: bool = False,
 ) -> dict[str, Any]:
     """
     Scopes: `["auth.user.read"]`
+
+    Пользователи по возрастанию id. Если страница полная, в ответе есть `next_after_id` –
+    его надо передать в `after_id` за следующей страницей. Без `limit` отдаются все пользователи.
+
+    С `stream=true` ответ – NDJSON, по пользователю на строку, для полных выгрузок.
     """
-    ##  TODO: Add pagination
-    users = User.query(session=db.session).all()
-    result = {}
-    result["items"] = []
-    all_user_auth_params = get_users_auth_params("email", db.session)
-    for user in users:
-        add = {
-            "id": user.id,
-            "email": (
-                all_user_auth_params[user.id]["email"].value
-                if "email" in (all_user_auth_params.get(user.id) or [])
-                else None
-            ),
-        }
-        if "groups" in info:
-            add["groups"] = [group.id for group in user.groups]
-        if "indirect_groups" in info:
-            add["indirect_groups"] = [scope.id for scope in user.indirect_groups]
-        if "scopes" in info:
-            add["scopes"] = user.scopes
-        result["items"].append(add)
+    query = users_query(after_id, group_id, auth_method, email)
+    if stream:
+        return StreamingResponse(stream_users(query, info), media_type="application/x-ndjson")
+    if limit is not None:
+        query = query.limit(limit)
+    user_ids = db.session.scalars(query).all()
+    result = {"items": []}
+    for start in range(0, len(user_ids), settings.USERS_BATCH_SIZE):
+        result["items"].extend(users_info(db.session, user_ids[start : start + settings.USERS_BATCH_SIZE], info))
+    if limit is not None and len(user_ids) == limit:
+        result["next_after_id"] = user_ids[-1]
     return UsersGet(**result).model_dump(exclude_unset=True)
 
 
@@ -125,7 +225,9 @@ def patch_user_groups(user_id: int, group_ids: list[int], session) -> None:
             UserGroup.query(session=session).filter(UserGroup.user_id == user_id, UserGroup.group_id == group.id).one()
         )
         UserGroup.delete(user_group.id, session=session)
+    UserEffectiveScope.refresh_users([user_id], session=session)
     session.commit()
+    get_session_cache().invalidate_user(user_id)
 
 
 @user.patch("/{user_id}", response_model=UserModel)
@@ -182,6 +284,7 @@ async def delete_user_common(user_triggered_id: int, user_delete_id: int):
     db.session.query(UserSession).filter(UserSession.user_id == user_delete_id).filter(
         not_(UserSession.expired)
     ).update({"expires": datetime.utcnow()})
+    await AuthPluginMeta.user_updated(None, old_user, session=db.session)
     db.session.commit()
-    await AuthPluginMeta.user_updated(None, old_user)
+    get_session_cache().invalidate_user(user_delete_id)
     logger.info(f'{user=} deleted')
@@ -3,14 +3,14 @@ from datetime import datetime
 from typing import Literal
 
 from fastapi import APIRouter, Depends, Query
-from fastapi_sqlalchemy import db
-from sqlalchemy import not_
+from sqlalchemy import not_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.responses import JSONResponse
 
 from auth_backend.auth_plugins.email import Email
 from auth_backend.base import StatusResponseModel
 from auth_backend.exceptions import ObjectNotFound, SessionExpired
-from auth_backend.models.db import AuthMethod, UserSession
+from auth_backend.models.db import TOKEN_SUFFIX_LENGTH, AuthMethod, Scope, User, UserSession
 from auth_backend.schemas.models import (
     Session,
     SessionPatch,
@@ -24,7 +24,10 @@ from auth_backend.schemas.models import (
     UserScopes,
 )
 from auth_backend.utils import user_session_control
+from auth_backend.utils.async_db import get_async_session
 from auth_backend.utils.security import UnionAuth
+from auth_backend.utils.session_activity import get_last_activity_buffer
+from auth_backend.utils.session_cache import get_session_cache
 
 user_session = APIRouter(prefix="", tags=["User session"])
 logger = logging.getLogger(__name__)
@@ -32,12 +35,14 @@ logger = logging.getLogger(__name__)
 
 @user_session.post("/logout", response_model=StatusResponseModel)
 async def logout(
-    session: UserSession = Depends(UnionAuth(scopes=[], allow_none=False, auto_error=True))
+    session: UserSession = Depends(UnionAuth(scopes=[], allow_none=False, auto_error=True)),
+    db_session: AsyncSession = Depends(get_async_session),
 ) -> JSONResponse:
     if session.expired:
         raise SessionExpired(session.token)
-    session.expires = datetime.utcnow()
-    db.session.commit()
+    await db_session.execute(update(UserSession).where(UserSession.id == session.id).values(expires=datetime.utcnow()))
+    await db_session.commit()
+    get_session_cache().invalidate_token(session.token)
     return JSONResponse(
         status_code=200,
         content=StatusResponseModel(status="Success", message="Logout successful", ru="Вы успешно вышли").model_dump(),
@@ -50,8 +55,9 @@ async def me(
     info: list[Literal["groups", "indirect_groups", "session_scopes", "user_scopes", "auth_methods"]] = Query(
         default=[]
     ),
+    db_session: AsyncSession = Depends(get_async_session),
 ) -> dict[str, str | int]:
-    auth_params = Email.get_auth_method_params(session.user_id, session=db.session)
+    auth_params = await Email.get_auth_method_params_async(session.user_id, session=db_session)
     result: dict[str, str | int] = {}
     result = (
         result
@@ -60,32 +66,29 @@ async def me(
             email=auth_params["email"].value if "email" in auth_params else None,
         ).model_dump()
     )
+    if "groups" in info or "indirect_groups" in info:
+        user: User = await db_session.get(User, session.user_id)
     if "groups" in info:
-        result = result | UserGroups(groups=[group.id for group in session.user.groups]).model_dump()
+        result = result | UserGroups(groups=[group.id for group in await user.awaitable_attrs.groups]).model_dump()
     if "indirect_groups" in info:
-        result = (
-            result
-            | UserIndirectGroups(indirect_groups=[group.id for group in session.user.indirect_groups]).model_dump()
-        )
+        indirect_groups = await user.awaitable_attrs.indirect_groups
+        result = result | UserIndirectGroups(indirect_groups=[group.id for group in indirect_groups]).model_dump()
     if "session_scopes" in info:
-        result = result | (
-            SessionScopes(session_scopes=session.user.scopes).model_dump()
-            if session.is_unbounded
-            else SessionScopes(session_scopes=session.scopes).model_dump()
-        )
+        session_scopes = await db_session.scalars(session.scopes_query(Scope))
+        result = result | SessionScopes(session_scopes=session_scopes.all()).model_dump()
     if "user_scopes" in info:
-        result = result | UserScopes(user_scopes=session.user.scopes).model_dump()
+        user_scopes = await db_session.scalars(User.effective_scopes_query(session.user_id, Scope))
+        result = result | UserScopes(user_scopes=user_scopes.all()).model_dump()
     if "auth_methods" in info:
-        auth_methods = (
-            db.session.query(AuthMethod.auth_method)
-            .filter(
+        auth_methods = await db_session.scalars(
+            select(AuthMethod.auth_method)
+            .where(
                 AuthMethod.is_deleted == False,
-                AuthMethod.user_id == session.user.id,
+                AuthMethod.user_id == session.user_id,
             )
             .distinct()
-            .all()
         )
-        result = result | UserAuthMethods(auth_methods=(a[0] for a in auth_methods)).model_dump()
+        result = result | UserAuthMethods(auth_methods=auth_methods.all()).model_dump()
 
     return UserGet(**result).model_dump(exclude_unset=True)
 
@@ -94,12 +97,13 @@ async def me(
 async def create_session(
     new_session: SessionPost,
     session: UserSession = Depends(UnionAuth(scopes=["auth.session.create"], allow_none=False, auto_error=True)),
+    db_session: AsyncSession = Depends(get_async_session),
 ):
     return await user_session_control.create_session(
-        session.user,
+        session.user_id,
         new_session.scopes,
         new_session.expires,
-        db_session=db.session,
+        db_session=db_session,
         session_name=new_session.session_name,
         is_unbounded=new_session.is_unbounded,
     )
@@ -107,55 +111,69 @@ async def create_session(
 
 @user_session.delete("/session/{token}")
 async def delete_session(
-    token: str, current_session: UserSession = Depends(UnionAuth(scopes=[], allow_none=False, auto_error=True))
+    token: str,
+    current_session: UserSession = Depends(UnionAuth(scopes=[], allow_none=False, auto_error=True)),
+    db_session: AsyncSession = Depends(get_async_session),
 ):
-    session: UserSession = (
-        UserSession.query(session=db.session)
-        .filter(not_(UserSession.expired), UserSession.token.ilike(f'%{token}'))
-        .one_or_none()
+    query = select(UserSession).where(
+        UserSession.user_id == current_session.user_id,
+        not_(UserSession.expired),
+        UserSession.token.ilike(f'%{token}'),
     )
+    if len(token) >= TOKEN_SUFFIX_LENGTH:
+        # Сужает поиск до проверки по индексу ix_user_session_user_id_token_suffix
+        query = query.where(UserSession.token_suffix == token[-TOKEN_SUFFIX_LENGTH:].lower())
+    session: UserSession = (await db_session.scalars(query)).one_or_none()
     if not session:
         raise ObjectNotFound(UserSession, token[-4:])
-    if current_session.user is not session.user:
-        raise ObjectNotFound(UserSession, token[-4:])
     session.expires = datetime.utcnow()
-    db.session.commit()
+    await db_session.commit()
+    get_session_cache().invalidate_session(session.id)
 
 
 @user_session.delete("/session")
 async def delete_sessions(
     delete_current: bool = Query(default=False),
     current_session: UserSession = Depends(UnionAuth(scopes=[], allow_none=False, auto_error=True)),
+    db_session: AsyncSession = Depends(get_async_session),
 ):
     query = (
-        db.session.query(UserSession)
-        .filter(UserSession.user_id == current_session.user_id)
-        .filter(not_(UserSession.expired))
+        update(UserSession)
+        .where(UserSession.user_id == current_session.user_id)
+        .where(not_(UserSession.expired))
+        .values(expires=datetime.utcnow())
+        .execution_options(synchronize_session=False)
     )
     if not delete_current:
-        query = query.filter(UserSession.token != current_session.token)
-    query.update({"expires": datetime.utcnow()})
-    db.session.commit()
+        query = query.where(UserSession.token != current_session.token)
+    await db_session.execute(query)
+    await db_session.commit()
+    get_session_cache().invalidate_user(current_session.user_id)
 
 
 @user_session.get("/session", response_model=list[Session])
 async def get_sessions(
     current_session: UserSession = Depends(UnionAuth(scopes=[], allow_none=False, auto_error=True)),
     info: list[Literal["session_scopes", "token", "expires"]] = Query(default=[]),
+    db_session: AsyncSession = Depends(get_async_session),
 ):
     all_sessions = []
-    for session in current_session.user.active_sessions:
+    active_sessions = await db_session.scalars(
+        select(UserSession).where(
+            UserSession.user_id == current_session.user_id,
+            not_(UserSession.expired),
+        )
+    )
+    for session in active_sessions.all():
         result = dict(
             user_id=session.user_id,
             id=session.id,
-            last_activity=session.last_activity,
+            last_activity=get_last_activity_buffer().get(session.id) or session.last_activity,
             session_name=session.session_name,
             is_unbounded=session.is_unbounded,
         )
         if "session_scopes" in info:
-            result['session_scopes'] = [
-                _scope.name for _scope in (session.user.scopes if session.is_unbounded else session.scopes)
-            ]
+            result['session_scopes'] = (await db_session.scalars(session.scopes_query(Scope.name))).all()
         if "token" in info:
             result['token'] = session.token[-4:]
         if "expires" in info:
@@ -171,28 +189,34 @@ async def update_session(
     current_session: UserSession = Depends(
         UnionAuth(scopes=["auth.session.update"], allow_none=False, auto_error=True)
     ),
+    db_session: AsyncSession = Depends(get_async_session),
 ) -> Session:
-    update_session: UserSession = (
-        UserSession.query(session=db.session)
-        .filter(UserSession.user_id == current_session.user_id, UserSession.id == id)
-        .one_or_none()
+    update_session: UserSession | None = await db_session.scalar(
+        select(UserSession).where(
+            UserSession.user_id == current_session.user_id,
+            UserSession.id == id,
+        )
     )
     if update_session is None:
         raise ObjectNotFound(UserSession, id)
-    update_session.update(
-        update_session.id, session=db.session, **session_update_info.model_dump(exclude_unset=True, exclude={'scopes'})
-    )
+    for k, v in session_update_info.model_dump(exclude_unset=True, exclude={'scopes'}).items():
+        setattr(update_session, k, v)
     if session_update_info.scopes is not None:
-        scopes = await user_session_control.create_scopes_set_by_names(session_update_info.scopes)
-        await user_session_control.check_scopes(scopes, current_session.user)
+        scopes = await user_session_control.create_scopes_set_by_names(
+            session_update_info.scopes, db_session=db_session
+        )
+        user_scopes = await user_session_control.get_user_scopes(current_session.user_id, db_session=db_session)
+        await user_session_control.check_scopes(scopes, user_scopes)
+        await update_session.awaitable_attrs.scopes
         update_session.scopes = list(scopes)
-    db.session.commit()
+    await db_session.commit()
+    get_session_cache().invalidate_session(id)
     return Session(
         session_name=session_update_info.session_name,
         user_id=current_session.user_id,
         token=update_session.token,
         id=id,
         expires=update_session.expires,
-        session_scopes=[_scope.name for _scope in update_session.scopes],
+        session_scopes=[_scope.name for _scope in await update_session.awaitable_attrs.scopes],
         last_activity=update_session.last_activity,
     )
@@ -75,6 +75,7 @@ class UserGet(UserInfo, UserGroups, UserIndirectGroups, UserScopes, SessionScope
 
 class UsersGet(Base):
     items: list[UserGet]
+    next_after_id: int | None = None
 
 
 class UserPatch(Base):
@@ -3,13 +3,25 @@ import random
 import string
 from functools import lru_cache
 from pathlib import Path
-from typing import Annotated
+from typing import Annotated, Literal
 
 from annotated_types import Gt
-from pydantic import PostgresDsn
+from pydantic import BaseModel, ConfigDict, PostgresDsn
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+class HttpClientOverrides(BaseModel):
+    """Настройки HTTP-клиента отдельного провайдера, незаданные берутся из общих"""
+
+    model_config = ConfigDict(extra="forbid")
+
+    limit: Annotated[int, Gt(0)] | None = None
+    timeout: float | None = None
+    keepalive_timeout: float | None = None
+    retries: int | None = None
+    backoff: float | None = None
+
+
 class Settings(BaseSettings):
     """Application settings"""
 
@@ -20,6 +32,18 @@ class Settings(BaseSettings):
     KAFKA_TIMEOUT: int = 2
     KAFKA_LOGIN: str | None = None
     KAFKA_PASSWORD: str | None = None
+    KAFKA_TOPICS_CACHE_TTL_SECONDS: float = 60
+    KAFKA_METADATA_TIMEOUT_SECONDS: float = 5
+    KAFKA_PENDING_MESSAGES: int = 1000
+    KAFKA_LINGER_MS: int = 5
+    KAFKA_BATCH_SIZE_BYTES: int = 1_000_000
+    KAFKA_COMPRESSION_TYPE: Literal['none', 'gzip', 'snappy', 'lz4', 'zstd'] = 'lz4'
+    KAFKA_QUEUE_MAX_MESSAGES: int = 100_000
+    KAFKA_POLL_INTERVAL_SECONDS: float = 0.1
+    KAFKA_QUEUE_FULL_TIMEOUT_SECONDS: float = 1
+    KAFKA_OUTBOX_BATCH_SIZE: Annotated[int, Gt(0)] = 500
+    KAFKA_OUTBOX_POLL_INTERVAL_SECONDS: float = 0.5
+    KAFKA_OUTBOX_DELIVERY_TIMEOUT_SECONDS: float = 10
     ADMIN_SECRET_KEY: str = "default"
     ADMIN_LOGIN: str = "admin"
     AUTH_URL: str = "https://api.test.profcomff.com/auth/"
@@ -33,14 +57,50 @@ class Settings(BaseSettings):
     SMTP_HOST: str = 'smtp.gmail.com'
     SMTP_PORT: int = 587
     SMTP_LOGIN: str | None = None
+    SMTP_STARTTLS: bool = True
+    SMTP_POOL_SIZE: Annotated[int, Gt(0)] = 2
+    SMTP_POOL_MAX_MESSAGES: Annotated[int, Gt(0)] = 100
+    SMTP_POOL_IDLE_TIMEOUT_SECONDS: float = 60
     ENABLED_AUTH_METHODS: list[str] | None = None
     TOKEN_LENGTH: Annotated[int, Gt(8)] = 64
     SESSION_TIME_IN_DAYS: int = 30
+    USERS_BATCH_SIZE: Annotated[int, Gt(0)] = 500
+    SESSION_CACHE_SIZE: int = 10_000
+    SESSION_CACHE_TTL_SECONDS: float = 10
+    SESSION_ACTIVITY_FLUSH_INTERVAL_SECONDS: float = 30
+    PASSWORD_HASH_WORKERS: Annotated[int, Gt(0)] = 4
+    PASSWORD_HASHER: Literal['pbkdf2_sha256', 'scrypt'] = 'pbkdf2_sha256'
+    PASSWORD_PBKDF2_ITERATIONS: Annotated[int, Gt(0)] = 100_000
+    PASSWORD_SCRYPT_N: Annotated[int, Gt(1)] = 2**14
+    PASSWORD_SCRYPT_R: Annotated[int, Gt(0)] = 8
+    PASSWORD_SCRYPT_P: Annotated[int, Gt(0)] = 1
+
+    EMAIL_TEMPLATES_RELOAD: bool = False
+    EMAIL_OUTBOX_BATCH_SIZE: Annotated[int, Gt(0)] = 50
+    EMAIL_OUTBOX_POLL_INTERVAL_SECONDS: float = 1
+    EMAIL_OUTBOX_MAX_ATTEMPTS: Annotated[int, Gt(0)] = 10
+    EMAIL_OUTBOX_BACKOFF_SECONDS: float = 10
+    EMAIL_OUTBOX_MAX_BACKOFF_SECONDS: float = 3600
+    EMAIL_OUTBOX_LEASE_SECONDS: float = 300
+
+    USER_UPDATE_TIMEOUT_SECONDS: float = 2
+    USER_UPDATE_QUEUE_BATCH_SIZE: Annotated[int, Gt(0)] = 50
+    USER_UPDATE_QUEUE_POLL_INTERVAL_SECONDS: float = 1
+    USER_UPDATE_QUEUE_MAX_ATTEMPTS: Annotated[int, Gt(0)] = 10
+    USER_UPDATE_QUEUE_BACKOFF_SECONDS: float = 10
+    USER_UPDATE_QUEUE_MAX_BACKOFF_SECONDS: float = 3600
+    USER_UPDATE_QUEUE_LEASE_SECONDS: float = 300
 
-    MAX_RETRIES: int = 10
-    STOP_MAX_DELAY: int = 10000
-    WAIT_MIN: int = 1000
-    WAIT_MAX: int = 2000
+    HTTP_CLIENT_LIMIT: Annotated[int, Gt(0)] = 20
+    HTTP_CLIENT_TIMEOUT_SECONDS: float = 10
+    HTTP_CLIENT_KEEPALIVE_SECONDS: float = 30
+    HTTP_CLIENT_RETRIES: int = 0
+    HTTP_CLIENT_PROVIDERS: dict[str, HttpClientOverrides] = {}
+    METRICS_PORT: int | None = None
+    METRICS_DIR: Path | None = None
+    METRICS_DUMP_INTERVAL_SECONDS: float = 5
+    OIDC_CACHE_TTL_SECONDS: float = 3600
+    OIDC_JWKS_MIN_REFRESH_SECONDS: float = 30
 
     CORS_ALLOW_ORIGINS: list[str] = ['*']
     CORS_ALLOW_CREDENTIALS: bool = True
@@ -53,11 +113,13 @@ class Settings(BaseSettings):
     IP_DELAY_COUNT: int = 3
     EMAIL_DELAY_TIME_IN_MINUTES: float = 1
     EMAIL_DELAY_COUNT: int = 3
+    RATE_LIMIT_BACKEND: Literal['postgres', 'memory'] = 'postgres'
     model_config = SettingsConfigDict(case_sensitive=True, env_file=".env", extra='ignore')
 
     JWT_ENABLED: bool = False
     JWT_PRIVATE_KEY_FILE: Path | None = './tests/private-key.pem'
     JWT_PRIVATE_KEY: bytes | None = None
+    JWT_STATELESS_AUTH: bool = False
 
 
 @lru_cache
@@ -0,0 +1,32 @@
+from functools import lru_cache
+from typing import AsyncIterator
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+
+from auth_backend.settings import get_settings
+
+
+def async_dsn(dsn: str) -> str:
+    """Тот же DSN, но с асинхронным драйвером asyncpg"""
+    return make_url(dsn).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+
+@lru_cache
+def get_async_engine() -> AsyncEngine:
+    return create_async_engine(async_dsn(str(get_settings().DB_DSN)), pool_pre_ping=True)
+
+
+@lru_cache
+def get_async_sessionmaker() -> async_sessionmaker[AsyncSession]:
+    return async_sessionmaker(get_async_engine(), expire_on_commit=False)
+
+
+async def get_async_session() -> AsyncIterator[AsyncSession]:
+    """Сессия БД на время запроса, не блокирует event loop
+
+    Синхронные хелперы моделей можно вызывать через `AsyncSession.run_sync`,
+    а ленивые связи и гибридные свойства получать через `obj.awaitable_attrs`
+    """
+    async with get_async_sessionmaker()() as session:
+        yield session
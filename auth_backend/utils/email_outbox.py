@@ -0,0 +1,61 @@
+import asyncio
+import datetime
+import logging
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from auth_backend.models.db import EmailOutbox
+from auth_backend.settings import get_settings
+from auth_backend.utils.smtp import SendEmailMessage
+
+logger = logging.getLogger(__name__)
+
+
+def email_backoff(attempts: int) -> datetime.timedelta:
+    """Задержка перед повтором после `attempts` неудачных попыток, удваивается до максимума"""
+    settings = get_settings()
+    seconds = settings.EMAIL_OUTBOX_BACKOFF_SECONDS * 2 ** max(attempts - 1, 0)
+    return datetime.timedelta(seconds=min(seconds, settings.EMAIL_OUTBOX_MAX_BACKOFF_SECONDS))
+
+
+async def process_email_outbox(batch_size: int, *, session: AsyncSession) -> int:
+    """Отправляет одну пачку писем и записывает результат, отдает число обработанных писем
+
+    Пачка берется в аренду на `EMAIL_OUTBOX_LEASE_SECONDS` и коммитится до отправки,
+    так что строки не заблокированы, пока идет SMTP. Письма внутри пачки отправляются
+    параллельно, число соединений ограничено пулом SMTP
+    """
+    settings = get_settings()
+    lease = datetime.timedelta(seconds=settings.EMAIL_OUTBOX_LEASE_SECONDS)
+    async with session.begin():
+        messages = (await session.scalars(EmailOutbox.claim_query(batch_size, lease))).all()
+    results = await asyncio.gather(
+        *(
+            asyncio.to_thread(SendEmailMessage.email_task, msg.to_email, msg.template, msg.subject, **msg.context)
+            for msg in messages
+        ),
+        return_exceptions=True,
+    )
+    async with session.begin():
+        for msg, result in zip(messages, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to send email {msg.id} (attempt {msg.attempts + 1}): {result!r}")
+                msg.mark_failed(repr(result), email_backoff(msg.attempts + 1), settings.EMAIL_OUTBOX_MAX_ATTEMPTS)
+            else:
+                msg.mark_sent()
+    return len(messages)
+
+
+async def run_email_outbox_worker(
+    sessionmaker: async_sessionmaker[AsyncSession], batch_size: int, poll_interval: float
+) -> None:
+    """Разбирает очередь писем, пока процесс не остановят"""
+    while True:
+        try:
+            async with sessionmaker() as session:
+                processed = await process_email_outbox(batch_size, session=session)
+        except Exception:
+            logger.exception("Email outbox batch failed")
+            processed = 0
+        if processed < batch_size:
+            await asyncio.sleep(poll_interval)
@@ -0,0 +1,88 @@
+import os
+import re
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+from auth_backend.settings import get_settings
+
+PLACEHOLDER = re.compile(r"\{\{(\w+)\}\}")
+TEMPLATES_DIR = Path(__file__).parent.parent / "templates"
+
+
+@dataclass(frozen=True)
+class EmailTemplate:
+    """Шаблон письма, разобранный на куски текста и плейсхолдеры `{{name}}` между ними
+
+    `parts` на один длиннее `placeholders`: `parts[0] {{placeholders[0]}} parts[1] ...`
+    """
+
+    parts: tuple[str, ...]
+    placeholders: tuple[str, ...]
+    mtime: float = 0
+
+    @classmethod
+    def compile(cls, text: str, mtime: float = 0) -> "EmailTemplate":
+        # re.split с группой чередует текст и имена плейсхолдеров
+        chunks = PLACEHOLDER.split(text)
+        return cls(parts=tuple(chunks[::2]), placeholders=tuple(chunks[1::2]), mtime=mtime)
+
+    def render(self, **values: str) -> str:
+        """Подставляет значения за один проход, плейсхолдеры без значения остаются как есть"""
+        result = [self.parts[0]]
+        for name, part in zip(self.placeholders, self.parts[1:]):
+            result.append(values.get(name, f"{{{{{name}}}}}"))
+            result.append(part)
+        return "".join(result)
+
+
+class EmailTemplates:
+    """Шаблоны писем из директории, читаются и разбираются один раз
+
+    С `reload=True` файл перечитывается, если поменялось время его изменения – для разработки
+    """
+
+    def __init__(self, directory: Path = TEMPLATES_DIR, *, reload: bool = False) -> None:
+        self.directory = directory
+        self.reload = reload
+        self._templates: dict[str, EmailTemplate] = {}
+        self._lock = threading.Lock()
+        for path in directory.glob("*.html"):
+            self._load(path.name)
+
+    def _load(self, name: str) -> EmailTemplate:
+        path = self.directory / name
+        with open(path) as f:
+            template = EmailTemplate.compile(f.read(), os.stat(path).st_mtime)
+        with self._lock:
+            self._templates[name] = template
+        return template
+
+    def get(self, name: str) -> EmailTemplate:
+        template = self._templates.get(name)
+        if template is None or (self.reload and os.stat(self.directory / name).st_mtime != template.mtime):
+            template = self._load(name)
+        return template
+
+    def render(self, name: str, /, **values: str) -> str:
+        return self.get(name).render(**values)
+
+    def check(self, required: dict[str, set[str]]) -> None:
+        """Проверяет, что шаблоны есть и содержат нужные плейсхолдеры, иначе ValueError"""
+        errors = []
+        for name, placeholders in required.items():
+            try:
+                template = self.get(name)
+            except FileNotFoundError:
+                errors.append(f"{name}: template not found")
+                continue
+            if missing := placeholders - set(template.placeholders):
+                errors.append(f"{name}: missing placeholders {sorted(missing)}")
+        if errors:
+            raise ValueError(f"Invalid email templates in {self.directory}: {'; '.join(errors)}")
+
+
+@lru_cache
+def get_email_templates() -> EmailTemplates:
+    return EmailTemplates(reload=get_settings().EMAIL_TEMPLATES_RELOAD)
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import AsyncIterator
+
+import aiohttp
+
+from auth_backend.settings import Settings, get_settings
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUSES = {502, 503, 504}
+
+
+@dataclass(frozen=True)
+class HttpClientOptions:
+    limit: int = 20
+    timeout: float = 10
+    keepalive_timeout: float = 30
+    retries: int = 0
+    backoff: float = 0.2
+
+
+class HttpClient:
+    """Постоянная `aiohttp.ClientSession` одного провайдера
+
+    Соединения и DNS переиспользуются между запросами. Идемпотентные запросы
+    повторяются `retries` раз при сетевых ошибках и ответах 502/503/504
+    """
+
+    def __init__(self, options: HttpClientOptions) -> None:
+        self.options = options
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=options.limit, keepalive_timeout=options.keepalive_timeout, ttl_dns_cache=300
+            ),
+            timeout=aiohttp.ClientTimeout(total=options.timeout),
+        )
+
+    @asynccontextmanager
+    async def request(self, method: str, url: str, **kwargs) -> AsyncIterator[aiohttp.ClientResponse]:
+        attempts = self.options.retries + 1 if method.upper() in IDEMPOTENT_METHODS else 1
+        for attempt in range(1, attempts + 1):
+            try:
+                response = await self.session.request(method, url, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt == attempts:
+                    raise
+                logger.info(f"{method} {url} failed with {e!r}, retrying")
+            else:
+                if response.status not in RETRY_STATUSES or attempt == attempts:
+                    break
+                response.release()
+                logger.info(f"{method} {url} returned {response.status}, retrying")
+            await asyncio.sleep(self.options.backoff * 2 ** (attempt - 1))
+        async with response:
+            yield response
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url: str, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    async def close(self) -> None:
+        await self.session.close()
+
+
+class HttpClients:
+    """HTTP-клиенты по провайдерам, у каждого свои лимиты соединений, таймауты и повторы
+
+    Сессии создаются при первом запросе в event loop приложения и закрываются в `lifespan`
+    """
+
+    def __init__(self, default: HttpClientOptions, providers: dict[str, HttpClientOptions] | None = None) -> None:
+        self.default = default
+        self.providers = providers or {}
+        self._clients: dict[str, HttpClient] = {}
+
+    def get(self, provider: str) -> HttpClient:
+        client = self._clients.get(provider)
+        if client is None or client.session.closed:
+            client = self._clients[provider] = HttpClient(self.providers.get(provider, self.default))
+        return client
+
+    async def close(self) -> None:
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.close()
+
+
+def build_http_clients(settings: Settings) -> HttpClients:
+    default = HttpClientOptions(
+        limit=settings.HTTP_CLIENT_LIMIT,
+        timeout=settings.HTTP_CLIENT_TIMEOUT_SECONDS,
+        keepalive_timeout=settings.HTTP_CLIENT_KEEPALIVE_SECONDS,
+        retries=settings.HTTP_CLIENT_RETRIES,
+    )
+    providers = {
+        provider: replace(default, **overrides.model_dump(exclude_none=True))
+        for provider, overrides in settings.HTTP_CLIENT_PROVIDERS.items()
+    }
+    return HttpClients(default, providers)
+
+
+@lru_cache
+def get_http_clients() -> HttpClients:
+    return build_http_clients(get_settings())
+
+
+def http_client(provider: str) -> HttpClient:
+    """Клиент для запросов к провайдеру, обычно `cls.get_name()` плагина"""
+    return get_http_clients().get(provider)
@@ -3,7 +3,7 @@ import hashlib
 from dataclasses import dataclass
 from datetime import datetime
 from functools import lru_cache
-from typing import Any
+from typing import Any, Iterable
 
 import jwt
 from cryptography.hazmat.backends import default_backend
@@ -91,18 +91,30 @@ def create_jwks() -> dict[str, str]:
     }
 
 
-def generate_jwt(user_id: int, create_ts: datetime, expire_ts: datetime) -> str:
+def generate_jwt(
+    user_id: int,
+    create_ts: datetime,
+    expire_ts: datetime,
+    session_id: int | None = None,
+    scopes: Iterable[str] | None = None,
+) -> str:
+    """Выпускает токен доступа
+
+    Если переданы `session_id` и `scopes`, они кладутся в клеймы `sid` и `scopes`,
+    что позволяет проверять токен без обращения к БД (см. `JWT_STATELESS_AUTH`)
+    """
     jwt_settings = ensure_jwt_settings()
-    return jwt.encode(
-        {
-            "sub": f"{user_id}",
-            "iss": f"{settings.APPLICATION_HOST}",
-            "iat": int(create_ts.timestamp()),
-            "exp": int(expire_ts.timestamp()),
-        },
-        jwt_settings.pem_private_key,
-        algorithm="RS256",
-    )
+    payload = {
+        "sub": f"{user_id}",
+        "iss": f"{settings.APPLICATION_HOST}",
+        "iat": int(create_ts.timestamp()),
+        "exp": int(expire_ts.timestamp()),
+    }
+    if session_id is not None:
+        payload["sid"] = session_id
+    if scopes is not None:
+        payload["scopes"] = sorted(scopes)
+    return jwt.encode(payload, jwt_settings.pem_private_key, algorithm="RS256")
 
 
 def decode_jwt(token: str) -> dict[str, Any]:
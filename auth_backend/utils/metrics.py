@@ -0,0 +1,189 @@
+import json
+import logging
+import os
+import threading
+from collections import defaultdict
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+logger = logging.getLogger(__name__)
+
+
+class Metrics:
+    """Счетчики, текущие значения и гистограммы внутри процесса
+
+    Имена в стиле Prometheus: `kafka_messages_skipped_total`, гистограмма `name` раскладывается
+    в `name_bucket{le="..."}`, `name_sum` и `name_count`. Значения читаются через `snapshot`,
+    в текстовом формате Prometheus их отдает `render`
+    """
+
+    def __init__(self) -> None:
+        self._values: defaultdict[str, float] = defaultdict(float)
+        # Метрика -> (тип, ее строки в порядке появления)
+        self._families: dict[str, tuple[str, list[str]]] = {}
+        self._lock = threading.Lock()
+
+    def _sample(self, family: str, kind: str, name: str) -> None:
+        samples = self._families.setdefault(family, (kind, []))[1]
+        if name not in self._values:
+            samples.append(name)
+            self._values[name] = 0
+
+    def inc(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._sample(name, "counter", name)
+            self._values[name] += value
+
+    def set(self, name: str, value: float) -> None:
+        with self._lock:
+            self._sample(name, "gauge", name)
+            self._values[name] = value
+
+    def observe(self, name: str, value: float, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        """Добавляет значение в гистограмму, бакеты накопительные"""
+        with self._lock:
+            for bucket in buckets:
+                key = f'{name}_bucket{{le="{bucket}"}}'
+                self._sample(name, "histogram", key)
+                if value <= bucket:
+                    self._values[key] += 1
+            for key in (f'{name}_bucket{{le="+Inf"}}', f"{name}_sum", f"{name}_count"):
+                self._sample(name, "histogram", key)
+            self._values[f'{name}_bucket{{le="+Inf"}}'] += 1
+            self._values[f"{name}_sum"] += value
+            self._values[f"{name}_count"] += 1
+
+    def get(self, name: str) -> float:
+        with self._lock:
+            return self._values.get(name, 0)
+
+    def snapshot(self) -> dict[str, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> str:
+        """Все метрики процесса в текстовом формате Prometheus"""
+        with self._lock:
+            return _render({None: (self._families, self._values)})
+
+    def dump(self, directory: Path) -> None:
+        """Записывает метрики процесса в `directory/<pid>.json`, оттуда их отдает `render_directory`"""
+        with self._lock:
+            state = {"families": self._families, "values": self._values}
+            data = json.dumps(state)
+        path = directory / f"{os.getpid()}.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(data)
+        tmp.replace(path)
+
+
+def _with_pid(name: str, pid: int | None) -> str:
+    if pid is None:
+        return name
+    if "{" in name:
+        return name.replace("{", f'{{pid="{pid}",', 1)
+    return f'{name}{{pid="{pid}"}}'
+
+
+def _render(processes: dict[int | None, tuple[dict[str, tuple[str, list[str]]], dict[str, float]]]) -> str:
+    families: dict[str, tuple[str, list[str]]] = {}
+    for pid, (process_families, values) in processes.items():
+        for family, (kind, samples) in process_families.items():
+            lines = families.setdefault(family, (kind, []))[1]
+            lines.extend(f"{_with_pid(name, pid)} {values[name]}" for name in samples)
+    lines = []
+    for family in sorted(families):
+        kind, samples = families[family]
+        lines.append(f"# TYPE {family} {kind}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def render_directory(directory: Path) -> str:
+    """Метрики всех процессов, записанные в `directory`, с меткой `pid` у каждой строки
+
+    Файлы завершившихся процессов удаляются
+    """
+    processes = {}
+    for path in directory.glob("*.json"):
+        pid = int(path.stem)
+        if not _alive(pid):
+            path.unlink(missing_ok=True)
+            continue
+        try:
+            state = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        processes[pid] = (state["families"], state["values"])
+    return _render(processes)
+
+
+@lru_cache
+def get_metrics() -> Metrics:
+    return Metrics()
+
+
+def dump_metrics_periodically(directory: Path, interval: float) -> threading.Event:
+    """Пишет метрики процесса в `directory` раз в `interval` секунд, пока не выставят событие"""
+    stopped = threading.Event()
+
+    def dump() -> None:
+        while not stopped.wait(interval):
+            try:
+                get_metrics().dump(directory)
+            except OSError:
+                logger.exception("Failed to dump metrics")
+
+    directory.mkdir(parents=True, exist_ok=True)
+    get_metrics().dump(directory)
+    threading.Thread(target=dump, name="metrics-dump", daemon=True).start()
+    return stopped
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    server: "_MetricsServer"
+
+    def do_GET(self) -> None:
+        if self.server.directory is None:
+            body = get_metrics().render().encode()
+        else:
+            get_metrics().dump(self.server.directory)
+            body = render_directory(self.server.directory).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        return
+
+
+class _MetricsServer(ThreadingHTTPServer):
+    directory: Path | None = None
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0", directory: Path | None = None) -> ThreadingHTTPServer:
+    """Отдает метрики по HTTP из фонового потока, отдельно от публичного API
+
+    С `directory` отдает метрики всех процессов, которые пишут туда `Metrics.dump`
+    """
+    server = _MetricsServer((host, port), _MetricsHandler)
+    server.directory = directory
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Serving metrics on {host}:{server.server_port}")
+    return server
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import re
+import time
+from functools import lru_cache
+from typing import Any, Mapping
+
+import jwt
+
+from auth_backend.exceptions import OauthAuthFailed
+from auth_backend.settings import get_settings
+from auth_backend.utils.http import http_client
+
+logger = logging.getLogger(__name__)
+
+MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+def cache_ttl(headers: Mapping[str, str], default: float) -> float:
+    """Время жизни ответа по `Cache-Control`, если заголовка нет – `default`"""
+    cache_control = headers.get("Cache-Control", "").lower()
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return 0
+    if match := MAX_AGE.search(cache_control):
+        return float(match.group(1))
+    return default
+
+
+class OidcProvider:
+    """Кэш OIDC discovery и ключей JWKS одного провайдера
+
+    Документы живут по `Cache-Control` ответа, иначе `ttl` секунд. Ключи хранятся уже
+    разобранными и выбираются по `kid` из заголовка токена. Если `kid` неизвестен, например
+    провайдер сменил ключи, JWKS перезапрашивается, но не чаще раза в `min_refresh_interval`
+    """
+
+    def __init__(self, name: str, configuration_url: str, *, ttl: float, min_refresh_interval: float) -> None:
+        self.name = name
+        self.configuration_url = configuration_url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self._configuration: dict[str, Any] | None = None
+        self._configuration_expires_at = 0.0
+        self._keys: dict[str | None, jwt.PyJWK] = {}
+        self._keys_expires_at = 0.0
+        self._keys_fetched_at = float("-inf")
+        self._lock = asyncio.Lock()
+
+    async def _fetch(self, url: str) -> tuple[dict[str, Any], float]:
+        async with http_client(self.name).get(url) as response:
+            response.raise_for_status()
+            return await response.json(), cache_ttl(response.headers, self.ttl)
+
+    async def configuration(self) -> dict[str, Any]:
+        if self._configuration is None or time.monotonic() >= self._configuration_expires_at:
+            async with self._lock:
+                if self._configuration is None or time.monotonic() >= self._configuration_expires_at:
+                    self._configuration, ttl = await self._fetch(self.configuration_url)
+                    self._configuration_expires_at = time.monotonic() + ttl
+                    logger.debug(self._configuration)
+        return self._configuration
+
+    async def _require(self, field: str) -> Any:
+        """Обязательное поле discovery, без него провайдер настроен неверно"""
+        configuration = await self.configuration()
+        if not configuration.get(field):
+            logger.error(f"No {field} in {self.name} OIDC configuration: {configuration}")
+            raise OauthAuthFailed('Error in OIDC configuration', 'Ошибка конфигурации OIDC', status_code=500)
+        return configuration[field]
+
+    async def _refresh_keys(self, jwks_uri: str) -> None:
+        jwks, ttl = await self._fetch(jwks_uri)
+        keys = {}
+        for key in jwks.get("keys", []):
+            if key.get("use", "sig") != "sig":
+                continue
+            try:
+                keys[key.get("kid")] = jwt.PyJWK(key)
+            except jwt.PyJWKError as e:
+                # Ключи с неподдерживаемыми алгоритмами пропускаем, как и PyJWKSet
+                logger.warning(f"Skipping {self.name} JWK {key.get('kid')}: {e}")
+        now = time.monotonic()
+        self._keys, self._keys_fetched_at, self._keys_expires_at = keys, now, now + ttl
+        logger.info(f"Loaded {len(keys)} {self.name} signing keys")
+
+    def _find_key(self, kid: str | None) -> jwt.PyJWK | None:
+        if kid is None and len(self._keys) == 1:
+            return next(iter(self._keys.values()))
+        return self._keys.get(kid)
+
+    async def signing_key(self, kid: str | None) -> jwt.PyJWK:
+        if time.monotonic() >= self._keys_expires_at or self._find_key(kid) is None:
+            jwks_uri = await self._require("jwks_uri")
+            async with self._lock:
+                now = time.monotonic()
+                # Промах по kid обновляет ключи не чаще min_refresh_interval, иначе
+                # токены с выдуманным kid заставили бы ходить к провайдеру на каждый запрос
+                missing = self._find_key(kid) is None and now - self._keys_fetched_at >= self.min_refresh_interval
+                if now >= self._keys_expires_at or missing:
+                    await self._refresh_keys(jwks_uri)
+        if (key := self._find_key(kid)) is None:
+            raise jwt.InvalidTokenError(f"Unknown {self.name} signing key {kid}")
+        return key
+
+    async def decode(self, token: str, audience: str | None, **kwargs) -> dict[str, Any]:
+        """Проверяет подпись id_token ключом провайдера и возвращает его содержимое
+
+        `kwargs` передаются в `jwt.decode`, например `issuer` и `leeway`
+        """
+        key = await self.signing_key(jwt.get_unverified_header(token).get("kid"))
+        algorithms = await self._require("id_token_signing_alg_values_supported")
+        return jwt.decode(token, key, algorithms, {'verify_signature': True}, audience=audience, **kwargs)
+
+
+@lru_cache
+def get_oidc_provider(name: str, configuration_url: str) -> OidcProvider:
+    settings = get_settings()
+    return OidcProvider(
+        name,
+        configuration_url,
+        ttl=settings.OIDC_CACHE_TTL_SECONDS,
+        min_refresh_interval=settings.OIDC_JWKS_MIN_REFRESH_SECONDS,
+    )
@@ -1,13 +1,14 @@
 from datetime import datetime
 from enum import Enum
 
-from fastapi import BackgroundTasks
-from fastapi_sqlalchemy import db
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from auth_backend.auth_plugins.email import Email
 from auth_backend.exceptions import AuthFailed, SessionExpired
 from auth_backend.models.db import Scope, UserSession
 from auth_backend.schemas.models import Session as SessionSchema
+from auth_backend.utils.session_cache import get_session_cache
 from auth_backend.utils.user_session_control import SESSION_UPDATE_SCOPE, create_session
 
 
@@ -20,19 +21,21 @@ class OidcGrantType(str, Enum):
 async def token_by_refresh_token(
     refresh_token: str | None,
     requested_scopes: list[str] | None,
+    *,
+    db_session: AsyncSession,
 ) -> SessionSchema:
     # Все токены автоматически считаем refresh-токенами
     if not refresh_token:
         raise TypeError("refresh_token required for refresh_token grant_type ")
-    old_session: UserSession = (
-        UserSession.query(session=db.session).filter(UserSession.token == refresh_token).one_or_none()
+    old_session: UserSession | None = await db_session.scalar(
+        select(UserSession).where(UserSession.token == refresh_token)
     )
     if not old_session or old_session.expired:
         raise SessionExpired()
 
     # Продлеваем только те токены, которые явно разрешено продлевать
     # Остальные просто заменяем на новые с тем же сроком действия
-    session_scopes = old_session.user.scope_names if old_session.is_unbounded else old_session.scope_names
+    session_scopes = set(await db_session.scalars(old_session.scopes_query(func.lower(Scope.name))))
 
     # Если запрошены скоупы, то выдать новый токен с запрошенными скоупами, если у текущего хватает прав
     if requested_scopes:
@@ -48,17 +51,18 @@ async def token_by_refresh_token(
         expire_ts = old_session.expires
 
     new_session = await create_session(
-        old_session.user,
+        old_session.user_id,
         session_scopes,
         expire_ts,
         old_session.session_name,
         old_session.is_unbounded,
-        db_session=db.session,
+        db_session=db_session,
     )
 
     # Старую сессию убиваем
     old_session.expires = datetime.utcnow()
-    db.session.commit()
+    await db_session.commit()
+    get_session_cache().invalidate_token(refresh_token)
 
     return new_session
 
@@ -68,7 +72,8 @@ async def token_by_client_credentials(
     password: str | None,
     scopes: list[str] | None,
     user_agent: str,
-    background_tasks: BackgroundTasks,
+    *,
+    db_session: AsyncSession,
 ) -> SessionSchema:
     if not username or not password:
         raise AuthFailed("Incorrect login or password", "Некорректный логин или пароль")
@@ -76,7 +81,7 @@ async def token_by_client_credentials(
     return await Email.login(
         username,
         password,
-        Scope.get_by_names(scopes, session=db.session),
+        await db_session.run_sync(lambda session: Scope.get_by_names(scopes, session=session)),
         session_name=user_agent,
-        background_tasks=background_tasks,
+        db_session=db_session,
     )
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from auth_backend.settings import Settings, get_settings
+
+LEGACY_PBKDF2_ITERATIONS = 100_000
+
+PASSWORD_HASHERS: dict[str, type[PasswordHasher]] = {}
+
+
+class PasswordHasher(metaclass=ABCMeta):
+    """Алгоритм хеширования паролей с параметрами стоимости
+
+    Хеш хранится в виде `<algorithm>$<param>=<value>,...$<hex>`, соль лежит отдельно в параметре `salt`.
+    Хеши без алгоритма – старый формат, PBKDF2-SHA256 на 100 000 итераций.
+    """
+
+    algorithm: str
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        PASSWORD_HASHERS[cls.algorithm] = cls
+
+    @classmethod
+    @abstractmethod
+    def from_settings(cls, settings: Settings) -> PasswordHasher:
+        raise NotImplementedError()
+
+    @property
+    @abstractmethod
+    def params(self) -> dict[str, int]:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def digest(self, password: str, salt: str) -> str:
+        raise NotImplementedError()
+
+    def encode(self, password: str, salt: str) -> str:
+        params = ",".join(f"{k}={v}" for k, v in self.params.items())
+        return f"{self.algorithm}${params}${self.digest(password, salt)}"
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, PasswordHasher) and (self.algorithm, self.params) == (other.algorithm, other.params)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({', '.join(f'{k}={v}' for k, v in self.params.items())})"
+
+
+class Pbkdf2Sha256Hasher(PasswordHasher):
+    algorithm = "pbkdf2_sha256"
+
+    def __init__(self, iterations: int) -> None:
+        self.iterations = iterations
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> Pbkdf2Sha256Hasher:
+        return cls(iterations=settings.PASSWORD_PBKDF2_ITERATIONS)
+
+    @property
+    def params(self) -> dict[str, int]:
+        return {"iterations": self.iterations}
+
+    def digest(self, password: str, salt: str) -> str:
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), salt.encode(), self.iterations).hex()
+
+
+class ScryptHasher(PasswordHasher):
+    algorithm = "scrypt"
+
+    def __init__(self, n: int, r: int, p: int) -> None:
+        self.n, self.r, self.p = n, r, p
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> ScryptHasher:
+        return cls(n=settings.PASSWORD_SCRYPT_N, r=settings.PASSWORD_SCRYPT_R, p=settings.PASSWORD_SCRYPT_P)
+
+    @property
+    def params(self) -> dict[str, int]:
+        return {"n": self.n, "r": self.r, "p": self.p}
+
+    def digest(self, password: str, salt: str) -> str:
+        # Памяти нужно 128 * n * r байт, с запасом под параметры из настроек
+        maxmem = 256 * self.n * self.r
+        return hashlib.scrypt(password.encode(), salt=salt.encode(), n=self.n, r=self.r, p=self.p, maxmem=maxmem).hex()
+
+
+@lru_cache
+def get_password_hasher() -> PasswordHasher:
+    """Алгоритм, которым хешируются новые пароли"""
+    settings = get_settings()
+    return PASSWORD_HASHERS[settings.PASSWORD_HASHER].from_settings(settings)
+
+
+def identify_hasher(hashed_password: str) -> tuple[PasswordHasher, str]:
+    """Алгоритм и hex-дайджест из сохраненного хеша"""
+    if "$" not in hashed_password:
+        return Pbkdf2Sha256Hasher(iterations=LEGACY_PBKDF2_ITERATIONS), hashed_password
+    algorithm, params, digest = hashed_password.split("$", 2)
+    params = dict(param.split("=", 1) for param in params.split(",") if param)
+    return PASSWORD_HASHERS[algorithm](**{k: int(v) for k, v in params.items()}), digest
+
+
+def hash_password(password: str, salt: str) -> str:
+    """Синхронное хеширование текущим алгоритмом, для CLI и кода вне event loop"""
+    return get_password_hasher().encode(password, salt)
+
+
+def validate_password(password: str, hashed_password: str, salt: str) -> bool:
+    """Проверяет, что хеш пароля совпадает с хешем из БД"""
+    hasher, digest = identify_hasher(hashed_password)
+    return hmac.compare_digest(hasher.digest(password, salt), digest)
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """Хеш посчитан не текущим алгоритмом или с другой стоимостью"""
+    return identify_hasher(hashed_password)[0] != get_password_hasher() or "$" not in hashed_password
+
+
+@lru_cache
+def get_password_executor() -> ThreadPoolExecutor:
+    """Пул для хеширования паролей
+
+    `pbkdf2_hmac` и `scrypt` отпускают GIL на время вычисления, поэтому потоков достаточно.
+    Размер пула ограничивает число одновременно хешируемых паролей, остальные ждут в очереди
+    """
+    return ThreadPoolExecutor(max_workers=get_settings().PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
+
+async def hash_password_async(password: str, salt: str) -> str:
+    """Хеширует пароль в пуле, не блокируя event loop"""
+    return await asyncio.get_running_loop().run_in_executor(get_password_executor(), hash_password, password, salt)
+
+
+async def validate_password_async(password: str, hashed_password: str, salt: str) -> bool:
+    """Проверяет пароль в пуле, не блокируя event loop"""
+    return await asyncio.get_running_loop().run_in_executor(
+        get_password_executor(), validate_password, password, hashed_password, salt
+    )
@@ -0,0 +1,155 @@
+import datetime
+import random
+import threading
+import time
+from abc import ABCMeta, abstractmethod
+from dataclasses import dataclass
+from functools import lru_cache
+
+from sqlalchemy.orm import Session
+
+from auth_backend.exceptions import TooManyRequests
+from auth_backend.models.db import RateLimitWindow
+from auth_backend.settings import get_settings
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Не больше `count` запросов за `window` секунд на одно значение ключа `key` (ip, email, user...)"""
+
+    key: str
+    count: int
+    window: float
+
+
+class RateLimitBackend(metaclass=ABCMeta):
+    """Хранилище счетчиков скользящего окна"""
+
+    @abstractmethod
+    def hit(self, key: str, window_id: int, window: float, *, session: Session | None) -> tuple[int, int]:
+        """Засчитывает запрос в окно `window_id`, отдает счетчики текущего и предыдущего окна"""
+        raise NotImplementedError()
+
+    @abstractmethod
+    def release(self, key: str, window_id: int, *, session: Session | None) -> None:
+        """Отменяет запрос, засчитанный в окно `window_id`"""
+        raise NotImplementedError()
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """Счетчики в памяти процесса, для одного инстанса"""
+
+    PURGE_EVERY = 1024
+
+    def __init__(self) -> None:
+        self._windows: dict[str, tuple[int, int, int, float]] = {}
+        self._hits = 0
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, window_id: int, window: float, *, session: Session | None = None) -> tuple[int, int]:
+        with self._lock:
+            last_id, count, prev_count, _ = self._windows.get(key, (window_id, 0, 0, 0))
+            if last_id == window_id:
+                count += 1
+            elif last_id == window_id - 1:
+                count, prev_count = 1, count
+            else:
+                count, prev_count = 1, 0
+            self._windows[key] = (window_id, count, prev_count, (window_id + 2) * window)
+            self._hits += 1
+            if self._hits % self.PURGE_EVERY == 0:
+                self._purge(time.time())
+            return count, prev_count
+
+    def release(self, key: str, window_id: int, *, session: Session | None = None) -> None:
+        with self._lock:
+            last_id, count, prev_count, expires = self._windows.get(key, (None, 0, 0, 0))
+            if last_id == window_id and count > 0:
+                self._windows[key] = (last_id, count - 1, prev_count, expires)
+
+    def _purge(self, now: float) -> None:
+        for key in [key for key, (*_, expires) in self._windows.items() if expires < now]:
+            del self._windows[key]
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+
+class PostgresRateLimitBackend(RateLimitBackend):
+    """Счетчики в таблице `rate_limit_window`, общие для всех инстансов
+
+    Примерно раз в `PURGE_EVERY` запросов заодно удаляются до `PURGE_BATCH` истекших счетчиков,
+    чтобы таблица не росла без `rate_limit cleanup`.
+    """
+
+    PURGE_EVERY = 1024
+    PURGE_BATCH = 1000
+
+    def hit(self, key: str, window_id: int, window: float, *, session: Session | None) -> tuple[int, int]:
+        expires = datetime.datetime.utcfromtimestamp((window_id + 2) * window)
+        if random.randrange(self.PURGE_EVERY) == 0:
+            RateLimitWindow.cleanup(session=session, limit=self.PURGE_BATCH)
+        return RateLimitWindow.hit(key, window_id, expires, session=session)
+
+    def release(self, key: str, window_id: int, *, session: Session | None) -> None:
+        RateLimitWindow.release(key, window_id, session=session)
+
+
+class RateLimiter:
+    """Ограничитель частоты запросов по алгоритму скользящего окна
+
+    Число запросов за последние `window` секунд оценивается как
+    `count + prev_count * (1 - доля прошедшего текущего окна)`.
+    Отклоненные запросы не засчитываются.
+    """
+
+    def __init__(self, backend: RateLimitBackend, *limits: RateLimit) -> None:
+        self.backend = backend
+        self.limits = limits
+
+    def hit(self, *, session: Session | None = None, now: float | None = None, **values: str | int | None) -> None:
+        """Засчитывает запрос по всем лимитам, для которых передано значение ключа
+
+        Бросает `TooManyRequests` с временем до следующего разрешенного запроса
+        """
+        now = time.time() if now is None else now
+        counted: list[tuple[str, int]] = []
+        for limit in self.limits:
+            value = values.get(limit.key)
+            if value is None:
+                continue
+            window_id, elapsed = divmod(now, limit.window)
+            key, window_id, fraction = f"{limit.key}:{value}", int(window_id), elapsed / limit.window
+            count, prev_count = self.backend.hit(key, window_id, limit.window, session=session)
+            counted.append((key, window_id))
+            if count + prev_count * (1 - fraction) > limit.count:
+                for key, window_id in counted:
+                    self.backend.release(key, window_id, session=session)
+                retry_after = self._retry_after(limit, count - 1, prev_count, fraction)
+                raise TooManyRequests(datetime.timedelta(seconds=retry_after))
+
+    @staticmethod
+    def _retry_after(limit: RateLimit, count: int, prev_count: int, fraction: float) -> float:
+        """Через сколько секунд следующий запрос уложится в лимит, если других запросов не будет"""
+        if count < limit.count and prev_count:
+            # Ждем, пока вклад предыдущего окна не уменьшится достаточно
+            return max(0.0, 1 - (limit.count - count - 1) / prev_count - fraction) * limit.window
+        # Текущее окно станет предыдущим, ждем его конца и часть следующего
+        return (1 - fraction + max(0.0, 1 - (limit.count - 1) / max(count, 1))) * limit.window
+
+
+@lru_cache
+def get_rate_limit_backend() -> RateLimitBackend:
+    if get_settings().RATE_LIMIT_BACKEND == "memory":
+        return MemoryRateLimitBackend()
+    return PostgresRateLimitBackend()
+
+
+def email_rate_limiter() -> RateLimiter:
+    """Лимиты на отправку писем, по ip и по адресу"""
+    settings = get_settings()
+    return RateLimiter(
+        get_rate_limit_backend(),
+        RateLimit("ip", settings.IP_DELAY_COUNT, settings.IP_DELAY_TIME_IN_MINUTES * 60),
+        RateLimit("email", settings.EMAIL_DELAY_COUNT, settings.EMAIL_DELAY_TIME_IN_MINUTES * 60),
+    )
@@ -1,14 +1,24 @@
 import datetime
+from typing import Any
 
+import jwt
+from fastapi import Depends
 from fastapi.exceptions import HTTPException
 from fastapi.openapi.models import APIKey, APIKeyIn
 from fastapi.security.base import SecurityBase
 from fastapi_sqlalchemy import db
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 from starlette.requests import Request
 from starlette.status import HTTP_403_FORBIDDEN
 
-from auth_backend.models.db import UserSession
+from auth_backend.models.db import Scope, UserSession
 from auth_backend.settings import get_settings
+from auth_backend.utils.async_db import get_async_session
+from auth_backend.utils.jwt import decode_jwt
+from auth_backend.utils.session_activity import get_last_activity_buffer
+from auth_backend.utils.session_cache import CachedSession, get_session_cache
 from auth_backend.utils.user_session_basics import session_expires_date
 from auth_backend.utils.user_session_control import SESSION_UPDATE_SCOPE
 
@@ -19,18 +29,26 @@ class UnionAuth(SecurityBase):
     '''Проверяет токен, возвращает пользователя.
 
     Основной метод находится в `__call__`
+
+    Если `stateless=True`, а в настройках включены `JWT_ENABLED` и `JWT_STATELESS_AUTH`,
+    токен проверяется только по подписи и сроку действия, без запроса в БД. Отозванный
+    токен в таком режиме остается валидным до истечения срока, поэтому `stateless`
+    можно включать только на ручках, не чувствительных к отзыву сессий и не отдающих
+    данные пользователей (например, справочник скоупов).
     '''
 
     model = APIKey.model_construct(in_=APIKeyIn.header, name="Authorization")
     scheme_name = "token"
     auto_error: bool
     allow_none: bool
+    stateless: bool
     _scopes: list[str] = []
 
-    def __init__(self, scopes: list[str] = None, allow_none=False, auto_error=False) -> None:
+    def __init__(self, scopes: list[str] = None, allow_none=False, auto_error=False, stateless=False) -> None:
         super().__init__()
         self.auto_error = auto_error
         self.allow_none = allow_none
+        self.stateless = stateless
         self._scopes = scopes or []
 
     def _except(self):
@@ -39,28 +57,109 @@ class UnionAuth(SecurityBase):
         else:
             return None
 
+    def _check_scopes(self, session_scopes: set[str]) -> bool:
+        return len(set([_scope.lower() for _scope in self._scopes]) & session_scopes) == len(set(self._scopes))
+
     async def __call__(
         self,
         request: Request,
+        db_session: AsyncSession = Depends(get_async_session),
     ) -> UserSession:
         token = request.headers.get("Authorization")
         if not token and self.allow_none:
             return None
         if not token:
             return self._except()
-        user_session: UserSession = (
-            UserSession.query(session=db.session).filter(UserSession.token == token).one_or_none()
+        if self.stateless and settings.JWT_ENABLED and settings.JWT_STATELESS_AUTH:
+            claims = self._decode_claims(token)
+            if claims is None:
+                return self._except()
+            if "sid" in claims and "scopes" in claims:
+                return self._session_from_claims(token, claims)
+            # Токен выпущен до включения режима, проверяем его по БД
+        return await self._session_from_db(token, db_session)
+
+    @staticmethod
+    def _decode_claims(token: str) -> dict[str, Any] | None:
+        try:
+            return decode_jwt(token)
+        except jwt.PyJWTError:
+            return None
+
+    def _session_from_claims(self, token: str, claims: dict[str, Any]) -> UserSession:
+        """Собирает сессию из клеймов токена, не обращаясь к БД"""
+        if not self._check_scopes(set(claims["scopes"])):
+            return self._except()
+        return self._detached_session(
+            claims["sid"], int(claims["sub"]), token, datetime.datetime.utcfromtimestamp(claims["exp"])
         )
+
+    def _session_from_cache(self, token: str, cached: CachedSession) -> UserSession:
+        """Собирает сессию из записи кэша, не обращаясь к БД
+
+        Продление сессии со скоупом `auth.session.update` происходит при промахе кэша,
+        то есть не реже раза в `SESSION_CACHE_TTL_SECONDS`
+        """
+        if not self._check_scopes(cached.scope_names):
+            return self._except()
+        return self._detached_session(cached.session_id, cached.user_id, token, cached.expires)
+
+    @staticmethod
+    def _detached_session(session_id: int, user_id: int, token: str, expires: datetime.datetime) -> UserSession:
+        """Привязывает к `db.session` сессию, не загружая ее из БД
+
+        Остальные поля и связи сессии подгрузятся из БД при первом обращении к ним
+        """
+        if settings.SESSION_ACTIVITY_FLUSH_INTERVAL_SECONDS > 0:
+            get_last_activity_buffer().touch(session_id)
+        user_session = UserSession(id=session_id, user_id=user_id, token=token, expires=expires)
+        make_transient_to_detached(user_session)
+        return db.session.merge(user_session, load=False)
+
+    async def _session_from_db(self, token: str, db_session: AsyncSession) -> UserSession:
+        """Проверяет сессию по БД через асинхронную сессию запроса
+
+        Возвращенная сессия привязана к синхронной `db.session`, чтобы ручки на ней
+        могли пользоваться связями. Асинхронные ручки получают ту же сессию из identity map
+        через `db_session.get(UserSession, session.id)`.
+        """
+        session_cache = get_session_cache()
+        cached = session_cache.get(token)
+        if cached and settings.SESSION_ACTIVITY_FLUSH_INTERVAL_SECONDS > 0:
+            # Срок действия проверен кэшем, активность уйдет в БД пачкой: соединение не нужно
+            return self._session_from_cache(token, cached)
+        if cached:
+            user_session: UserSession = await db_session.get(UserSession, cached.session_id)
+        else:
+            user_session: UserSession = await db_session.scalar(select(UserSession).where(UserSession.token == token))
         if not user_session:
-            self._except()
-        user_session.last_activity = datetime.datetime.utcnow()
+            session_cache.invalidate_token(token)
+            return self._except()
+        if settings.SESSION_ACTIVITY_FLUSH_INTERVAL_SECONDS > 0:
+            # Запишется в БД пачкой фоновой задачей, см. `flush_last_activity_periodically`
+            get_last_activity_buffer().touch(user_session.id)
+        else:
+            user_session.last_activity = datetime.datetime.utcnow()
 
         if user_session.expired:
             self._except()
-        session_scopes = user_session.user.scope_names if user_session.is_unbounded else user_session.scope_names
+        if cached:
+            session_scopes = cached.scope_names
+        else:
+            session_scopes = set(await db_session.scalars(user_session.scopes_query(func.lower(Scope.name))))
         if not settings.JWT_ENABLED and SESSION_UPDATE_SCOPE in session_scopes:
             user_session.expires = session_expires_date()
-        db.session.commit()
-        if len(set([_scope.lower() for _scope in self._scopes]) & session_scopes) != len(set(self._scopes)):
+        if not cached and not user_session.expired:
+            session_cache.put(
+                token,
+                CachedSession(
+                    session_id=user_session.id,
+                    user_id=user_session.user_id,
+                    expires=user_session.expires,
+                    scope_names=frozenset(session_scopes),
+                ),
+            )
+        await db_session.commit()
+        if not self._check_scopes(session_scopes):
             self._except()
-        return user_session
+        return db.session.merge(user_session, load=False)
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from functools import lru_cache
+
+from sqlalchemy import DateTime, Integer, column, update, values
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session as DbSession
+from sqlalchemy.orm import sessionmaker
+
+from auth_backend.models.db import UserSession
+
+logger = logging.getLogger(__name__)
+
+
+class LastActivityBuffer:
+    """Буфер времени последней активности сессий
+
+    Вместо UPDATE строки `user_session` на каждый запрос запоминаем в памяти последнее
+    время активности по id сессии и периодически записываем все накопленное одним запросом
+    """
+
+    def __init__(self) -> None:
+        self._pending: dict[int, datetime] = {}
+        self._lock = threading.Lock()
+
+    def touch(self, session_id: int, ts: datetime | None = None) -> None:
+        ts = ts or datetime.utcnow()
+        with self._lock:
+            if session_id not in self._pending or self._pending[session_id] < ts:
+                self._pending[session_id] = ts
+
+    def get(self, session_id: int) -> datetime | None:
+        """Время активности, которое еще не записано в БД"""
+        return self._pending.get(session_id)
+
+    def drain(self) -> dict[int, datetime]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def flush(self, db_session: DbSession) -> int:
+        """Записывает накопленные значения в БД, возвращает количество обновленных сессий"""
+        pending = self.drain()
+        if not pending:
+            return 0
+        rows = values(column("id", Integer), column("last_activity", DateTime), name="activity").data(
+            list(pending.items())
+        )
+        stmt = (
+            update(UserSession)
+            .where(UserSession.id == rows.c.id, UserSession.last_activity < rows.c.last_activity)
+            .values(last_activity=rows.c.last_activity)
+            .execution_options(synchronize_session=False)
+        )
+        try:
+            db_session.execute(stmt)
+            db_session.commit()
+        except SQLAlchemyError:
+            db_session.rollback()
+            for session_id, ts in pending.items():
+                self.touch(session_id, ts)
+            raise
+        return len(pending)
+
+
+@lru_cache
+def get_last_activity_buffer() -> LastActivityBuffer:
+    return LastActivityBuffer()
+
+
+def flush_last_activity(session_factory: sessionmaker) -> int:
+    with session_factory() as db_session:
+        return get_last_activity_buffer().flush(db_session)
+
+
+async def flush_last_activity_periodically(session_factory: sessionmaker, interval: float) -> None:
+    """Фоновая задача, раз в `interval` секунд записывает время активности сессий"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            count = await asyncio.to_thread(flush_last_activity, session_factory)
+            logger.debug("Last activity flushed for %d sessions", count)
+        except Exception as exc:
+            logger.error("Failed to flush last activity", exc_info=exc)
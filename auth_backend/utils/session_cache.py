@@ -0,0 +1,95 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+
+from auth_backend.settings import get_settings
+
+
+@dataclass(frozen=True)
+class CachedSession:
+    session_id: int
+    user_id: int
+    expires: datetime
+    scope_names: frozenset[str]
+
+
+class SessionCache:
+    """LRU-кэш проверенных токенов с ограниченным временем жизни записей
+
+    Токены в памяти не хранятся, ключом является sha256 от токена.
+    Кэш локален для процесса, поэтому время жизни записи ограничивает,
+    насколько долго отозванный в другом воркере токен может оставаться валидным.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, CachedSession]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._maxsize > 0 and self._ttl > 0
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> CachedSession | None:
+        """Отдает запись по токену, если она не устарела и сессия не истекла"""
+        if not self.enabled:
+            return None
+        key = self._key(token)
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            deadline, entry = item
+            if deadline <= time.monotonic() or entry.expires <= datetime.utcnow():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, token: str, entry: CachedSession) -> None:
+        if not self.enabled:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self._ttl, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_token(self, token: str) -> None:
+        with self._lock:
+            self._entries.pop(self._key(token), None)
+
+    def invalidate_session(self, session_id: int) -> None:
+        self._invalidate_where(lambda entry: entry.session_id == session_id)
+
+    def invalidate_user(self, user_id: int) -> None:
+        self._invalidate_where(lambda entry: entry.user_id == user_id)
+
+    def clear(self) -> None:
+        """Сбрасывает весь кэш, используется при изменении групп и скоупов"""
+        with self._lock:
+            self._entries.clear()
+
+    def _invalidate_where(self, predicate) -> None:
+        with self._lock:
+            for key in [key for key, (_, entry) in self._entries.items() if predicate(entry)]:
+                del self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+@lru_cache
+def get_session_cache() -> SessionCache:
+    settings = get_settings()
+    return SessionCache(settings.SESSION_CACHE_SIZE, settings.SESSION_CACHE_TTL_SECONDS)
@@ -0,0 +1,152 @@
+import logging
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Iterator
+
+from auth_backend.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PooledConnection:
+    smtp: smtplib.SMTP
+    sent: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class SMTPConnectionPool:
+    """Пул постоянных SMTP-соединений
+
+    Соединение открывается, проходит STARTTLS и логин один раз и переиспользуется:
+    - перед выдачей из пула соединение проверяется командой NOOP;
+    - соединения, простоявшие дольше `idle_timeout`, закрываются;
+    - после `max_messages` писем соединение закрывается, чтобы не упереться в лимиты сервера;
+    - если сервер закрыл соединение во время отправки, письмо один раз переотправляется через новое.
+
+    Одновременно открыто не больше `size` соединений, остальные отправители ждут.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        login: str | None = None,
+        password: str | None = None,
+        *,
+        starttls: bool = True,
+        size: int = 2,
+        max_messages: int = 100,
+        idle_timeout: float = 60,
+        timeout: float = 30,
+    ) -> None:
+        self.host, self.port = host, port
+        self.login, self.password = login, password
+        self.starttls = starttls
+        self.max_messages = max_messages
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle: list[PooledConnection] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self) -> PooledConnection:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.login:
+                smtp.login(self.login, self.password)
+        except Exception:
+            self._close(smtp)
+            raise
+        return PooledConnection(smtp)
+
+    @staticmethod
+    def _close(smtp: smtplib.SMTP) -> None:
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            smtp.close()
+
+    @staticmethod
+    def _is_alive(smtp: smtplib.SMTP) -> bool:
+        try:
+            return smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _checkout(self) -> tuple[PooledConnection, bool]:
+        """Живое соединение из пула или новое, второй элемент – переиспользовано ли соединение"""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn = self._idle.pop()
+            if time.monotonic() - conn.last_used < self.idle_timeout and self._is_alive(conn.smtp):
+                return conn, True
+            self._close(conn.smtp)
+        return self._connect(), False
+
+    def _checkin(self, conn: PooledConnection) -> None:
+        conn.sent += 1
+        conn.last_used = time.monotonic()
+        if conn.sent >= self.max_messages:
+            self._close(conn.smtp)
+            return
+        with self._lock:
+            self._idle.append(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[tuple[smtplib.SMTP, bool]]:
+        with self._slots:
+            conn, reused = self._checkout()
+            try:
+                yield conn.smtp, reused
+            except Exception:
+                conn.smtp.close()
+                raise
+            self._checkin(conn)
+
+    def sendmail(self, from_addr: str, to_addrs: str | list[str], msg: str) -> None:
+        reused = False
+        try:
+            with self.connection() as (smtp, reused):
+                smtp.sendmail(from_addr, to_addrs, msg)
+                return
+        except smtplib.SMTPServerDisconnected:
+            # Сервер мог закрыть соединение между NOOP и отправкой, пробуем еще раз с новым
+            if not reused:
+                raise
+            logger.info("SMTP connection closed by server, reconnecting")
+        with self.connection() as (smtp, _):
+            smtp.sendmail(from_addr, to_addrs, msg)
+
+    def close(self) -> None:
+        """Закрывает все простаивающие соединения, пул остается рабочим"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._close(conn.smtp)
+
+    def __len__(self) -> int:
+        return len(self._idle)
+
+
+@lru_cache
+def get_smtp_pool() -> SMTPConnectionPool:
+    settings = get_settings()
+    return SMTPConnectionPool(
+        settings.SMTP_HOST,
+        settings.SMTP_PORT,
+        settings.SMTP_LOGIN,
+        settings.SMTP_PASS,
+        starttls=settings.SMTP_STARTTLS,
+        size=settings.SMTP_POOL_SIZE,
+        max_messages=settings.SMTP_POOL_MAX_MESSAGES,
+        idle_timeout=settings.SMTP_POOL_IDLE_TIMEOUT_SECONDS,
+    )
@@ -1,10 +1,12 @@
 from datetime import datetime
 
 from fastapi import HTTPException
-from fastapi_sqlalchemy import db
+from sqlalchemy import func, not_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session as DbSession
 
 from auth_backend.base import StatusResponseModel
+from auth_backend.exceptions import ObjectNotFound
 from auth_backend.models.db import Scope, User, UserSession, UserSessionScope
 from auth_backend.schemas.models import Session
 from auth_backend.schemas.types.scopes import Scope as TypeScope
@@ -18,8 +20,8 @@ SESSION_UPDATE_SCOPE = 'auth.session.update'
 settings = get_settings()
 
 
-async def create_session(
-    user: User,
+def create_session_in_transaction(
+    user_id: int,
     scopes_list_names: list[TypeScope] | None,
     expires: datetime | None = None,
     session_name: str | None = None,
@@ -27,19 +29,24 @@ async def create_session(
     *,
     db_session: DbSession,
 ) -> Session:
-    """Создает сессию пользователя"""
+    """Создает сессию пользователя в транзакции вызывающего, без коммита
+
+    Так сессия фиксируется вместе с остальными изменениями запроса: если запрошенных скоупов
+    нет или они недоступны, откатывается и регистрация, и событие входа
+    """
+    user_scopes = _user_scopes(user_id, db_session)
     if scopes_list_names is None:
-        scopes = user.scopes
+        scopes = user_scopes
     else:
-        scopes = await create_scopes_set_by_names(scopes_list_names)
-        await check_scopes(scopes, user)
+        scopes = _scopes_by_names(scopes_list_names, db_session)
+        _check_scopes(scopes, user_scopes)
     create_ts = datetime.utcnow()
     expire_ts = expires or session_expires_date()
     token = random_string(length=settings.TOKEN_LENGTH)
-    if settings.JWT_ENABLED:
-        token = generate_jwt(user.id, create_ts, expire_ts)
+    if settings.JWT_ENABLED and not settings.JWT_STATELESS_AUTH:
+        token = generate_jwt(user_id, create_ts, expire_ts)
     user_session = UserSession(
-        user_id=user.id,
+        user_id=user_id,
         token=token,
         session_name=session_name,
         create_ts=create_ts,
@@ -48,10 +55,20 @@ async def create_session(
     )
     db_session.add(user_session)
     db_session.flush()
+    if settings.JWT_ENABLED and settings.JWT_STATELESS_AUTH:
+        # В токен кладем id сессии и скоупы, для этого сессия уже должна быть в БД
+        token_scopes = user_scopes if user_session.is_unbounded else scopes
+        user_session.token = generate_jwt(
+            user_id,
+            create_ts,
+            expire_ts,
+            session_id=user_session.id,
+            scopes=[scope.name.lower() for scope in token_scopes],
+        )
     if not user_session.is_unbounded:
         for scope in scopes:
             db_session.add(UserSessionScope(scope_id=scope.id, user_session_id=user_session.id))
-    db_session.commit()
+    db_session.flush()
     return Session(
         session_name=session_name,
         user_id=user_session.user_id,
@@ -59,28 +76,68 @@ async def create_session(
         id=user_session.id,
         expires=user_session.expires,
         is_unbounded=user_session.is_unbounded,
-        session_scopes=[_scope.name for _scope in user_session.scopes],
+        session_scopes=[] if user_session.is_unbounded else [_scope.name for _scope in scopes],
         last_activity=user_session.last_activity,
     )
 
 
-async def create_scopes_set_by_names(scopes_list_names: list[TypeScope]) -> set[Scope]:
-    """Создает множество скоупов из списка"""
+async def create_session(
+    user_id: int,
+    scopes_list_names: list[TypeScope] | None,
+    expires: datetime | None = None,
+    session_name: str | None = None,
+    is_unbounded: bool = False,
+    *,
+    db_session: AsyncSession,
+) -> Session:
+    """Создает сессию пользователя"""
+    session = await db_session.run_sync(
+        lambda sync_session: create_session_in_transaction(
+            user_id, scopes_list_names, expires, session_name, is_unbounded, db_session=sync_session
+        )
+    )
+    await db_session.commit()
+    return session
+
+
+def _user_scopes(user_id: int, db_session: DbSession) -> set[Scope]:
+    return set(db_session.scalars(User.effective_scopes_query(user_id, Scope)))
+
+
+def _scopes_by_names(scopes_list_names: list[TypeScope], db_session: DbSession) -> set[Scope]:
     scopes = set()
     for scope_name in scopes_list_names:
-        scope = Scope.get_by_name(scope_name, session=db.session)
+        scope = db_session.scalar(
+            select(Scope).where(func.lower(Scope.name) == scope_name.lower(), not_(Scope.is_deleted))
+        )
+        if not scope:
+            raise ObjectNotFound(Scope, [scope_name.lower()])
         scopes.add(scope)
     return scopes
 
 
-async def check_scopes(scopes: set[Scope], user: User) -> None:
-    '''Проверяет доступность скоуппов для юзера'''
-    if len(scopes & user.scopes) != len(scopes):
+def _check_scopes(scopes: set[Scope], user_scopes: set[Scope]) -> None:
+    if len(scopes & user_scopes) != len(scopes):
         raise HTTPException(
             status_code=403,
             detail=StatusResponseModel(
                 status="Error",
-                message=f"Incorrect user scopes, triggering scopes -> {[scope.name for scope in scopes - user.scopes]} ",
-                ru=f"Не хватает прав, нужно -> {[scope.name for scope in scopes - user.scopes]}",
+                message=f"Incorrect user scopes, triggering scopes -> {[scope.name for scope in scopes - user_scopes]} ",
+                ru=f"Не хватает прав, нужно -> {[scope.name for scope in scopes - user_scopes]}",
             ).model_dump(),
         )
+
+
+async def get_user_scopes(user_id: int, *, db_session: AsyncSession) -> set[Scope]:
+    """Все скоупы пользователя с учетом групп"""
+    return await db_session.run_sync(lambda sync_session: _user_scopes(user_id, sync_session))
+
+
+async def create_scopes_set_by_names(scopes_list_names: list[TypeScope], *, db_session: AsyncSession) -> set[Scope]:
+    """Создает множество скоупов из списка"""
+    return await db_session.run_sync(lambda sync_session: _scopes_by_names(scopes_list_names, sync_session))
+
+
+async def check_scopes(scopes: set[Scope], user_scopes: set[Scope]) -> None:
+    '''Проверяет доступность скоуппов для юзера'''
+    _check_scopes(scopes, user_scopes)
@@ -0,0 +1,89 @@
+"""Пропускная способность логина и задержка event loop при хешировании паролей
+
+Сравнивает проверку пароля прямо в event loop (как было раньше) и в пуле потоков.
+Параллельно с логинами крутится «проверка токена», которая меряет, насколько
+event loop не успевает обслуживать остальные запросы.
+
+    python -m benchmarks.password_hashing --clients 32 --logins 4 --workers 4
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from auth_backend.utils.password import (
+    get_password_executor,
+    hash_password,
+    validate_password,
+    validate_password_async,
+)
+
+SALT = "benchmark-salt"
+PASSWORD = "benchmark-password"
+
+
+async def login_inline(hashed: str) -> bool:
+    return validate_password(PASSWORD, hashed, SALT)
+
+
+async def login_pooled(hashed: str) -> bool:
+    return await validate_password_async(PASSWORD, hashed, SALT)
+
+
+async def token_checks(stop: asyncio.Event, interval: float) -> list[float]:
+    """Задержки «проверки токена»: насколько позже запланированного event loop дал ей выполниться"""
+    lags = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+    return lags
+
+
+async def run(login, clients: int, logins: int, interval: float) -> tuple[float, list[float]]:
+    hashed = hash_password(PASSWORD, SALT)
+    stop = asyncio.Event()
+    checker = asyncio.create_task(token_checks(stop, interval))
+    await asyncio.sleep(0)
+
+    async def client():
+        for _ in range(logins):
+            assert await login(hashed)
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return clients * logins / elapsed, await checker
+
+
+def report(name: str, throughput: float, lags: list[float]) -> None:
+    lags = sorted(lags) or [0.0]
+    p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))]
+    print(
+        f"{name:>7}: {throughput:8.1f} logins/s, token check lag "
+        f"median {statistics.median(lags) * 1000:7.1f} ms, p99 {p99 * 1000:7.1f} ms, max {lags[-1] * 1000:7.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=32, help="Число одновременных клиентов")
+    parser.add_argument("--logins", type=int, default=4, help="Логинов на клиента")
+    parser.add_argument("--workers", type=int, default=None, help="Размер пула, по умолчанию PASSWORD_HASH_WORKERS")
+    parser.add_argument("--interval", type=float, default=0.005, help="Период проверки токена, секунды")
+    args = parser.parse_args()
+
+    if args.workers:
+        from auth_backend.settings import get_settings
+
+        get_settings().PASSWORD_HASH_WORKERS = args.workers
+    print(f"{args.clients} clients x {args.logins} logins, pool of {get_password_executor()._max_workers} threads")
+    report("inline", *asyncio.run(run(login_inline, args.clients, args.logins, args.interval)))
+    report("pooled", *asyncio.run(run(login_pooled, args.clients, args.logins, args.interval)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""group closure
+
+Revision ID: 0ede28a3f13f
+Revises: ed1a7f2276d4
+Create Date: 2026-10-18 10:12:41.518204
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0ede28a3f13f'
+down_revision = 'ed1a7f2276d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'group_closure',
+        sa.Column('ancestor_id', sa.Integer(), nullable=False),
+        sa.Column('descendant_id', sa.Integer(), nullable=False),
+        sa.Column('depth', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['ancestor_id'], ['group.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['descendant_id'], ['group.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id'),
+    )
+    op.create_index(op.f('ix_group_closure_descendant_id'), 'group_closure', ['descendant_id'], unique=False)
+    # Путь нужен, чтобы не зациклиться на уже существующих циклах в дереве групп
+    op.execute('''
+        WITH RECURSIVE tree(ancestor_id, descendant_id, depth, path) AS (
+            SELECT g.id, g.id, 0, ARRAY[g.id]
+            FROM "group" g
+            WHERE NOT g.is_deleted
+            UNION ALL
+            SELECT p.id, t.descendant_id, t.depth + 1, t.path || p.id
+            FROM tree t
+            JOIN "group" g ON g.id = t.ancestor_id
+            JOIN "group" p ON p.id = g.parent_id AND NOT p.is_deleted
+            WHERE NOT p.id = ANY(t.path)
+        )
+        INSERT INTO group_closure (ancestor_id, descendant_id, depth)
+        SELECT ancestor_id, descendant_id, MIN(depth) FROM tree GROUP BY ancestor_id, descendant_id
+        ''')
+
+
+def downgrade():
+    op.drop_index(op.f('ix_group_closure_descendant_id'), table_name='group_closure')
+    op.drop_table('group_closure')
@@ -0,0 +1,33 @@
+"""kafka outbox
+
+Revision ID: a3c8e1f5d7b9
+Revises: f1a6d3c8b2e5
+Create Date: 2026-10-18 17:42:56.207183
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'a3c8e1f5d7b9'
+down_revision = 'f1a6d3c8b2e5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'kafka_outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('topic', sa.String(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('value', sa.String(), nullable=False),
+        sa.Column('create_ts', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+
+def downgrade():
+    op.drop_table('kafka_outbox')
@@ -0,0 +1,43 @@
+"""user effective scope
+
+Revision ID: a3c94f1d2b7e
+Revises: 0ede28a3f13f
+Create Date: 2026-10-18 11:04:17.902311
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'a3c94f1d2b7e'
+down_revision = '0ede28a3f13f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'user_effective_scope',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('scope_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['scope_id'], ['scope.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', 'scope_id'),
+    )
+    op.create_index(op.f('ix_user_effective_scope_scope_id'), 'user_effective_scope', ['scope_id'], unique=False)
+    op.execute('''
+        INSERT INTO user_effective_scope (user_id, scope_id)
+        SELECT DISTINCT ug.user_id, gs.scope_id
+        FROM user_group ug
+        JOIN "user" u ON u.id = ug.user_id
+        JOIN group_closure gc ON gc.descendant_id = ug.group_id
+        JOIN group_scope gs ON gs.group_id = gc.ancestor_id
+        JOIN scope s ON s.id = gs.scope_id
+        WHERE NOT u.is_deleted AND NOT ug.is_deleted AND NOT gs.is_deleted AND NOT s.is_deleted
+        ''')
+
+
+def downgrade():
+    op.drop_index(op.f('ix_user_effective_scope_scope_id'), table_name='user_effective_scope')
+    op.drop_table('user_effective_scope')
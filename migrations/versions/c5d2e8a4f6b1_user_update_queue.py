@@ -0,0 +1,47 @@
+"""user update queue
+
+Revision ID: c5d2e8a4f6b1
+Revises: a3c8e1f5d7b9
+Create Date: 2026-10-18 19:14:37.625190
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'c5d2e8a4f6b1'
+down_revision = 'a3c8e1f5d7b9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'user_update_queue',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('auth_method', sa.String(), nullable=False),
+        sa.Column('payload', sa.String(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('locked_until', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.String(), nullable=True),
+        sa.Column('create_ts', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    # Уникальность нужна для upsert: на пользователя и метод входа одно ожидающее событие
+    op.create_index(
+        'ix_user_update_queue_user_id_auth_method',
+        'user_update_queue',
+        ['user_id', 'auth_method'],
+        unique=True,
+    )
+    op.create_index('ix_user_update_queue_next_attempt_at', 'user_update_queue', ['next_attempt_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_user_update_queue_next_attempt_at', table_name='user_update_queue')
+    op.drop_index('ix_user_update_queue_user_id_auth_method', table_name='user_update_queue')
+    op.drop_table('user_update_queue')
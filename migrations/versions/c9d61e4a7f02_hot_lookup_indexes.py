@@ -0,0 +1,55 @@
+"""hot lookup indexes
+
+Revision ID: c9d61e4a7f02
+Revises: a3c94f1d2b7e
+Create Date: 2026-10-18 12:21:06.447915
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'c9d61e4a7f02'
+down_revision = 'a3c94f1d2b7e'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_user_session_user_id_expires', 'user_session', ['user_id', 'expires'], None),
+    ('ix_auth_method_auth_method_param_value', 'auth_method', ['auth_method', 'param', 'value'], 'NOT is_deleted'),
+    (
+        'ix_auth_method_auth_method_param_lower_value',
+        'auth_method',
+        ['auth_method', 'param', sa.text('lower(value)')],
+        'NOT is_deleted',
+    ),
+    ('ix_auth_method_user_id_auth_method', 'auth_method', ['user_id', 'auth_method'], 'NOT is_deleted'),
+    ('ix_scope_lower_name', 'scope', [sa.text('lower(name)')], 'NOT is_deleted'),
+    ('ix_user_group_user_id', 'user_group', ['user_id'], 'NOT is_deleted'),
+    ('ix_user_group_group_id', 'user_group', ['group_id'], 'NOT is_deleted'),
+    ('ix_group_scope_group_id', 'group_scope', ['group_id'], 'NOT is_deleted'),
+    ('ix_user_session_scope_user_session_id', 'user_session_scope', ['user_session_id'], 'NOT is_deleted'),
+]
+
+
+def upgrade():
+    # CONCURRENTLY не блокирует запись в таблицы, но не может выполняться внутри транзакции
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=False,
+                if_not_exists=True,
+                postgresql_concurrently=True,
+                postgresql_where=sa.text(where) if where else None,
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
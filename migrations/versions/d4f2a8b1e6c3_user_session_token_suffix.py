@@ -0,0 +1,39 @@
+"""user session token suffix
+
+Revision ID: d4f2a8b1e6c3
+Revises: c9d61e4a7f02
+Create Date: 2026-10-18 13:02:51.116274
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'd4f2a8b1e6c3'
+down_revision = 'c9d61e4a7f02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Индекс по выражению заполняется сразу для всех сессий и не требует отдельной колонки
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_user_session_user_id_token_suffix',
+            'user_session',
+            ['user_id', sa.text('lower(right(token, 4))')],
+            unique=False,
+            if_not_exists=True,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_user_session_user_id_token_suffix',
+            table_name='user_session',
+            if_exists=True,
+            postgresql_concurrently=True,
+        )
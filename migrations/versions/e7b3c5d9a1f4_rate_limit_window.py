@@ -0,0 +1,44 @@
+"""rate limit window
+
+Revision ID: e7b3c5d9a1f4
+Revises: d4f2a8b1e6c3
+Create Date: 2026-10-18 14:21:37.604918
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'e7b3c5d9a1f4'
+down_revision = 'd4f2a8b1e6c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'rate_limit_window',
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('window_id', sa.BigInteger(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('prev_count', sa.Integer(), nullable=False),
+        sa.Column('expires', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+    )
+    op.create_index(op.f('ix_rate_limit_window_expires'), 'rate_limit_window', ['expires'], unique=False)
+    # Задержки писем теперь считаются в rate_limit_window, старые строки живут не дольше окна
+    op.drop_table('user_message_delay')
+
+
+def downgrade():
+    op.create_table(
+        'user_message_delay',
+        sa.Column('delay_time', sa.DateTime(), nullable=False),
+        sa.Column('user_email', sa.String(), nullable=False),
+        sa.Column('user_ip', sa.String(), nullable=False),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.drop_index(op.f('ix_rate_limit_window_expires'), table_name='rate_limit_window')
+    op.drop_table('rate_limit_window')
@@ -0,0 +1,47 @@
+"""email outbox
+
+Revision ID: f1a6d3c8b2e5
+Revises: e7b3c5d9a1f4
+Create Date: 2026-10-18 16:05:12.318804
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'f1a6d3c8b2e5'
+down_revision = 'e7b3c5d9a1f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'email_outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('to_email', sa.String(), nullable=False),
+        sa.Column('template', sa.String(), nullable=False),
+        sa.Column('subject', sa.String(), nullable=False),
+        sa.Column('context', sa.JSON(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('last_error', sa.String(), nullable=True),
+        sa.Column('create_ts', sa.DateTime(), nullable=False),
+        sa.Column('sent_ts', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    # Воркер выбирает только ждущие отправки письма, отправленные в индекс не попадают
+    op.create_index(
+        'ix_email_outbox_next_attempt_at',
+        'email_outbox',
+        ['next_attempt_at'],
+        unique=False,
+        postgresql_where=sa.text("status = 'pending'"),
+    )
+
+
+def downgrade():
+    op.drop_index('ix_email_outbox_next_attempt_at', table_name='email_outbox')
+    op.drop_table('email_outbox')
@@ -31,8 +31,8 @@ def client():
             "token": "123456",
         }
     )
-    client = TestClient(app)
-    yield client
+    with TestClient(app) as client:
+        yield client
     patcher1.stop()
     patcher2.stop()
 
@@ -42,8 +42,8 @@ def client_auth():
     patcher1 = patch("auth_backend.auth_plugins.email.SendEmailMessage.send")
     patcher1.start()
     patcher1.return_value = None
-    client = TestClient(app)
-    yield client
+    with TestClient(app) as client:
+        yield client
     patcher1.stop()
 
 
@@ -207,16 +207,6 @@ def user_scopes(dbsession, user):
     dbsession.commit()
 
 
-@pytest.fixture()
-def client_auth_email_delay():
-    patcher1 = patch("auth_backend.auth_plugins.email.SendEmailMessage.email_task")
-    patcher1.start()
-    patcher1.return_value = None
-    client = TestClient(app)
-    yield client
-    patcher1.stop()
-
-
 @pytest.fixture()
 def yandex_user(dbsession) -> User:
     email = f"{random_string()}@yandex.ru"
@@ -2,26 +2,29 @@ from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 from starlette import status
 
-from auth_backend.models.db import AuthMethod, User
+from auth_backend.models.db import AuthMethod, EmailOutbox, RateLimitWindow, User
+from auth_backend.routes.base import app
 from auth_backend.settings import get_settings
 
 settings = get_settings()
 
 
-def test_message_delay(client_auth_email_delay: TestClient, dbsession: Session):
+def test_message_delay(dbsession: Session):
     ip_delay = get_settings().IP_DELAY_TIME_IN_MINUTES
     email_delay = get_settings().EMAIL_DELAY_TIME_IN_MINUTES
     settings_ = get_settings()
     settings_.IP_DELAY_TIME_IN_MINUTES = 1
     settings_.EMAIL_DELAY_TIME_IN_MINUTES = 1
-    for i in range(settings.IP_DELAY_COUNT):
-        response = client_auth_email_delay.post(
+    # Письма только пишутся в очередь, лимиты проверяются настоящим ограничителем
+    with TestClient(app) as client:
+        for i in range(settings.IP_DELAY_COUNT):
+            response = client.post(
+                "/email/registration", json={"email": f"test-user@profcomff.com", "password": "string"}
+            )
+            assert response.status_code == status.HTTP_200_OK
+        delay_response = client.post(
             "/email/registration", json={"email": f"test-user@profcomff.com", "password": "string"}
         )
-        assert response.status_code == status.HTTP_200_OK
-    delay_response = client_auth_email_delay.post(
-        "/email/registration", json={"email": f"test-user@profcomff.com", "password": "string"}
-    )
     assert delay_response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
     settings_.IP_DELAY_TIME_IN_MINUTES = ip_delay
     settings_.EMAIL_DELAY_TIME_IN_MINUTES = email_delay
@@ -34,4 +37,8 @@ def test_message_delay(client_auth_email_delay: TestClient, dbsession: Session):
         dbsession.delete(row)
     dbsession.flush()
     dbsession.delete(dbsession.query(User).filter(User.id == auth_method.user_id).one())
+    dbsession.query(EmailOutbox).filter(EmailOutbox.to_email == "test-user@profcomff.com").delete()
+    dbsession.query(RateLimitWindow).filter(
+        RateLimitWindow.key.in_(["ip:testclient", "email:test-user@profcomff.com"])
+    ).delete()
     dbsession.commit()
@@ -0,0 +1,96 @@
+import datetime
+import threading
+from unittest.mock import patch
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from auth_backend.models.db import EmailOutbox, RateLimitWindow
+from auth_backend.settings import get_settings
+from auth_backend.utils.async_db import async_dsn
+from auth_backend.utils.email_outbox import process_email_outbox
+from auth_backend.utils.smtp import SendEmailMessage
+from auth_backend.utils.string import random_string
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+@pytest.fixture
+def outbox(dbsession: Session):
+    ip, emails = random_string(), [f"{random_string()}@example.com" for _ in range(2)]
+    for email in emails:
+        SendEmailMessage.send(email, ip, "main_confirmation.html", "Subject", dbsession, url="https://example.com")
+    dbsession.commit()
+    yield emails
+    dbsession.query(EmailOutbox).filter(EmailOutbox.to_email.in_(emails)).delete()
+    dbsession.query(RateLimitWindow).filter(
+        RateLimitWindow.key.in_([f"ip:{ip}", *(f"email:{email}" for email in emails)])
+    ).delete()
+    dbsession.commit()
+
+
+@pytest_asyncio.fixture
+async def async_session():
+    engine = create_async_engine(async_dsn(str(get_settings().DB_DSN)), poolclass=NullPool)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        yield session
+    await engine.dispose()
+
+
+def test_send_enqueues(dbsession: Session, outbox):
+    messages = dbsession.query(EmailOutbox).filter(EmailOutbox.to_email.in_(outbox)).all()
+    assert len(messages) == 2
+    assert {message.status for message in messages} == {EmailOutbox.PENDING}
+    assert messages[0].context == {"url": "https://example.com"}
+
+
+@pytest.mark.asyncio
+async def test_process_outbox(dbsession: Session, async_session: AsyncSession, outbox):
+    sent, failed = outbox
+
+    def email_task(to_email, file_name, subject, **kwargs):
+        if to_email == failed:
+            raise OSError("Connection refused")
+
+    with patch.object(SendEmailMessage, "email_task", side_effect=email_task) as email_task_mock:
+        assert await process_email_outbox(100, session=async_session) >= 2
+    email_task_mock.assert_any_call(sent, "main_confirmation.html", "Subject", url="https://example.com")
+
+    messages = {
+        message.to_email: message for message in dbsession.query(EmailOutbox).filter(EmailOutbox.to_email.in_(outbox))
+    }
+    assert messages[sent].status == EmailOutbox.SENT
+    assert messages[sent].sent_ts is not None
+    assert messages[failed].status == EmailOutbox.PENDING
+    assert messages[failed].attempts == 1
+    assert messages[failed].next_attempt_at > messages[failed].create_ts
+
+    # Письмо с ошибкой ждет повтора и в следующую пачку не попадает
+    with patch.object(SendEmailMessage, "email_task") as email_task_mock:
+        await process_email_outbox(100, session=async_session)
+    assert all(call.args[0] not in outbox for call in email_task_mock.call_args_list)
+
+
+@pytest.mark.asyncio
+async def test_lease_committed_before_send(dbsession: Session, async_session: AsyncSession, outbox):
+    leased, lock = [], threading.Lock()
+
+    def email_task(to_email, file_name, subject, **kwargs):
+        if to_email not in outbox:
+            return
+        # Пока идет отправка, строка не заблокирована, а аренда уже видна другим соединениям
+        with lock:
+            message = (
+                dbsession.query(EmailOutbox).filter(EmailOutbox.to_email == to_email).with_for_update(nowait=True).one()
+            )
+            leased.append(message.next_attempt_at > datetime.datetime.utcnow())
+            dbsession.rollback()
+
+    with patch.object(SendEmailMessage, "email_task", side_effect=email_task):
+        await process_email_outbox(100, session=async_session)
+    assert leased == [True, True]
+    statuses = dbsession.query(EmailOutbox.status).filter(EmailOutbox.to_email.in_(outbox)).all()
+    assert {status for status, in statuses} == {EmailOutbox.SENT}
@@ -1,20 +1,20 @@
 from unittest.mock import patch
 
-import google.auth.exceptions
-import oauthlib.oauth2.rfc6749.errors
 import pytest
 from fastapi.testclient import TestClient
 
+from auth_backend.exceptions import OauthCredentialsIncorrect
+
 
 @pytest.mark.skip('Google should be properly mocked')
 def test_login_ok(client_auth: TestClient):
     """Пользователь существует, просто логинимся в него"""
 
-    patch_check_google_creds = patch("google_auth_oauthlib.flow.Flow.fetch_token")
+    patch_check_google_creds = patch("auth_backend.auth_plugins.google.GoogleAuth._fetch_token")
     patch_check_google_creds.return_value = {"id_token": "abc.123.efg"}
     patch_check_google_creds.start()
 
-    patch_check_google_token = patch("google.oauth2.id_token.verify_oauth2_token")
+    patch_check_google_token = patch("auth_backend.auth_plugins.google.GoogleAuth._verify_id_token")
     patch_check_google_token.return_value = {"sub": "12345"}
     patch_check_google_token.start()
 
@@ -39,11 +39,11 @@ def test_login_ok(client_auth: TestClient):
 def test_login_fail(client_auth: TestClient):
     """Пользователь существует, просто логинимся в него, но с неверными данными гугла"""
 
-    patch_check_google_creds = patch("google_auth_oauthlib.flow.Flow.fetch_token")
-    patch_check_google_creds.side_effect = oauthlib.oauth2.rfc6749.errors.InvalidGrantError()
+    patch_check_google_creds = patch("auth_backend.auth_plugins.google.GoogleAuth._fetch_token")
+    patch_check_google_creds.side_effect = OauthCredentialsIncorrect("invalid_grant", "Запрос к АПИ Гугла неуспешен")
     patch_check_google_creds.start()
 
-    patch_check_google_token = patch("google.oauth2.id_token.verify_oauth2_token")
+    patch_check_google_token = patch("auth_backend.auth_plugins.google.GoogleAuth._verify_id_token")
     patch_check_google_token.return_value = {"sub": "12345"}
     patch_check_google_token.start()
 
@@ -66,11 +66,11 @@ def test_login_fail(client_auth: TestClient):
 def test_register_ok(client_auth: TestClient):
     """Пользователь не сущесвует, пробуем логиниться, а потом регистрируемся"""
 
-    patch_check_google_creds = patch("google_auth_oauthlib.flow.Flow.fetch_token")
+    patch_check_google_creds = patch("auth_backend.auth_plugins.google.GoogleAuth._fetch_token")
     patch_check_google_creds.return_value = {"id_token": "abc.123.efg"}
     patch_check_google_creds.start()
 
-    patch_check_google_token = patch("google.oauth2.id_token.verify_oauth2_token")
+    patch_check_google_token = patch("auth_backend.auth_plugins.google.GoogleAuth._verify_id_token")
     patch_check_google_token.return_value = {"sub": "12345"}
     patch_check_google_token.start()
 
@@ -102,11 +102,11 @@ def test_register_ok(client_auth: TestClient):
 def test_register_fail(client_auth: TestClient):
     """Пользователь не сущесвует, пробуем логиниться, а потом регистрируемся с неверным id_token"""
 
-    patch_check_google_creds = patch("google_auth_oauthlib.flow.Flow.fetch_token")
+    patch_check_google_creds = patch("auth_backend.auth_plugins.google.GoogleAuth._fetch_token")
     patch_check_google_creds.return_value = {"id_token": "abc.123.efg"}
     patch_check_google_creds.start()
 
-    patch_check_google_token = patch("google.oauth2.id_token.verify_oauth2_token")
+    patch_check_google_token = patch("auth_backend.auth_plugins.google.GoogleAuth._verify_id_token")
     patch_check_google_token.return_value = {"sub": "12345"}
     patch_check_google_token.start()
 
@@ -124,7 +124,7 @@ def test_register_fail(client_auth: TestClient):
     assert resp.json().get('id_token') is not None
 
     patch_check_google_token.stop()
-    patch_check_google_token.side_effect = google.auth.exceptions.DefaultCredentialsError()
+    patch_check_google_token.side_effect = OauthCredentialsIncorrect("Invalid token", "Запрос к АПИ Гугла неуспешен")
     patch_check_google_token.start()
 
     resp = client_auth.post(
@@ -141,11 +141,11 @@ def test_register_fail(client_auth: TestClient):
 def test_add_method_ok(client: TestClient):
     """Пользователь залогинен, передаем ему верные данные гугла"""
 
-    patch_check_google_creds = patch("google_auth_oauthlib.flow.Flow.fetch_token")
+    patch_check_google_creds = patch("auth_backend.auth_plugins.google.GoogleAuth._fetch_token")
     patch_check_google_creds.return_value = {"id_token": "abc.123.efg"}
     patch_check_google_creds.start()
 
-    patch_check_google_token = patch("google.oauth2.id_token.verify_oauth2_token")
+    patch_check_google_token = patch("auth_backend.auth_plugins.google.GoogleAuth._verify_id_token")
     patch_check_google_token.return_value = {"sub": "12345"}
     patch_check_google_token.start()
 
@@ -165,11 +165,11 @@ def test_add_method_ok(client: TestClient):
 def test_add_method(client: TestClient):
     """Пользователь залогинен, передаем ему неверные данные гугла"""
 
-    patch_check_google_creds = patch("google_auth_oauthlib.flow.Flow.fetch_token")
-    patch_check_google_creds.side_effect = oauthlib.oauth2.rfc6749.errors.InvalidGrantError()
+    patch_check_google_creds = patch("auth_backend.auth_plugins.google.GoogleAuth._fetch_token")
+    patch_check_google_creds.side_effect = OauthCredentialsIncorrect("invalid_grant", "Запрос к АПИ Гугла неуспешен")
     patch_check_google_creds.start()
 
-    patch_check_google_token = patch("google.oauth2.id_token.verify_oauth2_token")
+    patch_check_google_token = patch("auth_backend.auth_plugins.google.GoogleAuth._verify_id_token")
     patch_check_google_token.return_value = {"sub": "12345"}
     patch_check_google_token.start()
 
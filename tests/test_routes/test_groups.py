@@ -154,6 +154,25 @@ def test_cycle_patch(client, dbsession):
     dbsession.commit()
 
 
+def test_deep_cycle_patch(client, dbsession):
+    ids = []
+    parent_id = None
+    for i in range(3):
+        time = datetime.datetime.utcnow() + datetime.timedelta(days=i)
+        body = {"name": f"group{time}", "parent_id": parent_id, "scopes": []}
+        parent_id = client.post(url="/group", json=body).json()["id"]
+        ids.append(parent_id)
+    response = client.patch(f"/group/{ids[0]}", json={"parent_id": ids[2]})
+    assert response.status_code == 400
+    response = client.patch(f"/group/{ids[2]}", json={"parent_id": ids[0]})
+    assert response.status_code == 200
+    assert [group.id for group in Group.get(ids[2], session=dbsession).parents] == [ids[0]]
+
+    for group_id in reversed(ids):
+        dbsession.query(Group).filter(Group.id == group_id).delete()
+    dbsession.commit()
+
+
 def test_delete(client, dbsession):
     time1 = datetime.datetime.utcnow()
     body = {"name": f"group{time1}", "parent_id": None, "scopes": []}
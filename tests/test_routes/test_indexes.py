@@ -0,0 +1,149 @@
+import datetime
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, event, insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from auth_backend.auth_plugins import YandexAuth
+from auth_backend.models.db import (
+    AuthMethod,
+    Group,
+    RateLimitWindow,
+    Scope,
+    User,
+    UserEffectiveScope,
+    UserGroup,
+    UserSession,
+    UserSessionScope,
+)
+from auth_backend.utils.smtp import EmailDelay
+from auth_backend.utils.string import random_string
+
+pytest_plugins = ('pytest_asyncio',)
+
+SEED_ROWS = 20_000
+# Таблицы, растущие с числом пользователей. Справочники вроде `scope` малы,
+# и последовательное чтение для них планировщик выбирает заслуженно
+HOT_TABLES = {
+    "auth_method",
+    "user_session",
+    "user_session_scope",
+    "user_group",
+    "user_effective_scope",
+    "rate_limit_window",
+}
+
+
+@pytest.fixture
+def seeded(dbsession: Session):
+    """Заполняет горячие таблицы до размеров, на которых планировщик предпочитает индексы"""
+    prefix = random_string()
+    now = datetime.datetime.utcnow()
+    user_ids = dbsession.scalars(insert(User).returning(User.id), [{"is_deleted": False}] * SEED_ROWS).all()
+    dbsession.add(scope := Scope(name=f"{prefix}.seed", creator_id=user_ids[0]))
+    dbsession.add(group := Group(name=f"group{prefix}"))
+    dbsession.flush()
+    dbsession.execute(
+        insert(AuthMethod),
+        [
+            {"user_id": user_id, "auth_method": "email", "param": "email", "value": f"{prefix}{user_id}@example.com"}
+            for user_id in user_ids
+        ],
+    )
+    session_ids = dbsession.scalars(
+        insert(UserSession).returning(UserSession.id),
+        [{"user_id": user_id, "token": f"{prefix}{user_id}", "expires": now} for user_id in user_ids],
+    ).all()
+    dbsession.execute(insert(UserSessionScope), [{"user_session_id": id, "scope_id": scope.id} for id in session_ids])
+    dbsession.execute(insert(UserGroup), [{"user_id": user_id, "group_id": group.id} for user_id in user_ids])
+    dbsession.execute(insert(UserEffectiveScope), [{"user_id": user_id, "scope_id": scope.id} for user_id in user_ids])
+    dbsession.execute(
+        insert(RateLimitWindow),
+        [
+            {"key": f"ip:{prefix}{i}", "window_id": 0, "count": 1, "prev_count": 0, "expires": now}
+            for i in range(SEED_ROWS)
+        ],
+    )
+    dbsession.commit()
+    for table in HOT_TABLES:
+        dbsession.connection().exec_driver_sql(f"ANALYZE {table}")
+    yield
+    dbsession.execute(delete(RateLimitWindow).where(RateLimitWindow.key.startswith(f"ip:{prefix}")))
+    dbsession.execute(delete(UserEffectiveScope).where(UserEffectiveScope.scope_id == scope.id))
+    dbsession.execute(delete(UserGroup).where(UserGroup.group_id == group.id))
+    dbsession.execute(delete(UserSessionScope).where(UserSessionScope.scope_id == scope.id))
+    dbsession.execute(delete(UserSession).where(UserSession.id.in_(session_ids)))
+    dbsession.execute(delete(AuthMethod).where(AuthMethod.user_id.in_(user_ids)))
+    dbsession.execute(delete(Scope).where(Scope.id == scope.id))
+    dbsession.execute(delete(Group).where(Group.id == group.id))
+    dbsession.execute(delete(User).where(User.id.in_(user_ids)))
+    dbsession.commit()
+
+
+@pytest.fixture
+def captured_queries():
+    queries = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "INSERT", "UPDATE", "DELETE")):
+            if conn.dialect.paramstyle == "numeric_dollar":
+                # asyncpg: плейсхолдеры $1, $2... переводим в формат psycopg2
+                parameters = tuple(parameters[int(n) - 1] for n in re.findall(r"\$(\d+)", statement))
+                statement = re.sub(r"\$\d+", "%s", statement)
+            queries.append((statement, parameters))
+
+    event.listen(Engine, "before_cursor_execute", capture)
+    yield queries
+    event.remove(Engine, "before_cursor_execute", capture)
+
+
+def seq_scans(dbsession: Session, queries: list) -> list[str]:
+    """Запросы, для которых планировщик с настройками по умолчанию выбрал Seq Scan по горячим таблицам"""
+    result = []
+    with dbsession.get_bind().connect() as conn:
+        for statement, parameters in queries:
+            plan = "\n".join(conn.exec_driver_sql(f"EXPLAIN {statement}", parameters).scalars())
+            if HOT_TABLES & set(re.findall(r"Seq Scan on (\w+)", plan)):
+                result.append(f"{statement}\n{plan}")
+    return result
+
+
+def test_email_login(client_auth: TestClient, dbsession: Session, user, seeded, captured_queries):
+    response = client_auth.post("/email/login", json=user["body"])
+    assert response.status_code == 200
+    assert captured_queries
+    assert seq_scans(dbsession, captured_queries) == []
+
+
+def test_union_auth(client_auth: TestClient, dbsession: Session, user, seeded, captured_queries):
+    response = client_auth.get("/me", headers={"Authorization": user["login_json"]["token"]})
+    assert response.status_code == 200
+    assert captured_queries
+    assert seq_scans(dbsession, captured_queries) == []
+
+
+@pytest.mark.asyncio
+async def test_oauth_get_user(dbsession: Session, yandex_user: User, seeded, captured_queries):
+    assert await YandexAuth._get_user("user_id", yandex_user.id, db_session=dbsession) == yandex_user
+    assert captured_queries
+    assert seq_scans(dbsession, captured_queries) == []
+
+
+def test_email_delay(dbsession: Session, seeded, captured_queries):
+    ip, email = random_string(), f"{random_string()}@example.com"
+    EmailDelay.delay(ip, email, dbsession)
+    dbsession.commit()
+    assert captured_queries
+    assert seq_scans(dbsession, captured_queries) == []
+    dbsession.query(RateLimitWindow).filter(RateLimitWindow.key.in_([f"ip:{ip}", f"email:{email}"])).delete()
+    dbsession.commit()
+
+
+def test_delete_session_by_suffix(client_auth: TestClient, dbsession: Session, user, seeded, captured_queries):
+    token = user["login_json"]["token"]
+    response = client_auth.delete(f"/session/{token[-4:]}", headers={"Authorization": token})
+    assert response.status_code == 200
+    assert seq_scans(dbsession, captured_queries) == []
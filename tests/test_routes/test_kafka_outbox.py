@@ -0,0 +1,67 @@
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from auth_backend.auth_plugins.email import Email
+from auth_backend.kafka.outbox import relay_kafka_outbox
+from auth_backend.models.db import KafkaOutbox
+from auth_backend.settings import get_settings
+
+
+class FakeProducer:
+    def __init__(self, fail_keys=()):
+        self.fail_keys = set(fail_keys)
+        self.sent = []
+
+    def produce_batch(self, messages, timeout):
+        self.sent.extend(messages)
+        return [key not in self.fail_keys for _, key, _ in messages]
+
+
+@pytest.fixture
+def outbox(dbsession: Session):
+    dbsession.execute(delete(KafkaOutbox))
+    rows = [
+        KafkaOutbox(topic="user-login", user_id=user_id, key=f"{user_id}-{i}", value="{}")
+        for i in range(3)
+        for user_id in (1, 2)
+    ]
+    dbsession.add_all(rows)
+    dbsession.commit()
+    yield rows
+    dbsession.execute(delete(KafkaOutbox))
+    dbsession.commit()
+
+
+def test_relay_in_order(dbsession: Session, outbox):
+    producer = FakeProducer()
+    with patch("auth_backend.kafka.outbox.get_kafka_producer", return_value=producer):
+        assert relay_kafka_outbox(100, session=dbsession) == 6
+    assert [key for _, key, _ in producer.sent] == ["1-0", "2-0", "1-1", "2-1", "1-2", "2-2"]
+    assert dbsession.scalars(select(KafkaOutbox)).all() == []
+
+
+def test_relay_keeps_order_after_failure(dbsession: Session, outbox):
+    producer = FakeProducer(fail_keys={"1-1"})
+    with patch("auth_backend.kafka.outbox.get_kafka_producer", return_value=producer):
+        assert relay_kafka_outbox(100, session=dbsession) == 4
+    # Сообщения пользователя после недоставленного не отправляются, уйдут повторно после него
+    assert [key for _, key, _ in producer.sent] == ["1-0", "2-0", "1-1", "2-1", "2-2"]
+    assert [row.key for row in dbsession.scalars(select(KafkaOutbox).order_by(KafkaOutbox.id))] == ["1-1", "1-2"]
+
+
+def test_login_writes_outbox(client_auth: TestClient, dbsession: Session, user):
+    settings = get_settings()
+    dbsession.execute(delete(KafkaOutbox))
+    dbsession.commit()
+    with patch.object(settings, "KAFKA_DSN", "localhost:9092"):
+        response = client_auth.post("/email/login", json=user["body"])
+    assert response.status_code == 200
+    row = dbsession.scalars(select(KafkaOutbox)).one()
+    assert row.user_id == user["user_id"]
+    assert row.key == Email.generate_kafka_key(user["user_id"]).model_dump_json()
+    dbsession.execute(delete(KafkaOutbox))
+    dbsession.commit()
@@ -1,9 +1,11 @@
 import datetime
+import hashlib
 
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 from starlette import status
 
+from auth_backend.auth_plugins.email import Email
 from auth_backend.models.db import AuthMethod, Group, GroupScope, Scope, User, UserGroup, UserSession
 
 url = "/email/login"
@@ -27,6 +29,22 @@ def test_main_scenario(client_auth: TestClient, dbsession: Session, user):
     assert response.status_code == status.HTTP_200_OK
 
 
+def test_rehash_legacy_password(client_auth: TestClient, dbsession: Session, user):
+    user_id, body = user["user_id"], user["body"]
+    auth_params = Email.get_auth_method_params(user_id, session=dbsession)
+    auth_params["hashed_password"].value = hashlib.pbkdf2_hmac(
+        "sha256", body["password"].encode(), auth_params["salt"].value.encode(), 100_000
+    ).hex()
+    dbsession.commit()
+    response = client_auth.post(url, json=body)
+    assert response.status_code == status.HTTP_200_OK
+    dbsession.expire_all()
+    hashed_password = Email.get_auth_method_params(user_id, session=dbsession)["hashed_password"].value
+    assert hashed_password.startswith("pbkdf2_sha256$")
+    response = client_auth.post(url, json=body)
+    assert response.status_code == status.HTTP_200_OK
+
+
 def test_incorrect_data(client_auth: TestClient, dbsession: Session):
     body1 = {"email": f"user{datetime.datetime.utcnow()}@example.com", "password": "string", "scopes": []}
     body2 = {"email": "wrong@example.com", "password": "string", "scopes": []}
@@ -1,12 +1,20 @@
+import asyncio
 import datetime
 import random
 import string
 
+import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
 from starlette import status
 
 from auth_backend.models.db import AuthMethod, User, UserSession
+from auth_backend.settings import get_settings
+from auth_backend.utils.async_db import async_dsn
+
+pytest_plugins = ('pytest_asyncio',)
 
 url = "/email/registration"
 
@@ -169,3 +177,21 @@ def test_double_email_registration(client_auth: TestClient, dbsession: Session,
     assert response.status_code == status.HTTP_409_CONFLICT
     response = client_auth.post(url, headers={"Authorization": token_}, json=body3)
     assert response.status_code == status.HTTP_409_CONFLICT
+
+
+@pytest.mark.asyncio
+async def test_lock_keyed_by_email():
+    engine = create_async_engine(async_dsn(str(get_settings().DB_DSN)), poolclass=NullPool)
+    try:
+        async with AsyncSession(engine) as session1, AsyncSession(engine) as session2:
+            async with AuthMethod.lock(session1, "email:a@example.com"):
+                # Другая почта не ждет
+                async with AuthMethod.lock(session2, "email:b@example.com"):
+                    pass
+                # Та же почта ждет, пока первая транзакция не завершится
+                with pytest.raises(TimeoutError):
+                    async with asyncio.timeout(0.5):
+                        async with AuthMethod.lock(session2, "email:a@example.com"):
+                            pass
+    finally:
+        await engine.dispose()
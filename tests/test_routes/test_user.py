@@ -1,10 +1,11 @@
+import json
 from datetime import datetime
 
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 
 from auth_backend.models import AuthMethod, User
-from auth_backend.models.db import Group, GroupScope, UserGroup
+from auth_backend.models.db import Group, GroupScope, Scope, UserGroup
 
 
 def test_user_email(client: TestClient, dbsession: Session, user_factory):
@@ -49,3 +50,53 @@ def test_delete_user(client_auth: TestClient, dbsession: Session, user_factory,
     dbsession.query(Group).filter(Group.id == group).delete()
     dbsession.delete(email_user)
     dbsession.commit()
+
+
+def test_user_inherited_scopes(client: TestClient, dbsession: Session, user_factory):
+    user1 = user_factory(client)
+    time1 = datetime.utcnow()
+    dbsession.add(scope := Scope(name=f"test.scope.{time1}", creator_id=user1))
+    dbsession.commit()
+    body = {"name": f"group{time1}", "parent_id": None, "scopes": [scope.id]}
+    parent = client.post(url="/group", json=body).json()["id"]
+    body = {"name": f"group{datetime.utcnow()}", "parent_id": parent, "scopes": []}
+    child = client.post(url="/group", json=body).json()["id"]
+    client.patch(f"/user/{user1}", json={"groups": [child]})
+    resp = client.get(f"/user/{user1}", params={"info": ["scopes"]})
+    assert scope.id in [row["id"] for row in resp.json()["user_scopes"]]
+    client.patch(f"/group/{child}", json={"parent_id": None})
+    resp = client.get(f"/user/{user1}", params={"info": ["scopes"]})
+    assert scope.id not in [row["id"] for row in resp.json()["user_scopes"]]
+
+    dbsession.query(GroupScope).filter(GroupScope.group_id == parent).delete()
+    for row in dbsession.query(UserGroup).filter(UserGroup.user_id == user1).all():
+        dbsession.delete(row)
+    dbsession.query(Group).filter(Group.id == child).delete()
+    dbsession.query(Group).filter(Group.id == parent).delete()
+    dbsession.delete(scope)
+    dbsession.commit()
+
+
+def test_get_users_pages(client: TestClient, dbsession: Session, user_factory):
+    users = [user_factory(client) for _ in range(3)]
+    body = {"name": f"group{datetime.utcnow()}", "parent_id": None, "scopes": []}
+    group = client.post(url="/group", json=body).json()["id"]
+    for user_id in users:
+        client.patch(f"/user/{user_id}", json={"groups": [group]})
+
+    params = {"group_id": group, "limit": 2, "info": ["groups", "indirect_groups"]}
+    first = client.get("/user", params=params).json()
+    assert [row["id"] for row in first["items"]] == users[:2]
+    assert all(group in row["groups"] and group in row["indirect_groups"] for row in first["items"])
+    second = client.get("/user", params=params | {"after_id": first["next_after_id"]}).json()
+    assert [row["id"] for row in second["items"]] == users[2:]
+    assert "next_after_id" not in second
+
+    resp = client.get("/user", params={"group_id": group, "stream": True})
+    assert resp.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line)["id"] for line in resp.text.splitlines()] == users
+
+    for row in dbsession.query(UserGroup).filter(UserGroup.group_id == group).all():
+        dbsession.delete(row)
+    dbsession.query(Group).filter(Group.id == group).delete()
+    dbsession.commit()
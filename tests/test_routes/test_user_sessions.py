@@ -1,11 +1,17 @@
 import logging
 from datetime import datetime, timedelta
 
+import pytest
+from sqlalchemy import create_engine
 from sqlalchemy.orm import Session
 from starlette import status
 from starlette.testclient import TestClient
 
-from auth_backend.models.db import Group, GroupScope, Scope, UserGroup, UserSession, UserSessionScope
+from auth_backend.auth_method import LoginableMixin
+from auth_backend.exceptions import ObjectNotFound
+from auth_backend.models.db import Group, GroupScope, Scope, User, UserGroup, UserSession, UserSessionScope
+from auth_backend.settings import get_settings
+from auth_backend.utils.session_cache import get_session_cache
 
 logger = logging.getLogger(__name__)
 
@@ -217,3 +223,57 @@ def test_create_unbounded_session(client_auth: TestClient, user_scopes, dbsessio
     dbsession.query(UserGroup).filter(UserGroup.group_id == _group1).delete()
     dbsession.query(Group).filter(Group.id == _group1).delete()
     dbsession.commit()
+
+
+@pytest.mark.asyncio
+async def test_create_session_in_request_transaction(dbsession: Session):
+    # Плагины на синхронной сессии: недоступные скоупы откатывают и созданного пользователя
+    engine = create_engine(str(get_settings().DB_DSN))
+    with Session(engine) as session:
+        user = User()
+        session.add(user)
+        session.flush()
+        user_id = user.id
+        with pytest.raises(ObjectNotFound):
+            await LoginableMixin._create_session(user, [f"missing.scope.{datetime.utcnow()}"], db_session=session)
+        session.rollback()
+    engine.dispose()
+    assert dbsession.get(User, user_id) is None
+
+
+def test_revoked_cached_session(client_auth: TestClient, user_scopes):
+    # Сессии отзываются сразу, даже если токен уже проверен и лежит в кэше
+    header = {"Authorization": user_scopes[0]}
+    for revoke in (
+        lambda token: client_auth.post("/logout", headers={"Authorization": token}),
+        lambda token: client_auth.delete(f"/session/{token}", headers=header),
+        lambda token: client_auth.delete("/session", headers=header),
+    ):
+        token = client_auth.post("/session", headers=header, json={}).json()["token"]
+        assert client_auth.get("/me", headers={"Authorization": token}).status_code == status.HTTP_200_OK
+        assert get_session_cache().get(token) is not None
+        assert revoke(token).status_code == status.HTTP_200_OK
+        assert client_auth.get("/me", headers={"Authorization": token}).status_code == status.HTTP_403_FORBIDDEN
+
+
+def test_group_scopes_cached_session(client_auth: TestClient, user_scopes, dbsession):
+    token_, user = user_scopes
+    scope = dbsession.query(Scope).filter(Scope.name == "auth.group.read").one()
+    headers = {"Authorization": token_}
+    group_id = client_auth.post(
+        url="/group", json={"name": f"group{datetime.utcnow()}", "parent_id": None, "scopes": []}, headers=headers
+    ).json()["id"]
+    client_auth.patch(f"/user/{user['user_id']}", json={"groups": [group_id]}, headers=headers)
+    token = client_auth.post("/session", json={"is_unbounded": True}, headers=headers).json()["token"]
+    response = client_auth.get(f"/group/{group_id}", headers={"Authorization": token})
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+    assert get_session_cache().get(token) is not None
+    client_auth.patch(f"/group/{group_id}", json={"scopes": [scope.id]}, headers=headers)
+    response = client_auth.get(f"/group/{group_id}", headers={"Authorization": token})
+    assert response.status_code == status.HTTP_200_OK
+    client_auth.patch(f"/group/{group_id}", json={"scopes": []}, headers=headers)
+    response = client_auth.get(f"/group/{group_id}", headers={"Authorization": token})
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+    dbsession.query(UserGroup).filter(UserGroup.group_id == group_id).delete()
+    dbsession.query(Group).filter(Group.id == group_id).delete()
+    dbsession.commit()
@@ -0,0 +1,195 @@
+import asyncio
+import datetime
+import threading
+from unittest.mock import patch
+
+import pytest
+import pytest_asyncio
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from auth_backend.auth_method import AuthPluginMeta
+from auth_backend.auth_method.user_update import (
+    enqueue_user_update,
+    load_payload,
+    process_user_update_queue,
+    schedule_user_update,
+    wait_user_updates,
+)
+from auth_backend.auth_plugins.email import Email
+from auth_backend.models.db import AuthMethod, User, UserUpdateQueue
+from auth_backend.settings import get_settings
+from auth_backend.utils.async_db import async_dsn
+
+pytest_plugins = ('pytest_asyncio',)
+
+USER_ID = 2_000_000_001
+
+
+class Outer:
+    calls = []
+    during_call = None
+
+    @classmethod
+    def get_name(cls):
+        return "outer"
+
+    @classmethod
+    async def on_user_update(cls, new_user, old_user=None):
+        cls.calls.append(new_user)
+        if cls.during_call:
+            await cls.during_call()
+
+
+@pytest.fixture
+def queue(dbsession: Session):
+    Outer.calls, Outer.during_call = [], None
+    yield
+    dbsession.query(UserUpdateQueue).filter(UserUpdateQueue.user_id == USER_ID).delete()
+    dbsession.commit()
+
+
+@pytest_asyncio.fixture
+async def async_session():
+    engine = create_async_engine(async_dsn(str(get_settings().DB_DSN)), poolclass=NullPool)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        yield session
+    await engine.dispose()
+
+
+def rows(dbsession: Session) -> list[UserUpdateQueue]:
+    dbsession.expire_all()
+    return dbsession.query(UserUpdateQueue).filter(UserUpdateQueue.user_id == USER_ID).all()
+
+
+@pytest.mark.asyncio
+async def test_enqueue_merges_pending(dbsession: Session, async_session: AsyncSession, queue):
+    old_user = {"user_id": USER_ID, "email": {"hashed_password": "old"}}
+    await enqueue_user_update(
+        async_session, USER_ID, "outer", {"user_id": USER_ID, "email": {"password": "first"}}, old_user
+    )
+    await enqueue_user_update(
+        async_session, USER_ID, "outer", {"user_id": USER_ID, "email": {"password": "second"}}, {"user_id": USER_ID}
+    )
+    await async_session.commit()
+    (row,) = rows(dbsession)
+    assert row.version == 1
+    assert load_payload(row.payload) == ({"user_id": USER_ID, "email": {"password": "second"}}, old_user)
+    assert set(await async_session.scalars(UserUpdateQueue.pending_query(USER_ID))) == {"outer"}
+
+
+@pytest.mark.asyncio
+async def test_password_survives_later_event(
+    client_auth: TestClient, dbsession: Session, async_session: AsyncSession, queue
+):
+    # Смена пароля не дошла до внешнего сервиса, следом пользователь привязал GitHub
+    new_user = {"user_id": USER_ID, "email": {"password": "new"}}
+    await enqueue_user_update(async_session, USER_ID, "outer", new_user, {"user_id": USER_ID})
+    await enqueue_user_update(
+        async_session, USER_ID, "outer", {"user_id": USER_ID, "github": {"id": "1"}}, {"user_id": USER_ID}
+    )
+    await async_session.commit()
+
+    assert await process_user_update_queue(100, session=dbsession, methods={"outer": Outer}) >= 1
+    assert Outer.calls == [{"user_id": USER_ID, "email": {"password": "new"}, "github": {"id": "1"}}]
+    assert rows(dbsession) == []
+
+
+@pytest.mark.asyncio
+async def test_process_queue(client_auth: TestClient, dbsession: Session, async_session: AsyncSession, queue):
+    # client_auth запускает приложение, а с ним и db.session, нужный воркеру
+    new_user = {"user_id": USER_ID, "email": {"password": "new"}}
+    await enqueue_user_update(async_session, USER_ID, "outer", new_user, {"user_id": USER_ID})
+    await enqueue_user_update(async_session, USER_ID, "disabled", new_user, {"user_id": USER_ID})
+    await async_session.commit()
+
+    assert await process_user_update_queue(100, session=dbsession, methods={"outer": Outer}) >= 2
+    assert Outer.calls == [new_user]
+    (row,) = rows(dbsession)
+    assert row.auth_method == "disabled"
+    assert row.attempts == 1
+    assert row.locked_until is None
+    assert "LookupError" in row.last_error
+
+
+@pytest.mark.asyncio
+async def test_enqueue_while_worker_calls(
+    client_auth: TestClient, dbsession: Session, async_session: AsyncSession, queue
+):
+    await enqueue_user_update(
+        async_session, USER_ID, "outer", {"user_id": USER_ID, "email": {"password": "first"}}, {"user_id": USER_ID}
+    )
+    await async_session.commit()
+
+    async def password_changed_again():
+        # Воркер не держит блокировку строки, новое событие не ждет конца попытки
+        await asyncio.wait_for(
+            enqueue_user_update(
+                async_session,
+                USER_ID,
+                "outer",
+                {"user_id": USER_ID, "email": {"password": "second"}},
+                {"user_id": USER_ID},
+            ),
+            5,
+        )
+        await async_session.commit()
+
+    Outer.during_call = password_changed_again
+    assert await process_user_update_queue(100, session=dbsession, methods={"outer": Outer}) >= 1
+    # Попытка прошла, но пришло новое событие: строка остается и повторяется сразу
+    (row,) = rows(dbsession)
+    assert row.version == 1
+    assert row.locked_until is None
+    assert load_payload(row.payload)[0]["email"]["password"] == "second"
+    assert row.attempts == 0
+
+
+@pytest.mark.asyncio
+async def test_schedule_in_request_transaction(
+    client_auth: TestClient, dbsession: Session, async_session: AsyncSession, queue
+):
+    new_user = {"user_id": USER_ID, "email": {"password": "new"}}
+    await schedule_user_update(async_session, [Outer], new_user, {"user_id": USER_ID})
+    await async_session.rollback()
+    await wait_user_updates()
+    # Изменения запроса откатились, событие вместе с ними
+    assert Outer.calls == []
+    assert rows(dbsession) == []
+
+    await schedule_user_update(async_session, [Outer], new_user, {"user_id": USER_ID})
+    assert Outer.calls == []
+    await async_session.commit()
+    # Строку, взятую запросом, воркер не отправляет второй раз
+    await process_user_update_queue(100, session=dbsession, methods={"outer": Outer})
+    await wait_user_updates()
+    assert Outer.calls == [new_user]
+    assert rows(dbsession) == []
+
+
+def test_registration_lock_released(client_auth: TestClient, dbsession: Session, queue):
+    # Внешний сервис вызывается после коммита регистрации, блокировка почты к этому времени отпущена
+    email = f"user{datetime.datetime.utcnow()}@example.com"
+    lock_key = func.hashtextextended(f"{AuthMethod.__tablename__}:{Email._lock_key(email)}", 0)
+    lock_free, called = [], threading.Event()
+
+    async def check_lock():
+        with dbsession.get_bind().connect() as conn:
+            lock_free.append(conn.scalar(select(func.pg_try_advisory_lock(lock_key))))
+            conn.execute(select(func.pg_advisory_unlock_all()))
+        called.set()
+
+    Outer.during_call = check_lock
+    with patch.object(AuthPluginMeta, "active_auth_methods", return_value=[Outer]):
+        response = client_auth.post("/email/registration", json={"email": email, "password": "string"})
+        assert response.status_code == 200
+        assert called.wait(5)
+    assert lock_free == [True]
+    user_id = Outer.calls[0]["user_id"]
+    dbsession.query(AuthMethod).filter(AuthMethod.user_id == user_id).delete()
+    dbsession.query(UserUpdateQueue).filter(UserUpdateQueue.user_id == user_id).delete()
+    dbsession.query(User).filter(User.id == user_id).delete()
+    dbsession.commit()
@@ -0,0 +1,23 @@
+import datetime
+
+from auth_backend.models.db import EmailOutbox
+from auth_backend.settings import get_settings
+from auth_backend.utils.email_outbox import email_backoff
+
+
+def test_backoff():
+    settings = get_settings()
+    assert email_backoff(1).total_seconds() == settings.EMAIL_OUTBOX_BACKOFF_SECONDS
+    assert email_backoff(3).total_seconds() == settings.EMAIL_OUTBOX_BACKOFF_SECONDS * 4
+    assert email_backoff(100).total_seconds() == settings.EMAIL_OUTBOX_MAX_BACKOFF_SECONDS
+
+
+def test_mark_failed():
+    message = EmailOutbox(status=EmailOutbox.PENDING, attempts=0)
+    message.mark_failed("error", datetime.timedelta(seconds=10), max_attempts=2)
+    assert message.status == EmailOutbox.PENDING
+    assert message.next_attempt_at > datetime.datetime.utcnow()
+    message.mark_failed("error", datetime.timedelta(seconds=10), max_attempts=2)
+    assert message.status == EmailOutbox.FAILED
+    assert message.attempts == 2
+    assert message.last_error == "error"
@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from auth_backend.auth_plugins.email import Email
+from auth_backend.utils.email_template import EmailTemplate, EmailTemplates
+
+
+def test_render():
+    template = EmailTemplate.compile("<a href='{{url}}'>{{url}}</a> {{name}}!")
+    assert template.placeholders == ("url", "url", "name")
+    assert template.render(url="https://example.com", name="Иван") == (
+        "<a href='https://example.com'>https://example.com</a> Иван!"
+    )
+    # Без значения плейсхолдер остается в тексте
+    assert template.render(url="u") == "<a href='u'>u</a> {{name}}!"
+    assert EmailTemplate.compile("no placeholders").render(url="u") == "no placeholders"
+
+
+def test_reload(tmp_path):
+    path = tmp_path / "mail.html"
+    path.write_text("Hello {{name}}")
+    cached, reloaded = EmailTemplates(tmp_path), EmailTemplates(tmp_path, reload=True)
+    path.write_text("Bye {{name}}")
+    os.utime(path, (0, 0))
+    assert cached.render("mail.html", name="user") == "Hello user"
+    assert reloaded.render("mail.html", name="user") == "Bye user"
+
+
+def test_check(tmp_path):
+    (tmp_path / "mail.html").write_text("Hello {{name}}")
+    templates = EmailTemplates(tmp_path)
+    templates.check({"mail.html": {"name"}})
+    with pytest.raises(ValueError, match="missing placeholders \\['url'\\]"):
+        templates.check({"mail.html": {"name", "url"}})
+    with pytest.raises(ValueError, match="other.html: template not found"):
+        templates.check({"other.html": set()})
+
+
+def test_email_plugin_templates():
+    EmailTemplates().check(Email.templates)
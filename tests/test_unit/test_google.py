@@ -0,0 +1,120 @@
+import time
+from unittest.mock import patch
+
+import jwt
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from auth_backend.auth_plugins.google import GoogleAuth
+from auth_backend.exceptions import OauthCredentialsIncorrect
+from auth_backend.utils.http import get_http_clients
+from auth_backend.utils.oidc_keys import get_oidc_provider
+
+pytest_plugins = ('pytest_asyncio',)
+
+CLIENT_ID = "client.apps.googleusercontent.com"
+PRIVATE_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def make_id_token(**claims) -> str:
+    now = int(time.time())
+    payload = {"iss": "https://accounts.google.com", "aud": CLIENT_ID, "sub": "1", "iat": now, "exp": now + 60}
+    return jwt.encode(payload | claims, PRIVATE_KEY, "RS256", headers={"kid": "google"})
+
+
+@pytest_asyncio.fixture
+async def google():
+    requests = []
+
+    async def token(request: web.Request):
+        data = dict(await request.post())
+        requests.append(data)
+        if data["code"] == "good":
+            return web.json_response({"access_token": "access", "id_token": "id"})
+        if data["code"] == "bad":
+            return web.json_response({"error": "invalid_grant", "error_description": "Bad Request"}, status=400)
+        return web.Response(text="<html>Bad Gateway</html>", content_type="text/html", status=502)
+
+    async def configuration(request: web.Request):
+        return web.json_response(
+            {"jwks_uri": str(request.url.with_path("/jwks")), "id_token_signing_alg_values_supported": ["RS256"]}
+        )
+
+    async def jwks(request: web.Request):
+        jwk = jwt.algorithms.RSAAlgorithm.to_jwk(PRIVATE_KEY.public_key(), as_dict=True)
+        return web.json_response({"keys": [{**jwk, "kid": "google", "use": "sig", "alg": "RS256"}]})
+
+    app = web.Application()
+    app.router.add_post("/token", token)
+    app.router.add_get("/.well-known/openid-configuration", configuration)
+    app.router.add_get("/jwks", jwks)
+    async with TestServer(app) as server:
+        credentials = {
+            "web": {"client_id": CLIENT_ID, "client_secret": "secret", "token_uri": str(server.make_url("/token"))}
+        }
+        with (
+            patch.object(GoogleAuth.settings, "GOOGLE_CREDENTIALS", credentials),
+            patch(
+                "auth_backend.auth_plugins.google.GOOGLE_OIDC_CONFIGURATION_URL",
+                str(server.make_url("/.well-known/openid-configuration")),
+            ),
+        ):
+            yield requests
+    get_oidc_provider.cache_clear()
+    await get_http_clients().close()
+
+
+@pytest.mark.asyncio
+async def test_fetch_token(google: list):
+    assert await GoogleAuth._fetch_token("good") == {"access_token": "access", "id_token": "id"}
+    assert google[0] == {
+        "grant_type": "authorization_code",
+        "code": "good",
+        "client_id": CLIENT_ID,
+        "client_secret": "secret",
+        "redirect_uri": GoogleAuth.settings.GOOGLE_REDIRECT_URL,
+    }
+
+
+@pytest.mark.asyncio
+async def test_fetch_token_error(google: list):
+    with pytest.raises(OauthCredentialsIncorrect, match="Bad Request"):
+        await GoogleAuth._fetch_token("bad")
+
+
+@pytest.mark.asyncio
+async def test_fetch_token_not_json(google: list):
+    with pytest.raises(OauthCredentialsIncorrect):
+        await GoogleAuth._fetch_token("html")
+
+
+@pytest.mark.asyncio
+async def test_verify_id_token(google: list):
+    assert (await GoogleAuth._verify_id_token(make_id_token()))["sub"] == "1"
+    assert (await GoogleAuth._verify_id_token(make_id_token(iss="accounts.google.com")))["sub"] == "1"
+    # Расхождение часов с Google в пределах секунды допустимо
+    assert (await GoogleAuth._verify_id_token(make_id_token(nbf=int(time.time()) + 1)))["sub"] == "1"
+
+
+@pytest.mark.parametrize(
+    "claims",
+    [
+        {"iss": "https://evil.example.com"},
+        {"aud": "other.apps.googleusercontent.com"},
+        {"exp": int(time.time()) - 10},
+        {"nbf": int(time.time()) + 10},
+    ],
+)
+@pytest.mark.asyncio
+async def test_verify_id_token_invalid(google: list, claims: dict):
+    with pytest.raises(OauthCredentialsIncorrect):
+        await GoogleAuth._verify_id_token(make_id_token(**claims))
+
+
+@pytest.mark.asyncio
+async def test_verify_id_token_missing(google: list):
+    with pytest.raises(OauthCredentialsIncorrect):
+        await GoogleAuth._verify_id_token(None)
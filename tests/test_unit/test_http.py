@@ -0,0 +1,87 @@
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from auth_backend.settings import Settings
+from auth_backend.utils.http import HttpClientOptions, HttpClients, build_http_clients
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+@pytest_asyncio.fixture
+async def server():
+    calls = {"flaky": 0, "post": 0}
+
+    async def ok(request: web.Request):
+        return web.json_response({"peer": request.transport.get_extra_info("peername")[1]})
+
+    async def flaky(request: web.Request):
+        calls["flaky"] += 1
+        return web.json_response({}, status=503 if calls["flaky"] < 3 else 200)
+
+    async def post(request: web.Request):
+        calls["post"] += 1
+        return web.json_response({}, status=503)
+
+    app = web.Application()
+    app.router.add_get("/ok", ok)
+    app.router.add_get("/flaky", flaky)
+    app.router.add_post("/flaky", post)
+    async with TestServer(app) as server:
+        server.calls = calls
+        yield server
+
+
+@pytest_asyncio.fixture
+async def clients():
+    clients = HttpClients(HttpClientOptions(), {"retrying": HttpClientOptions(retries=2, backoff=0)})
+    yield clients
+    await clients.close()
+
+
+@pytest.mark.asyncio
+async def test_connection_reused(server: TestServer, clients: HttpClients):
+    client = clients.get("provider")
+    assert clients.get("provider") is client
+    peers = set()
+    for _ in range(3):
+        async with client.get(str(server.make_url("/ok"))) as response:
+            peers.add((await response.json())["peer"])
+    assert len(peers) == 1
+
+
+@pytest.mark.asyncio
+async def test_retry_idempotent(server: TestServer, clients: HttpClients):
+    async with clients.get("retrying").get(str(server.make_url("/flaky"))) as response:
+        assert response.status == 200
+    assert server.calls["flaky"] == 3
+
+    async with clients.get("retrying").post(str(server.make_url("/flaky"))) as response:
+        assert response.status == 503
+    assert server.calls["post"] == 1
+
+
+@pytest.mark.asyncio
+async def test_close(clients: HttpClients):
+    client = clients.get("provider")
+    await clients.close()
+    assert client.session.closed
+    assert clients.get("provider") is not client
+
+
+@pytest.mark.asyncio
+async def test_providers_from_settings(server: TestServer, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("HTTP_CLIENT_PROVIDERS", '{"github": {"retries": 2, "limit": 5}}')
+    clients = build_http_clients(Settings())
+    assert clients.providers["github"] == HttpClientOptions(limit=5, retries=2)
+    async with clients.get("github").get(str(server.make_url("/flaky"))) as response:
+        assert response.status == 200
+    assert server.calls["flaky"] == 3
+    await clients.close()
+
+
+def test_providers_unknown_option(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("HTTP_CLIENT_PROVIDERS", '{"github": {"retry": 2}}')
+    with pytest.raises(ValueError):
+        Settings()
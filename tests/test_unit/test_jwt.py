@@ -34,3 +34,21 @@ def test_decode_jwks():
     assert dct["iat"] == int(iat.timestamp())
     assert dct["exp"] == int(exp.timestamp())
     assert dct["iss"] == settings.APPLICATION_HOST
+
+
+def test_decode_stateless_claims():
+    iat = datetime.now()
+    exp = iat + timedelta(days=5)
+    token = generate_jwt(123, iat, exp, session_id=42, scopes=["auth.user.read", "auth.group.read"])
+    dct = decode_jwt(token)
+    assert dct["sub"] == "123"
+    assert dct["sid"] == 42
+    assert dct["scopes"] == ["auth.group.read", "auth.user.read"]
+
+
+def test_no_stateless_claims_by_default():
+    iat = datetime.now()
+    token = generate_jwt(123, iat, iat + timedelta(days=5))
+    dct = decode_jwt(token)
+    assert "sid" not in dct
+    assert "scopes" not in dct
@@ -0,0 +1,158 @@
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from event_schema.auth import UserLogin, UserLoginKey
+
+from auth_backend.kafka.kafka import Kafka, TopicCache
+from auth_backend.settings import get_settings
+from auth_backend.utils.metrics import get_metrics
+
+
+class FakeProducer:
+    def __init__(self, conf):
+        self.topics = {"user-login": None}
+        self.metadata_calls = 0
+        self.ready = threading.Event()
+        self.produced = []
+        self.queue_full = False
+        self.polls = 0
+        self.callbacks = []
+
+    def list_topics(self, timeout=None):
+        self.ready.wait(5)
+        self.metadata_calls += 1
+        return SimpleNamespace(topics=self.topics)
+
+    def produce(self, topic, key, value, callback=None):
+        if self.queue_full:
+            raise BufferError()
+        self.produced.append(topic)
+        if callback:
+            self.callbacks.append(callback)
+
+    def poll(self, timeout):
+        self.polls += 1
+        time.sleep(timeout)
+        return 0
+
+    def flush(self, timeout=None):
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback(None, FakeMessage(0.001))
+        return 0
+
+    def __len__(self):
+        return len(self.produced)
+
+
+class FakeMessage:
+    def __init__(self, latency):
+        self._latency = latency
+
+    def topic(self):
+        return "user-login"
+
+    def partition(self):
+        return 0
+
+    def offset(self):
+        return 0
+
+    def latency(self):
+        return self._latency
+
+
+def wait_refresh():
+    for thread in threading.enumerate():
+        if thread.name == "kafka-topics":
+            thread.join(5)
+
+
+def message() -> tuple[UserLoginKey, UserLogin]:
+    return UserLoginKey.model_validate({"user_id": 1}), UserLogin.model_validate({"items": [], "source": "test"})
+
+
+def test_topic_cache_ttl():
+    calls = []
+    cache = TopicCache(lambda: calls.append(1) or {"a"}, ttl=60)
+    with patch("auth_backend.kafka.kafka.time.monotonic", return_value=100):
+        cache.refresh()
+        assert cache.get() == {"a"}
+    with patch("auth_backend.kafka.kafka.time.monotonic", return_value=159):
+        assert cache.get() == {"a"}
+    assert len(calls) == 1
+
+
+def test_produce_without_metadata_roundtrip():
+    with patch("auth_backend.kafka.kafka.Producer", FakeProducer):
+        kafka = Kafka()
+    producer: FakeProducer = kafka._producer
+    # Пока метаданные не получены, сообщения ждут в очереди, а produce не блокируется
+    kafka.produce("user-login", *message())
+    assert producer.produced == []
+    producer.ready.set()
+    wait_refresh()
+    assert producer.produced == ["user-login"]
+
+    skipped = get_metrics().get("kafka_messages_skipped_total")
+    for _ in range(10):
+        kafka.produce("user-login", *message())
+    kafka.produce("unknown", *message())
+    assert producer.produced == ["user-login"] * 11
+    assert producer.metadata_calls == 1
+    assert get_metrics().get("kafka_messages_skipped_total") == skipped + 1
+    kafka.close()
+
+
+def test_poll_thread_and_backpressure():
+    with patch("auth_backend.kafka.kafka.Producer", FakeProducer):
+        kafka = Kafka()
+    producer: FakeProducer = kafka._producer
+    producer.ready.set()
+    wait_refresh()
+    # Колбэки вызываются без входящих сообщений
+    polls = producer.polls
+    time.sleep(0.3)
+    assert producer.polls > polls
+
+    failed = get_metrics().get("kafka_messages_failed_total")
+    producer.queue_full = True
+    settings = get_settings()
+    with patch.object(settings, "KAFKA_QUEUE_FULL_TIMEOUT_SECONDS", 0.2):
+        start = time.monotonic()
+        kafka.produce("user-login", *message())
+        assert time.monotonic() - start >= 0.2
+    assert producer.produced == []
+    assert get_metrics().get("kafka_messages_failed_total") == failed + 1
+    kafka.close()
+    assert not kafka._poller.is_alive()
+
+
+def test_delivery_metrics():
+    metrics = get_metrics()
+    delivered, count = metrics.get("kafka_messages_delivered_total"), metrics.get(
+        "kafka_delivery_latency_seconds_count"
+    )
+    fast = metrics.get('kafka_delivery_latency_seconds_bucket{le="0.01"}')
+    Kafka.delivery_callback(None, None, FakeMessage(0.003))
+    Kafka.delivery_callback(None, None, FakeMessage(0.7))
+    assert metrics.get("kafka_messages_delivered_total") == delivered + 2
+    assert metrics.get("kafka_delivery_latency_seconds_count") == count + 2
+    assert metrics.get('kafka_delivery_latency_seconds_bucket{le="0.01"}') == fast + 1
+
+
+def test_produce_batch():
+    with patch("auth_backend.kafka.kafka.Producer", FakeProducer):
+        kafka = Kafka()
+    producer: FakeProducer = kafka._producer
+    producer.ready.set()
+    wait_refresh()
+    delivered = kafka.produce_batch([("user-login", "1", "{}"), ("unknown", "2", "{}"), ("user-login", "3", "{}")], 1)
+    # Сообщения в несуществующий топик не отправляются, но и не держат очередь
+    assert delivered == [True, True, True]
+    assert producer.produced == ["user-login", "user-login"]
+    producer.queue_full = True
+    assert kafka.produce_batch([("user-login", "4", "{}")], 1) == [False]
+    kafka.close()
@@ -0,0 +1,73 @@
+import json
+import os
+from pathlib import Path
+from urllib.request import urlopen
+
+from fastapi.testclient import TestClient
+
+from auth_backend.routes.base import app
+from auth_backend.utils.metrics import Metrics, get_metrics, render_directory, start_metrics_server
+
+
+def test_render():
+    metrics = Metrics()
+    metrics.inc("kafka_messages_delivered_total", 2)
+    metrics.set("kafka_queue_messages", 5)
+    metrics.observe("kafka_delivery_latency_seconds", 0.3, (0.1, 0.5))
+    assert metrics.render() == (
+        "# TYPE kafka_delivery_latency_seconds histogram\n"
+        'kafka_delivery_latency_seconds_bucket{le="0.1"} 0\n'
+        'kafka_delivery_latency_seconds_bucket{le="0.5"} 1\n'
+        'kafka_delivery_latency_seconds_bucket{le="+Inf"} 1\n'
+        "kafka_delivery_latency_seconds_sum 0.3\n"
+        "kafka_delivery_latency_seconds_count 1\n"
+        "# TYPE kafka_messages_delivered_total counter\n"
+        "kafka_messages_delivered_total 2\n"
+        "# TYPE kafka_queue_messages gauge\n"
+        "kafka_queue_messages 5\n"
+    )
+
+
+def test_no_public_route():
+    assert TestClient(app).get("/metrics").status_code == 404
+
+
+def test_render_directory(tmp_path: Path):
+    metrics = Metrics()
+    metrics.inc("user_update_failed_total")
+    metrics.observe("user_update_propagation_seconds", 0.3, (0.5,))
+    metrics.dump(tmp_path)
+    # Файл завершившегося процесса не отдается и удаляется
+    dead = tmp_path / "999999999.json"
+    dead.write_text(json.dumps({"families": {}, "values": {}}))
+    pid = os.getpid()
+    assert render_directory(tmp_path) == (
+        "# TYPE user_update_failed_total counter\n"
+        f'user_update_failed_total{{pid="{pid}"}} 1\n'
+        "# TYPE user_update_propagation_seconds histogram\n"
+        f'user_update_propagation_seconds_bucket{{pid="{pid}",le="0.5"}} 1\n'
+        f'user_update_propagation_seconds_bucket{{pid="{pid}",le="+Inf"}} 1\n'
+        f'user_update_propagation_seconds_sum{{pid="{pid}"}} 0.3\n'
+        f'user_update_propagation_seconds_count{{pid="{pid}"}} 1\n'
+    )
+    assert not dead.exists()
+
+
+def test_metrics_server():
+    get_metrics().inc("test_worker_batches_total")
+    server = start_metrics_server(0, "127.0.0.1")
+    try:
+        with urlopen(f"http://127.0.0.1:{server.server_port}/metrics") as response:
+            assert "test_worker_batches_total 1" in response.read().decode()
+    finally:
+        server.shutdown()
+
+
+def test_metrics_server_directory(tmp_path: Path):
+    get_metrics().inc("test_app_requests_total")
+    server = start_metrics_server(0, "127.0.0.1", directory=tmp_path)
+    try:
+        with urlopen(f"http://127.0.0.1:{server.server_port}/metrics") as response:
+            assert f'test_app_requests_total{{pid="{os.getpid()}"}} 1' in response.read().decode()
+    finally:
+        server.shutdown()
@@ -0,0 +1,92 @@
+import jwt
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from auth_backend.exceptions import OauthAuthFailed
+from auth_backend.utils.http import get_http_clients
+from auth_backend.utils.oidc_keys import OidcProvider, cache_ttl
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+def make_key(kid: str):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+    return private_key, {**jwk, "kid": kid, "use": "sig", "alg": "RS256"}
+
+
+@pytest_asyncio.fixture
+async def provider():
+    state = {"keys": [], "jwks_calls": 0, "configuration": {"id_token_signing_alg_values_supported": ["RS256"]}}
+
+    async def configuration(request: web.Request):
+        return web.json_response({"jwks_uri": str(request.url.with_path("/jwks")), **state["configuration"]})
+
+    async def jwks(request: web.Request):
+        state["jwks_calls"] += 1
+        return web.json_response({"keys": state["keys"]}, headers={"Cache-Control": "public, max-age=300"})
+
+    app = web.Application()
+    app.router.add_get("/.well-known/openid-configuration", configuration)
+    app.router.add_get("/jwks", jwks)
+    async with TestServer(app) as server:
+        provider = OidcProvider(
+            "test", str(server.make_url("/.well-known/openid-configuration")), ttl=60, min_refresh_interval=60
+        )
+        provider.state = state
+        yield provider
+    await get_http_clients().close()
+
+
+def test_cache_ttl():
+    assert cache_ttl({"Cache-Control": "public, max-age=120"}, 60) == 120
+    assert cache_ttl({"Cache-Control": "no-cache"}, 60) == 0
+    assert cache_ttl({}, 60) == 60
+
+
+@pytest.mark.asyncio
+async def test_decode_by_kid(provider: OidcProvider):
+    old_key, old_jwk = make_key("old")
+    new_key, new_jwk = make_key("new")
+    provider.state["keys"] = [old_jwk, new_jwk]
+    token = jwt.encode({"sub": "1", "aud": "client"}, new_key, "RS256", headers={"kid": "new"})
+    assert (await provider.decode(token, audience="client"))["sub"] == "1"
+    token = jwt.encode({"sub": "2", "aud": "client"}, old_key, "RS256", headers={"kid": "old"})
+    assert (await provider.decode(token, audience="client"))["sub"] == "2"
+    assert provider.state["jwks_calls"] == 1
+
+
+@pytest.mark.asyncio
+async def test_unknown_kid_refresh_limited(provider: OidcProvider):
+    old_key, old_jwk = make_key("old")
+    provider.state["keys"] = [old_jwk]
+    await provider.signing_key("old")
+
+    # Провайдер сменил ключи, первый же токен с новым kid подтягивает их
+    provider._keys_fetched_at -= 60
+    new_key, new_jwk = make_key("new")
+    provider.state["keys"] = [new_jwk]
+    token = jwt.encode({"sub": "1", "aud": "client"}, new_key, "RS256", headers={"kid": "new"})
+    assert (await provider.decode(token, audience="client"))["sub"] == "1"
+    assert provider.state["jwks_calls"] == 2
+
+    # Повторные промахи не ходят к провайдеру до истечения min_refresh_interval
+    for _ in range(3):
+        with pytest.raises(jwt.InvalidTokenError):
+            await provider.signing_key("unknown")
+    assert provider.state["jwks_calls"] == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("configuration", [{"jwks_uri": None}, {}])
+async def test_invalid_configuration(provider: OidcProvider, configuration: dict):
+    key, jwk = make_key("key")
+    provider.state["keys"] = [jwk]
+    provider.state["configuration"] = configuration
+    token = jwt.encode({"sub": "1", "aud": "client"}, key, "RS256", headers={"kid": "key"})
+    with pytest.raises(OauthAuthFailed) as exc:
+        await provider.decode(token, audience="client")
+    assert exc.value.status_code == 500
@@ -0,0 +1,78 @@
+import asyncio
+import hashlib
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from auth_backend.cli.password import calibrate
+from auth_backend.utils import password
+from auth_backend.utils.password import (
+    Pbkdf2Sha256Hasher,
+    ScryptHasher,
+    hash_password,
+    hash_password_async,
+    identify_hasher,
+    needs_rehash,
+    validate_password,
+    validate_password_async,
+)
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+@pytest.mark.asyncio
+async def test_async_matches_sync():
+    hashed = await hash_password_async("password", "salt")
+    assert hashed == hash_password("password", "salt")
+    assert await validate_password_async("password", hashed, "salt")
+    assert not await validate_password_async("other", hashed, "salt")
+
+
+@pytest.mark.asyncio
+async def test_hashing_off_event_loop():
+    loop_thread = threading.get_ident()
+    threads = set()
+
+    def record(password: str, salt: str) -> str:
+        threads.add(threading.get_ident())
+        return "hash"
+
+    with patch.object(password, "hash_password", record):
+        await asyncio.gather(*(hash_password_async("password", "salt") for _ in range(20)))
+    assert loop_thread not in threads
+    assert len(threads) <= password.get_password_executor()._max_workers
+
+
+def test_legacy_hash():
+    legacy = hashlib.pbkdf2_hmac("sha256", b"password", b"salt", 100_000).hex()
+    assert validate_password("password", legacy, "salt")
+    assert not validate_password("other", legacy, "salt")
+    assert needs_rehash(legacy)
+
+
+def test_encoded_hash():
+    hashed = hash_password("password", "salt")
+    assert hashed.startswith("pbkdf2_sha256$iterations=")
+    assert validate_password("password", hashed, "salt")
+    assert not needs_rehash(hashed)
+
+
+def test_rehash_on_cost_change():
+    hashed = Pbkdf2Sha256Hasher(iterations=1_000).encode("password", "salt")
+    assert validate_password("password", hashed, "salt")
+    assert needs_rehash(hashed)
+    scrypt = ScryptHasher(n=2**10, r=8, p=1)
+    hashed = scrypt.encode("password", "salt")
+    assert identify_hasher(hashed)[0] == scrypt
+    assert validate_password("password", hashed, "salt")
+    assert needs_rehash(hashed)
+
+
+def test_calibrate():
+    hasher = calibrate("pbkdf2_sha256", 5)
+    assert isinstance(hasher, Pbkdf2Sha256Hasher)
+    assert hasher.iterations >= 1_000
+    hasher = calibrate("scrypt", 5)
+    assert isinstance(hasher, ScryptHasher)
+    assert hasher.n >= 2**10
@@ -0,0 +1,51 @@
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from sqlalchemy.dialects.postgresql.asyncpg import dialect
+
+from auth_backend.auth_plugins.postgres import PostgresOuterAuth
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+@pytest.fixture
+def conn():
+    conn = MagicMock(dialect=dialect(), exec_driver_sql=AsyncMock(), scalar=AsyncMock(return_value=1))
+
+    @asynccontextmanager
+    async def connection():
+        yield conn
+
+    with patch.object(PostgresOuterAuth, "_connection", connection):
+        yield conn
+
+
+@pytest.mark.asyncio
+async def test_update_password_escaped(conn: MagicMock):
+    await PostgresOuterAuth._update_outer_user_password("test_user", "it's :secret")
+    conn.exec_driver_sql.assert_awaited_once_with("ALTER USER test_user WITH PASSWORD 'it''s :secret'")
+
+
+@pytest.mark.asyncio
+async def test_update_password_invalid_username(conn: MagicMock):
+    await PostgresOuterAuth._update_outer_user_password("test_user; DROP TABLE user", "password")
+    conn.exec_driver_sql.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_update_password_error(conn: MagicMock):
+    # Ошибку увидит очередь обновлений и повторит попытку
+    conn.exec_driver_sql.side_effect = ConnectionRefusedError
+    with pytest.raises(ConnectionRefusedError):
+        await PostgresOuterAuth._update_outer_user_password("test_user", "password")
+
+
+@pytest.mark.asyncio
+async def test_engine_lazy():
+    engine = PostgresOuterAuth._engine()
+    assert PostgresOuterAuth._engine() is engine
+    assert engine.pool.size() == PostgresOuterAuth.settings.POSTGRES_AUTH_POOL_SIZE
+    await PostgresOuterAuth.dispose()
+    assert PostgresOuterAuth._engine() is not engine
+    await PostgresOuterAuth.dispose()
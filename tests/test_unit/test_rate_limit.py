@@ -0,0 +1,59 @@
+from unittest.mock import patch
+
+import pytest
+
+from auth_backend.exceptions import TooManyRequests
+from auth_backend.utils import rate_limit
+from auth_backend.utils.rate_limit import MemoryRateLimitBackend, PostgresRateLimitBackend, RateLimit, RateLimiter
+
+
+def test_limit_per_key():
+    limiter = RateLimiter(MemoryRateLimitBackend(), RateLimit("ip", 3, 60))
+    for _ in range(3):
+        limiter.hit(ip="1.1.1.1", now=0)
+    with pytest.raises(TooManyRequests) as exc:
+        limiter.hit(ip="1.1.1.1", now=1)
+    assert exc.value.delay_time.total_seconds() == pytest.approx(59 + 20)
+    limiter.hit(ip="2.2.2.2", now=1)
+    # Ключи без значения не ограничиваются
+    limiter.hit(email="user@example.com", now=1)
+
+
+def test_sliding_window():
+    limiter = RateLimiter(MemoryRateLimitBackend(), RateLimit("ip", 2, 60))
+    limiter.hit(ip="ip", now=50)
+    limiter.hit(ip="ip", now=55)
+    # Предыдущее окно еще почти целиком учитывается
+    with pytest.raises(TooManyRequests) as exc:
+        limiter.hit(ip="ip", now=65)
+    assert exc.value.delay_time.total_seconds() == pytest.approx(25)
+    # Половина предыдущего окна: 1 + 2 * 0.5 = 2
+    limiter.hit(ip="ip", now=90)
+    with pytest.raises(TooManyRequests):
+        limiter.hit(ip="ip", now=91)
+    # Через два окна старые запросы забыты
+    limiter.hit(ip="ip", now=181)
+    limiter.hit(ip="ip", now=182)
+
+
+def test_rejected_not_counted():
+    backend = MemoryRateLimitBackend()
+    limiter = RateLimiter(backend, RateLimit("ip", 5, 60), RateLimit("email", 1, 60))
+    limiter.hit(ip="ip", email="a@example.com", now=0)
+    for _ in range(3):
+        with pytest.raises(TooManyRequests):
+            limiter.hit(ip="ip", email="a@example.com", now=1)
+    assert backend.hit("ip:ip", 0, 60) == (2, 0)
+
+
+def test_postgres_purge_sampled():
+    backend = PostgresRateLimitBackend()
+    with patch.object(rate_limit, "RateLimitWindow") as windows, patch.object(rate_limit, "random") as rand:
+        windows.hit.return_value = (1, 0)
+        rand.randrange.return_value = 1
+        backend.hit("ip:ip", 0, 60, session=None)
+        windows.cleanup.assert_not_called()
+        rand.randrange.return_value = 0
+        backend.hit("ip:ip", 0, 60, session=None)
+        windows.cleanup.assert_called_once_with(session=None, limit=backend.PURGE_BATCH)
+    assert windows.hit.call_count == 2
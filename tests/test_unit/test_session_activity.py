@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import OperationalError
+
+from auth_backend.utils.session_activity import LastActivityBuffer
+
+
+def test_touch_keeps_latest():
+    buffer = LastActivityBuffer()
+    now = datetime.utcnow()
+    buffer.touch(1, now)
+    buffer.touch(1, now - timedelta(seconds=5))
+    buffer.touch(2, now)
+    assert buffer.get(1) == now
+    assert buffer.drain() == {1: now, 2: now}
+    assert buffer.get(1) is None
+
+
+def test_flush_single_statement():
+    buffer = LastActivityBuffer()
+    buffer.touch(1)
+    buffer.touch(2)
+    db_session = MagicMock()
+    assert buffer.flush(db_session) == 2
+    db_session.execute.assert_called_once()
+    db_session.commit.assert_called_once()
+    sql = str(db_session.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+    assert sql.startswith("UPDATE user_session SET last_activity=activity.last_activity FROM (VALUES")
+    assert buffer.flush(db_session) == 0
+
+
+def test_flush_failed_restores_pending():
+    buffer = LastActivityBuffer()
+    now = datetime.utcnow()
+    buffer.touch(1, now)
+    db_session = MagicMock()
+    db_session.execute.side_effect = OperationalError("UPDATE", {}, Exception())
+    with pytest.raises(OperationalError):
+        buffer.flush(db_session)
+    db_session.rollback.assert_called_once()
+    assert buffer.get(1) == now
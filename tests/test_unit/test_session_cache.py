@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from auth_backend.utils.session_cache import CachedSession, SessionCache
+
+
+def cached_session(session_id: int = 1, user_id: int = 1, expires: datetime | None = None) -> CachedSession:
+    return CachedSession(
+        session_id=session_id,
+        user_id=user_id,
+        expires=expires or datetime.utcnow() + timedelta(days=1),
+        scope_names=frozenset({"auth.user.read"}),
+    )
+
+
+def test_get_put():
+    cache = SessionCache(10, 60)
+    entry = cached_session()
+    cache.put("token", entry)
+    assert cache.get("token") == entry
+    assert cache.get("other") is None
+
+
+def test_lru_eviction():
+    cache = SessionCache(2, 60)
+    cache.put("a", cached_session(1))
+    cache.put("b", cached_session(2))
+    cache.get("a")
+    cache.put("c", cached_session(3))
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+
+
+def test_ttl():
+    cache = SessionCache(10, 5)
+    with patch("auth_backend.utils.session_cache.time.monotonic", return_value=100):
+        cache.put("token", cached_session())
+    with patch("auth_backend.utils.session_cache.time.monotonic", return_value=104):
+        assert cache.get("token") is not None
+    with patch("auth_backend.utils.session_cache.time.monotonic", return_value=106):
+        assert cache.get("token") is None
+    assert len(cache) == 0
+
+
+def test_session_expired():
+    cache = SessionCache(10, 60)
+    cache.put("token", cached_session(expires=datetime.utcnow() - timedelta(seconds=1)))
+    assert cache.get("token") is None
+
+
+def test_invalidate():
+    cache = SessionCache(10, 60)
+    cache.put("a", cached_session(session_id=1, user_id=1))
+    cache.put("b", cached_session(session_id=2, user_id=1))
+    cache.put("c", cached_session(session_id=3, user_id=2))
+    cache.put("d", cached_session(session_id=4, user_id=3))
+    cache.invalidate_token("a")
+    assert cache.get("a") is None
+    cache.invalidate_user(1)
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+    cache.invalidate_session(3)
+    assert cache.get("c") is None
+    cache.clear()
+    assert cache.get("d") is None
+
+
+def test_disabled():
+    cache = SessionCache(10, 0)
+    cache.put("token", cached_session())
+    assert cache.get("token") is None
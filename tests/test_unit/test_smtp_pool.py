@@ -0,0 +1,108 @@
+import smtplib
+import socket
+
+import pytest
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+from auth_backend.utils.smtp_pool import SMTPConnectionPool
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        # Сессия aiosmtpd живет столько же, сколько TCP-соединение
+        self.messages.append((id(session), envelope.rcpt_tos))
+        return "250 OK"
+
+    @property
+    def connections(self):
+        return len({session for session, _ in self.messages})
+
+
+def authenticator(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=auth_data.login == b"user" and auth_data.password == b"pass", handled=False)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    handler = RecordingHandler()
+    controller = Controller(
+        handler, hostname="127.0.0.1", port=free_port(), authenticator=authenticator, auth_require_tls=False
+    )
+    controller.start()
+    yield controller, handler
+    controller.stop()
+
+
+@pytest.fixture
+def pool(smtp_server):
+    controller, _ = smtp_server
+    pool = SMTPConnectionPool(controller.hostname, controller.port, "user", "pass", starttls=False, size=2)
+    yield pool
+    pool.close()
+
+
+def test_reuse_connection(pool, smtp_server):
+    _, handler = smtp_server
+    for i in range(5):
+        pool.sendmail("from@example.com", f"to{i}@example.com", "Subject: test\n\nbody")
+    assert len(handler.messages) == 5
+    assert handler.connections == 1
+    assert len(pool) == 1
+
+
+def test_max_messages(pool, smtp_server):
+    _, handler = smtp_server
+    pool.max_messages = 2
+    for i in range(5):
+        pool.sendmail("from@example.com", f"to{i}@example.com", "Subject: test\n\nbody")
+    assert len(handler.messages) == 5
+    assert handler.connections == 3
+
+
+def test_noop_detects_dead_connection(pool, smtp_server):
+    _, handler = smtp_server
+    pool.sendmail("from@example.com", "to@example.com", "Subject: test\n\nbody")
+    pool._idle[0].smtp.sock.shutdown(socket.SHUT_RDWR)
+    pool.sendmail("from@example.com", "to@example.com", "Subject: test\n\nbody")
+    assert len(handler.messages) == 2
+    assert handler.connections == 2
+    assert len(pool) == 1
+
+
+def test_idle_timeout(pool, smtp_server):
+    _, handler = smtp_server
+    pool.idle_timeout = 0
+    pool.sendmail("from@example.com", "to@example.com", "Subject: test\n\nbody")
+    pool.sendmail("from@example.com", "to@example.com", "Subject: test\n\nbody")
+    assert handler.connections == 2
+
+
+def test_reconnect_on_disconnect(pool, smtp_server, monkeypatch):
+    _, handler = smtp_server
+    pool.sendmail("from@example.com", "to@example.com", "Subject: test\n\nbody")
+
+    def disconnected(*args, **kwargs):
+        raise smtplib.SMTPServerDisconnected()
+
+    monkeypatch.setattr(pool._idle[0].smtp, "sendmail", disconnected)
+    pool.sendmail("from@example.com", "to@example.com", "Subject: test\n\nbody")
+    assert len(handler.messages) == 2
+    assert handler.connections == 2
+
+
+def test_wrong_credentials(smtp_server):
+    controller, _ = smtp_server
+    pool = SMTPConnectionPool(controller.hostname, controller.port, "user", "wrong", starttls=False)
+    with pytest.raises(smtplib.SMTPAuthenticationError):
+        pool.sendmail("from@example.com", "to@example.com", "Subject: test\n\nbody")
+    assert len(pool) == 0
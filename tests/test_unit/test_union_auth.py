@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi import HTTPException
+
+from auth_backend.utils.jwt import generate_jwt
+from auth_backend.utils.security import UnionAuth, settings
+from auth_backend.utils.session_cache import CachedSession, SessionCache
+
+
+@pytest.fixture
+def stateless_mode():
+    enabled_patch = patch.object(settings, "JWT_ENABLED", True)
+    stateless_patch = patch.object(settings, "JWT_STATELESS_AUTH", True)
+    db_patch = patch("auth_backend.utils.security.db")
+    enabled_patch.start()
+    stateless_patch.start()
+    db_mock = db_patch.start()
+    db_mock.session.merge.side_effect = lambda obj, load: obj
+    yield db_mock
+    db_patch.stop()
+    stateless_patch.stop()
+    enabled_patch.stop()
+
+
+def request_with_token(token: str) -> MagicMock:
+    request = MagicMock()
+    request.headers = {"Authorization": token}
+    return request
+
+
+@pytest.mark.asyncio
+async def test_stateless_session(stateless_mode: MagicMock):
+    iat = datetime.utcnow()
+    token = generate_jwt(1, iat, iat + timedelta(days=1), session_id=2, scopes=["auth.user.read"])
+    user_session = await UnionAuth(scopes=["auth.user.read"], auto_error=True, stateless=True)(
+        request_with_token(token)
+    )
+    assert user_session.id == 2
+    assert user_session.user_id == 1
+    assert user_session.token == token
+    stateless_mode.session.query.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_stateless_missing_scope(stateless_mode: MagicMock):
+    iat = datetime.utcnow()
+    token = generate_jwt(1, iat, iat + timedelta(days=1), session_id=2, scopes=["auth.user.read"])
+    with pytest.raises(HTTPException):
+        await UnionAuth(scopes=["auth.user.delete"], auto_error=True, stateless=True)(request_with_token(token))
+
+
+@pytest.mark.asyncio
+async def test_stateless_expired(stateless_mode: MagicMock):
+    iat = datetime.utcnow() - timedelta(days=2)
+    token = generate_jwt(1, iat, iat + timedelta(days=1), session_id=2, scopes=["auth.user.read"])
+    with pytest.raises(HTTPException):
+        await UnionAuth(scopes=[], auto_error=True, stateless=True)(request_with_token(token))
+
+
+@pytest.mark.asyncio
+async def test_cached_session(stateless_mode: MagicMock):
+    cache = SessionCache(10, 60)
+    cache.put(
+        "token",
+        CachedSession(
+            session_id=2, user_id=1, expires=datetime.utcnow() + timedelta(days=1), scope_names=frozenset({"a.b"})
+        ),
+    )
+    db_session = AsyncMock()
+    with patch("auth_backend.utils.security.get_session_cache", return_value=cache):
+        user_session = await UnionAuth(scopes=["a.b"], auto_error=True)(request_with_token("token"), db_session)
+        assert user_session.id == 2
+        assert user_session.user_id == 1
+        with pytest.raises(HTTPException):
+            await UnionAuth(scopes=["a.c"], auto_error=True)(request_with_token("token"), db_session)
+    assert db_session.mock_calls == []
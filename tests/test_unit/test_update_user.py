@@ -1,5 +1,5 @@
 from typing import TYPE_CHECKING
-from unittest.mock import Mock, patch
+from unittest.mock import Mock, patch, sentinel
 
 import pytest
 
@@ -17,11 +17,14 @@ async def test_user_updated():
         patches[auth_method] = patch.object(cls, "on_user_update")
         mocks[auth_method] = patches[auth_method].start()
 
-    await AuthPluginMeta.user_updated({"user_id": 123})
+    # Событие ставится в очередь в транзакции запроса, методы вызываются после ее коммита
+    with patch("auth_backend.auth_method.base.schedule_user_update") as schedule:
+        await AuthPluginMeta.user_updated({"user_id": 123}, session=sentinel.session)
 
+    session, methods, new_user, old_user = schedule.call_args.args
+    assert session is sentinel.session
+    assert (new_user, old_user) == ({"user_id": 123}, None)
+    assert methods == list(AuthPluginMeta.active_auth_methods())
     for auth_method in patches:
-        if AUTH_METHODS[auth_method].is_active():
-            mocks[auth_method].assert_called_once()
-        else:
-            mocks[auth_method].assert_not_called()
+        mocks[auth_method].assert_not_called()
         patches[auth_method].stop()
@@ -0,0 +1,114 @@
+import asyncio
+import time
+from datetime import datetime
+from unittest.mock import ANY, AsyncMock, MagicMock, patch
+
+import pytest
+
+from auth_backend.auth_method import user_update
+from auth_backend.auth_method.user_update import (
+    DELIVERIES_KEY,
+    _deliver,
+    _deliver_after_commit,
+    _drop_deliveries,
+    dump_payload,
+    load_payload,
+    merge_user_update,
+    wait_user_updates,
+)
+from auth_backend.models.db import UserUpdateQueue
+from auth_backend.settings import get_settings
+
+
+class Slow:
+    @classmethod
+    def get_name(cls):
+        return "slow"
+
+    @classmethod
+    async def on_user_update(cls, new_user, old_user=None):
+        await asyncio.sleep(10)
+
+
+class Fast:
+    calls = 0
+
+    @classmethod
+    def get_name(cls):
+        return "fast"
+
+    @classmethod
+    async def on_user_update(cls, new_user, old_user=None):
+        cls.calls += 1
+
+
+def queued(auth_method: str) -> UserUpdateQueue:
+    return UserUpdateQueue(
+        id=1,
+        user_id=1,
+        auth_method=auth_method,
+        payload=dump_payload({"user_id": 1, "email": {"password": "new"}}, {"user_id": 1}),
+        attempts=0,
+        version=0,
+        create_ts=datetime.utcnow(),
+    )
+
+
+@pytest.fixture
+def record():
+    with (
+        patch.object(user_update, "db"),
+        patch.object(user_update, "_record_results") as record,
+        patch.object(get_settings(), "USER_UPDATE_TIMEOUT_SECONDS", 0.1),
+    ):
+        Fast.calls = 0
+        yield record
+
+
+def test_payload_roundtrip():
+    new_user = {"user_id": 1, "email": {"password": "secret"}}
+    payload = dump_payload(new_user, {"user_id": 1})
+    assert "secret" not in payload
+    assert load_payload(payload) == (new_user, {"user_id": 1})
+
+
+def test_merge_keeps_password():
+    pending = {"user_id": 1, "email": {"password": "new", "hashed_password": "hash"}}
+    merged = merge_user_update(pending, {"user_id": 1, "github": {"user_id": "123"}, "email": {"confirmed": "true"}})
+    assert merged == {
+        "user_id": 1,
+        "email": {"password": "new", "hashed_password": "hash", "confirmed": "true"},
+        "github": {"user_id": "123"},
+    }
+    assert merge_user_update(merged, {"user_id": 1, "email": {"password": "newer"}})["email"]["password"] == "newer"
+    assert merge_user_update(pending, None) is None
+
+
+@pytest.mark.asyncio
+async def test_slow_method_queued(record: MagicMock):
+    start = time.monotonic()
+    await _deliver([(queued("slow"), Slow), (queued("fast"), Fast)])
+    assert time.monotonic() - start < 1
+    assert Fast.calls == 1
+    rows, results = record.call_args.args
+    assert [row.auth_method for row in rows] == ["slow", "fast"]
+    assert isinstance(results[0], asyncio.TimeoutError)
+    assert results[1] is None
+
+
+@pytest.mark.asyncio
+async def test_deliver_after_commit():
+    session = MagicMock(info={DELIVERIES_KEY: [(queued("fast"), Fast)]})
+    with patch.object(user_update, "_deliver", AsyncMock()) as deliver:
+        _deliver_after_commit(session)
+        await wait_user_updates()
+    deliver.assert_awaited_once_with([(ANY, Fast)])
+    assert DELIVERIES_KEY not in session.info
+
+
+def test_rollback_drops_deliveries():
+    session = MagicMock(info={DELIVERIES_KEY: [(queued("fast"), Fast)]})
+    with patch.object(user_update, "_deliver", AsyncMock()) as deliver:
+        _drop_deliveries(session)
+        _deliver_after_commit(session)
+    deliver.assert_not_called()